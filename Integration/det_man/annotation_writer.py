@@ -0,0 +1,187 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# 標註圖片輸出模式
+ANNOTATION_MODES = ('off', 'dangerous', 'thumbnail', 'full')
+
+# 各類別的框線顏色
+_PALETTE = [
+    (255, 56, 56), (255, 157, 151), (255, 112, 31), (255, 178, 29), (207, 210, 49),
+    (72, 249, 10), (146, 204, 23), (61, 219, 134), (26, 147, 52), (0, 212, 187),
+]
+
+
+class AnnotationWriter:
+    def __init__(self, save_dir, mode='full', jpeg_quality=85, max_size=0, thumbnail_size=320, workers=2,
+                 retention=None, max_pending=None):
+        """
+        初始化標註圖片輸出器，在背景執行緒中繪製並編碼標註圖片
+
+        參數:
+            save_dir (str): 標註圖片保存目錄
+            mode (str): 輸出模式 - 'off' 不輸出、'dangerous' 只輸出危險事件、
+                'thumbnail' 全部輸出縮圖、'full' 全部輸出原尺寸
+            jpeg_quality (int): JPEG 壓縮品質 (1-95)
+            max_size (int): 輸出圖片最長邊的上限，0 表示不限制
+            thumbnail_size (int): 縮圖模式下圖片最長邊的長度
+            workers (int): 背景輸出執行緒數量
+            retention (RetentionManager, optional): 保留管理，每寫入一張圖片就通知它刪除過期或超出大小的圖片
+            max_pending (int, optional): 尚未寫出的標註圖片上限，預設為 workers 的 4 倍；
+                達到上限時 submit() 會等待或略過，編碼跟不上時記憶體不會無限增加
+        """
+        if mode not in ANNOTATION_MODES:
+            raise ValueError(f"不支援的標註輸出模式: {mode}，可用模式: {', '.join(ANNOTATION_MODES)}")
+        self.save_dir = save_dir
+        self.mode = mode
+        self.jpeg_quality = jpeg_quality
+        self.max_size = max_size
+        self.thumbnail_size = thumbnail_size
+        self.workers = max(1, workers)
+        self.retention = retention
+        self.max_pending = max_pending or self.workers * 4
+
+        self.written = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def should_write(self, safety_status):
+        """
+        判斷此圖片是否需要輸出標註圖片，不需要的圖片完全不會被繪製
+
+        參數:
+            safety_status (dict): 安全狀態
+        """
+        if self.mode == 'off':
+            return False
+        if self.mode == 'dangerous':
+            return safety_status.get('event_type') == '危險'
+        return True
+
+    def _output_limit(self):
+        if self.mode == 'thumbnail':
+            return self.thumbnail_size
+        return self.max_size
+
+    def render(self, image, detections):
+        """
+        在圖片上繪製檢測框；會先縮小圖片再繪製，避免在原尺寸上做多餘的運算
+
+        參數:
+            image (PIL.Image 或 np.ndarray): 原始圖片（RGB）
+            detections (DetectionRecord): 檢測結果
+
+        回傳:
+            PIL.Image: 繪製完成的圖片
+        """
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+
+        limit = self._output_limit()
+        scale = 1.0
+        if limit and max(image.size) > limit:
+            scale = limit / max(image.size)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            canvas = image.convert('RGB').resize(size, Image.BILINEAR)
+        else:
+            canvas = image.convert('RGB')
+
+        draw = ImageDraw.Draw(canvas)
+        line_width = max(1, round(max(canvas.size) / 400))
+        for box, confidence, class_id in zip(detections.boxes * scale, detections.confidences, detections.class_ids):
+            color = _PALETTE[int(class_id) % len(_PALETTE)]
+            name = detections.names[class_id] if class_id < len(detections.names) else str(class_id)
+            x1, y1, x2, y2 = (float(v) for v in box)
+            draw.rectangle((x1, y1, x2, y2), outline=color, width=line_width)
+            draw.text((x1 + line_width, max(0.0, y1 - 12)), f"{name} {confidence:.2f}", fill=color)
+        return canvas
+
+    def write(self, image, detections, safety_status):
+        """
+        同步繪製並保存一張標註圖片
+
+        參數:
+            image (PIL.Image 或 np.ndarray): 原始圖片
+            detections (DetectionRecord): 檢測結果
+            safety_status (dict): 安全狀態，file_name 決定輸出檔名
+
+        回傳:
+            str: 輸出檔案路徑；未輸出時為 None
+        """
+        if not self.should_write(safety_status):
+            self.count_skipped()
+            return None
+
+        try:
+            canvas = self.render(image, detections)
+            base_name = os.path.splitext(safety_status['file_name'])[0]
+            output_path = os.path.join(self.save_dir, f"{base_name}.jpg")
+            canvas.save(output_path, format='JPEG', quality=self.jpeg_quality)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+        with self._lock:
+            self.written += 1
+        if self.retention is not None:
+            self.retention.track(output_path, dangerous=safety_status.get('event_type') == '危險')
+        return output_path
+
+    def count_skipped(self, count=1):
+        """記錄由呼叫端判斷不需輸出的圖片（例如管線中不進入寫入階段的畫面）"""
+        with self._lock:
+            self.skipped += count
+
+    def _write_and_release(self, image, detections, safety_status):
+        try:
+            return self.write(image, detections, safety_status)
+        finally:
+            self._slots.release()
+
+    def submit(self, image, detections, safety_status, block=True):
+        """
+        交給背景執行緒繪製並保存標註圖片，不需要輸出的圖片直接略過
+
+        參數:
+            block (bool): 尚未寫出的圖片已達上限時是否等待；False 時直接略過此圖片並計入 dropped
+
+        回傳:
+            Future: 背景工作；未輸出時為 None
+        """
+        if not self.should_write(safety_status):
+            self.count_skipped()
+            return None
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self.skipped += 1
+                self.dropped += 1
+            return None
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='annotation')
+                executor = self._executor
+            return executor.submit(self._write_and_release, image, detections, safety_status)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def close(self, wait=True):
+        """等待背景工作完成並關閉執行緒"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def summary(self):
+        """回傳輸出統計摘要字串"""
+        return (f"標註圖片（模式: {self.mode}）: 輸出 {self.written} 張, 略過 {self.skipped} 張"
+                f"（其中佇列已滿 {self.dropped} 張）, 錯誤 {self.errors} 張")
@@ -0,0 +1,84 @@
+import argparse
+import os
+
+import numpy as np
+from PIL import Image
+
+from inference_backends import BACKENDS, box_iou, create_backend
+
+
+def match_detections(reference, candidate, iou_threshold=0.5):
+    """
+    以同類別、IoU 最高者配對兩個後端的檢測框
+
+    參數:
+        reference (DetectionRecord): 基準後端的檢測結果
+        candidate (DetectionRecord): 比對後端的檢測結果
+        iou_threshold (float): 視為同一物件的最低 IoU
+
+    回傳:
+        dict: matched、unmatched_reference、unmatched_candidate、min_iou、max_confidence_diff
+    """
+    used = np.zeros(len(candidate), dtype=bool)
+    ious = []
+    confidence_diffs = []
+    for box, confidence, class_id in zip(reference.boxes, reference.confidences, reference.class_ids):
+        available = (~used) & (candidate.class_ids == class_id)
+        if not available.any():
+            continue
+        indices = np.flatnonzero(available)
+        overlaps = box_iou(box, candidate.boxes[indices])
+        best = int(overlaps.argmax())
+        if overlaps[best] < iou_threshold:
+            continue
+        used[indices[best]] = True
+        ious.append(float(overlaps[best]))
+        confidence_diffs.append(abs(float(confidence - candidate.confidences[indices[best]])))
+
+    return {
+        'matched': len(ious),
+        'unmatched_reference': len(reference) - len(ious),
+        'unmatched_candidate': int((~used).sum()),
+        'min_iou': min(ious) if ious else None,
+        'max_confidence_diff': max(confidence_diffs) if confidence_diffs else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比對不同推論後端的檢測框是否一致")
+    parser.add_argument('images', nargs='+', help="要比對的圖片路徑")
+    parser.add_argument('--model', default='./model/best.pt', help="YOLO模型路徑")
+    parser.add_argument('--reference', default='torch-hub', choices=BACKENDS, help="作為基準的後端")
+    parser.add_argument('--backends', nargs='+', default=['torchscript', 'onnxruntime'], choices=BACKENDS,
+                        help="要與基準比對的後端")
+    parser.add_argument('--iou', type=float, default=0.9, help="判定框一致的最低 IoU")
+    parser.add_argument('--confidence-tolerance', type=float, default=0.05, help="置信度容許誤差")
+    args = parser.parse_args()
+
+    images = [Image.open(path).convert('RGB') for path in args.images]
+    reference = create_backend(args.reference, args.model).infer(images)
+
+    all_passed = True
+    for backend_name in args.backends:
+        candidate = create_backend(backend_name, args.model).infer(images)
+        print(f"\n===== {args.reference} vs {backend_name} =====")
+        for path, ref_record, cand_record in zip(args.images, reference, candidate):
+            result = match_detections(ref_record, cand_record, iou_threshold=args.iou)
+            passed = (
+                result['unmatched_reference'] == 0
+                and result['unmatched_candidate'] == 0
+                and (result['max_confidence_diff'] is None or result['max_confidence_diff'] <= args.confidence_tolerance)
+            )
+            all_passed = all_passed and passed
+            min_iou = f"{result['min_iou']:.3f}" if result['min_iou'] is not None else '-'
+            conf_diff = f"{result['max_confidence_diff']:.3f}" if result['max_confidence_diff'] is not None else '-'
+            print(f"{'✓' if passed else '✗'} {os.path.basename(path)}: 配對 {result['matched']} 個, "
+                  f"基準未配對 {result['unmatched_reference']} 個, 比對未配對 {result['unmatched_candidate']} 個, "
+                  f"最低 IoU {min_iou}, 最大置信度差 {conf_diff}")
+
+    print("\n所有後端結果一致" if all_passed else "\n部分後端結果不一致")
+    raise SystemExit(0 if all_passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from detection_record import DetectionRecord
+from file_lock import FileLock
+
+
+class DetectionCache:
+    def __init__(self, db_path='detection_cache.sqlite3', max_mb=512, touch_flush_every=256):
+        """
+        初始化磁碟上的檢測結果快取，以 (圖片內容雜湊, 模型版本, 推論參數) 對應原始檢測框
+
+        快取總大小超過上限時，依最後存取時間淘汰最久未使用的項目。總大小記錄在資料庫中，
+        多個行程（例如多行程分片檢測）共用同一個快取時也以全部行程的合計判斷是否超過上限
+
+        參數:
+            db_path (str): SQLite 資料庫路徑
+            max_mb (float): 快取內容的大小上限（MB）
+            touch_flush_every (int): 命中時的最後存取時間先累積在記憶體，累積幾筆後一次寫回
+        """
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.touch_flush_every = max(1, touch_flush_every)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # 尚未寫回的最後存取時間: cache_key -> 時間
+        self._touched = {}
+
+        # 多個執行緒共用同一個連線，由 self._lock 保護；多行程同時使用時由 SQLite 的檔案鎖協調
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        # 切換 WAL 不經過 busy handler，多個行程同時開啟新的快取時在檔案鎖內初始化
+        with FileLock(db_path + '.lock'):
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS detections (
+                    cache_key TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_detections_last_access ON detections(last_access)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY, total_bytes INTEGER NOT NULL)")
+            # 舊版快取沒有大小紀錄時由資料重新計算
+            self._conn.execute(
+                "INSERT OR IGNORE INTO cache_size (id, total_bytes) SELECT 1, COALESCE(SUM(size), 0) FROM detections"
+            )
+            self._conn.commit()
+        self._total_bytes = self._read_total()
+
+    def _read_total(self):
+        return self._conn.execute("SELECT total_bytes FROM cache_size WHERE id = 1").fetchone()[0]
+
+    @staticmethod
+    def make_key(content_hash, model_version, params):
+        """
+        組合快取鍵
+
+        參數:
+            content_hash (str): 圖片內容雜湊
+            model_version (str): 模型版本
+            params (dict): 會影響檢測結果的推論參數（後端、門檻等）
+        """
+        raw = json.dumps([content_hash, model_version, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key):
+        """
+        取得快取的檢測結果；命中時只在記憶體中記下存取時間，不會讓讀取變成寫入
+
+        回傳:
+            DetectionRecord: 快取的檢測結果；不存在時為 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM detections WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[cache_key] = time.time()
+            if len(self._touched) >= self.touch_flush_every:
+                self._flush_touched()
+                self._conn.commit()
+        return DetectionRecord.from_bytes(row[0])
+
+    def _flush_touched(self):
+        """寫回累積的最後存取時間（呼叫端負責提交）"""
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE detections SET last_access = ? WHERE cache_key = ?",
+            [(accessed, cache_key) for cache_key, accessed in self._touched.items()]
+        )
+        self._touched.clear()
+
+    def put(self, cache_key, detections):
+        """
+        寫入檢測結果，必要時淘汰最久未使用的項目
+
+        參數:
+            cache_key (str): 快取鍵
+            detections (DetectionRecord): 檢測結果
+        """
+        payload = detections.to_bytes()
+        with self._lock:
+            # 取得寫入鎖後才讀取舊的大小，與其他行程的寫入不會交錯
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_touched()
+                previous = self._conn.execute(
+                    "SELECT size FROM detections WHERE cache_key = ?", (cache_key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO detections (cache_key, payload, size, last_access) VALUES (?, ?, ?, ?)",
+                    (cache_key, payload, len(payload), time.time())
+                )
+                self._conn.execute(
+                    "UPDATE cache_size SET total_bytes = total_bytes + ? WHERE id = 1",
+                    (len(payload) - (previous[0] if previous else 0),)
+                )
+                self._total_bytes = self._read_total()
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _evict(self):
+        """由資料庫重新計算總大小，淘汰最久未使用的項目直到總大小降到上限的九成以下"""
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+        target = self.max_bytes * 0.9
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT cache_key, size FROM detections ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            removed = []
+            for cache_key, size in rows:
+                if self._total_bytes <= target:
+                    break
+                removed.append((cache_key,))
+                self._total_bytes -= size
+            self._conn.executemany("DELETE FROM detections WHERE cache_key = ?", removed)
+            self.evicted += len(removed)
+        self._conn.execute("UPDATE cache_size SET total_bytes = ? WHERE id = 1", (self._total_bytes,))
+
+    def close(self):
+        """寫回累積的存取時間並關閉資料庫連線"""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    def summary(self):
+        """回傳快取命中統計摘要字串"""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return (f"檢測結果快取: 命中 {self.hits} 次, 未命中 {self.misses} 次 ({ratio:.1f}% 命中), "
+                f"淘汰 {self.evicted} 筆, 目前大小 {self._total_bytes / 1024 / 1024:.1f} MB")
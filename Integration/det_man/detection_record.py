@@ -0,0 +1,129 @@
+import json
+import struct
+
+import numpy as np
+
+
+class DetectionRecord:
+    """單張圖片的檢測結果，以 NumPy 陣列保存，避免逐列的 Python 迴圈"""
+
+    __slots__ = ('boxes', 'confidences', 'class_ids', 'names')
+
+    def __init__(self, boxes, confidences, class_ids, names):
+        """
+        參數:
+            boxes (np.ndarray): N×4 的邊界框座標 (xmin, ymin, xmax, ymax)
+            confidences (np.ndarray): 長度 N 的置信度
+            class_ids (np.ndarray): 長度 N 的類別編號
+            names (tuple): 類別編號對應的類別名稱
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        self.names = tuple(names)
+
+    @staticmethod
+    def normalize_names(names):
+        """將模型的類別名稱（dict 或 list）轉為依編號排列的 tuple"""
+        if isinstance(names, dict):
+            size = max(names) + 1 if names else 0
+            return tuple(names.get(i, str(i)) for i in range(size))
+        return tuple(names)
+
+    @classmethod
+    def from_array(cls, pred, names):
+        """
+        由模型輸出的 N×6 陣列 (xmin, ymin, xmax, ymax, confidence, class) 建立檢測結果
+
+        參數:
+            pred: N×6 的 torch.Tensor 或 np.ndarray
+            names: 類別名稱（dict 或 list）
+        """
+        if hasattr(pred, 'detach'):
+            pred = pred.detach().cpu().numpy()
+        pred = np.asarray(pred, dtype=np.float32).reshape(-1, 6)
+        return cls(pred[:, :4], pred[:, 4], pred[:, 5].astype(np.int64), cls.normalize_names(names))
+
+    @classmethod
+    def empty(cls, names=()):
+        """建立沒有任何檢測物件的結果"""
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0), cls.normalize_names(names))
+
+    def to_bytes(self):
+        """
+        序列化為精簡的位元組：標頭長度 + JSON 標頭（類別名稱、數量）+ 各陣列的原始位元組
+        """
+        header = json.dumps({'names': self.names, 'count': len(self)}, ensure_ascii=False).encode('utf-8')
+        return b''.join([
+            struct.pack('<I', len(header)),
+            header,
+            self.boxes.tobytes(),
+            self.confidences.tobytes(),
+            self.class_ids.tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, payload):
+        """由 to_bytes() 的結果還原檢測結果"""
+        (header_size,) = struct.unpack_from('<I', payload)
+        header = json.loads(payload[4:4 + header_size].decode('utf-8'))
+        count = header['count']
+        offset = 4 + header_size
+        boxes = np.frombuffer(payload, dtype=np.float32, count=count * 4, offset=offset)
+        offset += count * 4 * 4
+        confidences = np.frombuffer(payload, dtype=np.float32, count=count, offset=offset)
+        offset += count * 4
+        class_ids = np.frombuffer(payload, dtype=np.int64, count=count, offset=offset)
+        return cls(boxes, confidences, class_ids, header['names'])
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def class_mask(self, class_name):
+        """
+        回傳屬於指定類別的布林遮罩
+
+        參數:
+            class_name (str): 類別名稱
+        """
+        if class_name not in self.names:
+            return np.zeros(len(self), dtype=bool)
+        return self.class_ids == self.names.index(class_name)
+
+    def has_class(self, class_name):
+        """是否檢測到指定類別的物件"""
+        return bool(self.class_mask(class_name).any())
+
+    def class_counts(self):
+        """
+        以 bincount 統計各類別的數量
+
+        回傳:
+            dict: 類別名稱 -> 數量，只包含數量大於 0 的類別
+        """
+        if len(self) == 0:
+            return {}
+        counts = np.bincount(self.class_ids, minlength=len(self.names))
+        return {
+            (self.names[class_id] if class_id < len(self.names) else str(class_id)): int(count)
+            for class_id, count in enumerate(counts) if count
+        }
+
+    def to_dataframe(self):
+        """
+        轉換為與 YOLOv5 results.pandas().xyxy[0] 相同欄位的 DataFrame，只在需要時才建立
+
+        回傳:
+            pandas.DataFrame: 欄位為 xmin, ymin, xmax, ymax, confidence, class, name
+        """
+        import pandas as pd
+
+        return pd.DataFrame({
+            'xmin': self.boxes[:, 0],
+            'ymin': self.boxes[:, 1],
+            'xmax': self.boxes[:, 2],
+            'ymax': self.boxes[:, 3],
+            'confidence': self.confidences,
+            'class': self.class_ids,
+            'name': [self.names[i] if i < len(self.names) else str(i) for i in self.class_ids],
+        })
@@ -0,0 +1,93 @@
+import argparse
+import json
+
+import torch
+
+from model_registry import get_shared_registry
+from detection_record import DetectionRecord
+from inference_backends import default_export_path
+
+
+def load_detection_model(model_path):
+    """
+    取得 torch.hub 模型內部的 PyTorch 偵測網路，並設定為匯出模式
+
+    參數:
+        model_path (str): .pt 權重路徑
+
+    回傳:
+        tuple: (偵測網路, 類別名稱 dict, stride)
+    """
+    hub_model = get_shared_registry().get(model_path).model
+    # AutoShape -> DetectMultiBackend -> DetectionModel
+    model = hub_model.model.model if hasattr(hub_model.model, 'model') else hub_model.model
+    model = model.float().eval()
+
+    for module in model.modules():
+        # Detect 層在匯出模式下只輸出合併後的預測張量
+        if type(module).__name__ == 'Detect':
+            module.inplace = False
+            module.export = True
+
+    names = DetectionRecord.normalize_names(hub_model.names)
+    stride = int(max(getattr(model, 'stride', torch.tensor([32]))))
+    return model, {i: name for i, name in enumerate(names)}, stride
+
+
+def export_torchscript(model, sample, names, stride, output_path):
+    """匯出 TorchScript，類別名稱等設定存於 config.txt 附加檔"""
+    traced = torch.jit.trace(model, sample, strict=False)
+    config = {'shape': list(sample.shape), 'stride': stride, 'names': names}
+    traced.save(output_path, _extra_files={'config.txt': json.dumps(config, ensure_ascii=False)})
+    print(f"已匯出 TorchScript: {output_path}")
+
+
+def export_onnx(model, sample, names, stride, output_path, opset=12):
+    """匯出 ONNX（批次維度為動態），類別名稱等設定存於 metadata"""
+    import onnx
+
+    torch.onnx.export(
+        model,
+        sample,
+        output_path,
+        opset_version=opset,
+        do_constant_folding=True,
+        input_names=['images'],
+        output_names=['output0'],
+        dynamic_axes={'images': {0: 'batch'}, 'output0': {0: 'batch'}}
+    )
+
+    onnx_model = onnx.load(output_path)
+    onnx.checker.check_model(onnx_model)
+    for key, value in {'stride': str(stride), 'names': json.dumps(names, ensure_ascii=False)}.items():
+        meta = onnx_model.metadata_props.add()
+        meta.key, meta.value = key, value
+    onnx.save(onnx_model, output_path)
+    print(f"已匯出 ONNX: {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="將 YOLO 權重匯出為 TorchScript 與 ONNX")
+    parser.add_argument('--model', default='./model/best.pt', help="YOLO模型路徑")
+    parser.add_argument('--formats', nargs='+', choices=('torchscript', 'onnx'), default=['torchscript', 'onnx'],
+                        help="要匯出的格式")
+    parser.add_argument('--image-size', type=int, default=640, help="匯出模型的輸入邊長")
+    parser.add_argument('--opset', type=int, default=12, help="ONNX opset 版本")
+    args = parser.parse_args()
+
+    model, names, stride = load_detection_model(args.model)
+    sample = torch.zeros(1, 3, args.image_size, args.image_size)
+    with torch.no_grad():
+        # 先執行一次讓 Detect 層建立網格
+        model(sample)
+
+        if 'torchscript' in args.formats:
+            export_torchscript(model, sample, names, stride, default_export_path(args.model, 'torchscript'))
+        if 'onnx' in args.formats:
+            export_onnx(model, sample, names, stride, default_export_path(args.model, 'onnxruntime'), args.opset)
+
+    print("匯出完成，可使用 backend_parity.py 比對各後端的檢測結果")
+
+
+if __name__ == "__main__":
+    main()
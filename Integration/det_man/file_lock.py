@@ -0,0 +1,83 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 沒有 fcntl，改用 msvcrt 的位元組範圍鎖
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    def __init__(self, path):
+        """
+        跨行程的檔案鎖，以獨立的 .lock 檔案協調多個行程（POSIX 使用 flock，Windows 使用 msvcrt）
+
+        參數:
+            path (str): 鎖定檔案的路徑
+        """
+        self.path = path
+        self._fd = None
+
+    def acquire(self, shared=False):
+        """
+        阻擋等待取得鎖
+
+        參數:
+            shared (bool): 是否為共享鎖（讀取用）；Windows 不支援共享鎖，一律為獨佔鎖
+        """
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        # LK_LOCK 最多重試 10 秒後拋出例外，繼續等待即可
+                        msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.05)
+        except BaseException:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    def release(self):
+        """釋放鎖"""
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def shared(self):
+        """以共享鎖進入的 context manager"""
+        return _LockContext(self, shared=True)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class _LockContext:
+    def __init__(self, lock, shared):
+        self.lock = lock
+        self.shared = shared
+
+    def __enter__(self):
+        self.lock.acquire(shared=self.shared)
+        return self.lock
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release()
@@ -0,0 +1,174 @@
+import os
+import time
+
+# inotify 為選用套件，僅在 Linux 上可用；無法使用時改為輪詢
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+    inotify_flags = None
+
+
+class FolderWatcher:
+    def __init__(self, directory, extensions=('.jpg', '.jpeg', '.png'), settle_seconds=1.0,
+                 poll_interval=1.0, use_inotify=True):
+        """
+        初始化資料夾監看器，持續回報新放入且已寫入完成的圖片
+
+        參數:
+            directory (str): 要監看的資料夾
+            extensions (tuple): 要處理的副檔名
+            settle_seconds (float): 檔案大小與修改時間需維持不變多久才視為寫入完成
+            poll_interval (float): 輪詢或檢查待定檔案的間隔秒數
+            use_inotify (bool): 可用時是否使用 inotify
+        """
+        self.directory = directory
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and INotify is not None
+
+        # 待定檔案: path -> (size, mtime_ns, 最後一次變動被觀察到的時間)
+        self._pending = {}
+        # 已看過的檔案: path -> (size, mtime_ns)
+        self._seen = {}
+
+    @property
+    def mode(self):
+        """目前使用的監看方式"""
+        return 'inotify' if self.use_inotify else 'polling'
+
+    def _matches(self, name):
+        return name.lower().endswith(self.extensions)
+
+    def _stat(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _touch(self, path, now):
+        """記錄檔案的最新狀態；狀態改變時重新開始計算穩定時間"""
+        signature = self._stat(path)
+        if signature is None:
+            self._pending.pop(path, None)
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != signature:
+            self._pending[path] = (signature[0], signature[1], now)
+
+    def _scan(self, now):
+        """輪詢模式：掃描資料夾，找出新增或大小、修改時間有變動的檔案"""
+        current = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not self._matches(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # 掃描與讀取狀態之間檔案被刪除
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                current[entry.path] = signature
+                if self._seen.get(entry.path) != signature:
+                    self._touch(entry.path, now)
+        self._seen = current
+
+    def _collect_ready(self, now):
+        """回傳已穩定超過 settle_seconds 的檔案，並從待定清單移除"""
+        ready = []
+        for path in list(self._pending):
+            self._touch(path, now)
+            state = self._pending.get(path)
+            if state is not None and now - state[2] >= self.settle_seconds:
+                ready.append(path)
+                self._seen[path] = state[:2]
+                del self._pending[path]
+        return sorted(ready)
+
+    def _existing(self, now):
+        """
+        列出資料夾中已存在的圖片：修改時間早於 settle_seconds 的視為已穩定並依名稱回傳，
+        最近仍在變動的放入待定清單，與新檔案一樣等待穩定
+        """
+        stable = []
+        wall_now = time.time()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not self._matches(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                self._seen[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                if wall_now - stat.st_mtime >= self.settle_seconds:
+                    stable.append(entry.path)
+                else:
+                    self._pending[entry.path] = (stat.st_size, stat.st_mtime_ns, now)
+        return sorted(stable)
+
+    def watch(self, stop_event, include_existing=True):
+        """
+        持續產生寫入完成的圖片路徑，直到 stop_event 被設定
+
+        inotify 模式下先註冊監看再列出既有檔案，處理既有檔案期間新放入的圖片也會被回報
+
+        參數:
+            stop_event (threading.Event): 停止訊號
+            include_existing (bool): 是否先回報資料夾中已存在的圖片
+
+        回傳:
+            generator: 圖片路徑
+        """
+        inotify = None
+        if self.use_inotify:
+            inotify = INotify()
+            inotify.add_watch(self.directory, self._inotify_mask())
+        try:
+            now = time.monotonic()
+            if include_existing:
+                for path in self._existing(now):
+                    if stop_event.is_set():
+                        return
+                    yield path
+            elif inotify is None:
+                self._scan(now)
+                self._pending.clear()
+
+            if inotify is not None:
+                yield from self._watch_inotify(inotify, stop_event)
+            else:
+                yield from self._watch_polling(stop_event)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _watch_polling(self, stop_event):
+        while not stop_event.is_set():
+            now = time.monotonic()
+            self._scan(now)
+            for path in self._collect_ready(now):
+                yield path
+            stop_event.wait(self.poll_interval)
+
+    @staticmethod
+    def _inotify_mask():
+        return inotify_flags.CREATE | inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.MODIFY
+
+    def _watch_inotify(self, inotify, stop_event):
+        while not stop_event.is_set():
+            # 有待定檔案時縮短等待時間，以便及時判斷是否已寫入完成
+            timeout = self.poll_interval if not self._pending else min(self.poll_interval, self.settle_seconds / 2)
+            events = inotify.read(timeout=int(timeout * 1000))
+            now = time.monotonic()
+            for event in events:
+                if event.mask & inotify_flags.Q_OVERFLOW:
+                    # 事件佇列溢位，可能遺漏事件，重新掃描資料夾
+                    self._scan(now)
+                elif event.name and self._matches(event.name):
+                    self._touch(os.path.join(self.directory, event.name), now)
+            for path in self._collect_ready(now):
+                yield path
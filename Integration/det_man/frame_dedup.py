@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def dhash(image, hash_size=8):
+    """
+    計算差異雜湊（dHash）：縮成 (hash_size+1)×hash_size 的灰階圖後比較左右相鄰像素
+
+    參數:
+        image (PIL.Image 或 np.ndarray): 圖片
+        hash_size (int): 雜湊邊長，結果為 hash_size² 位元
+
+    回傳:
+        int: 感知雜湊值
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    small = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).tobytes().hex(), 16)
+
+
+def hamming_distance(a, b):
+    """兩個雜湊值之間不同的位元數"""
+    return bin(a ^ b).count('1')
+
+
+class FrameDeduplicator:
+    def __init__(self, max_distance=4, capacity=64, hash_size=8):
+        """
+        初始化近似畫面過濾器，相同攝影機（或資料夾）中與最近畫面幾乎相同的圖片直接沿用先前的檢測結果
+
+        參數:
+            max_distance (int): 漢明距離小於等於此值時視為同一畫面
+            capacity (int): 每個攝影機或資料夾保留的最近雜湊數量（LRU）
+            hash_size (int): dHash 邊長
+        """
+        self.max_distance = max_distance
+        self.capacity = max(1, capacity)
+        self.hash_size = hash_size
+        self.inferred = 0
+        self.skipped = 0
+        # 來源 -> OrderedDict(雜湊值 -> 檢測結果)，最近使用的排在最後
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def hash(self, image):
+        """計算圖片的感知雜湊值"""
+        return dhash(image, self.hash_size)
+
+    def _match(self, group, frame_hash):
+        """在同一來源的最近畫面中尋找近似畫面（呼叫端需持有鎖）"""
+        recent = self._groups.get(group)
+        if not recent:
+            return None
+        detections = recent.get(frame_hash)
+        if detections is not None:
+            match = frame_hash
+        else:
+            match = next((h for h in reversed(recent)
+                          if hamming_distance(h, frame_hash) <= self.max_distance), None)
+        if match is None:
+            return None
+        recent.move_to_end(match)
+        return recent[match]
+
+    def lookup(self, group, frame_hash):
+        """
+        在同一來源的最近畫面中尋找近似畫面
+
+        參數:
+            group (str): 攝影機或資料夾名稱
+            frame_hash (int): 畫面的感知雜湊值
+
+        回傳:
+            DetectionRecord: 近似畫面的檢測結果；找不到時為 None
+        """
+        with self._lock:
+            detections = self._match(group, frame_hash)
+            if detections is None:
+                self.inferred += 1
+            else:
+                self.skipped += 1
+            return detections
+
+    def lookup_batch(self, groups, hashes):
+        """
+        查詢一個批次：先比對各來源的最近畫面，找不到的畫面再與同一批次中同來源的待推論畫面比對，
+        彼此近似的畫面只需推論其中一張代表
+
+        參數:
+            groups (list): 每張畫面的攝影機或資料夾名稱
+            hashes (list): 每張畫面的感知雜湊值
+
+        回傳:
+            tuple: (outputs, owners)；outputs[i] 為最近畫面的檢測結果或 None，
+                   owners[i] 為需要推論時代表畫面的索引（自己或同批次的前一張近似畫面），已有結果時為 None
+        """
+        outputs = []
+        owners = []
+        # 來源 -> 本批次的代表畫面 [(雜湊值, 索引), ...]
+        representatives = {}
+        with self._lock:
+            for index, (group, frame_hash) in enumerate(zip(groups, hashes)):
+                detections = self._match(group, frame_hash)
+                outputs.append(detections)
+                if detections is not None:
+                    owners.append(None)
+                    self.skipped += 1
+                    continue
+                candidates = representatives.setdefault(group, [])
+                owner = next((i for h, i in reversed(candidates)
+                              if hamming_distance(h, frame_hash) <= self.max_distance), None)
+                if owner is None:
+                    candidates.append((frame_hash, index))
+                    owners.append(index)
+                    self.inferred += 1
+                else:
+                    owners.append(owner)
+                    self.skipped += 1
+        return outputs, owners
+
+    def remember(self, group, frame_hash, detections):
+        """記錄畫面的檢測結果，超過容量時淘汰最久未使用的雜湊"""
+        with self._lock:
+            recent = self._groups.setdefault(group, OrderedDict())
+            recent[frame_hash] = detections
+            recent.move_to_end(frame_hash)
+            while len(recent) > self.capacity:
+                recent.popitem(last=False)
+
+    def clear(self):
+        """清除所有記錄的畫面（例如模型更新後，先前的檢測結果不再適用）"""
+        with self._lock:
+            self._groups.clear()
+
+    def summary(self):
+        """回傳略過與推論的畫面統計摘要字串"""
+        total = self.inferred + self.skipped
+        ratio = self.skipped / total * 100 if total else 0.0
+        return f"近似畫面過濾: 推論 {self.inferred} 張, 沿用先前結果 {self.skipped} 張 ({ratio:.1f}%)"
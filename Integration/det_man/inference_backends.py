@@ -0,0 +1,317 @@
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from detection_record import DetectionRecord
+from model_registry import ModelRegistry, get_shared_registry
+
+# 可選擇的推論後端
+BACKENDS = ('torch-hub', 'torch-local', 'torchscript', 'onnxruntime')
+
+# 匯出模型的副檔名，與 YOLOv5 export.py 的慣例相同
+EXPORT_SUFFIXES = {
+    'torchscript': '.torchscript',
+    'onnxruntime': '.onnx',
+}
+
+
+def default_export_path(model_path, backend):
+    """由 .pt 權重路徑推得匯出模型的路徑，例如 best.pt -> best.onnx"""
+    return os.path.splitext(model_path)[0] + EXPORT_SUFFIXES[backend]
+
+
+def backend_model_version(backend, weights_hash):
+    """
+    組合處理清單等處使用的模型版本字串；不同後端的輸出視為不同版本
+
+    參數:
+        backend (str): 推論後端名稱
+        weights_hash (str): 權重檔（或匯出模型）的雜湊值
+    """
+    if backend == 'torch-hub':
+        return weights_hash
+    return f"{backend}:{weights_hash}"
+
+
+def backend_weights_path(backend, model_path, export_path=None):
+    """回傳推論後端實際讀取的模型檔路徑"""
+    if backend in ('torch-hub', 'torch-local'):
+        return model_path
+    return export_path or default_export_path(model_path, backend)
+
+
+def to_rgb_array(image):
+    """將 PIL 圖片或 NumPy 陣列轉為 H×W×3 的 RGB uint8 陣列"""
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert('RGB'))
+    array = np.asarray(image)
+    if array.ndim == 2:
+        array = np.stack([array] * 3, axis=-1)
+    return np.ascontiguousarray(array[..., :3])
+
+
+def letterbox(image, new_shape=640, color=114):
+    """
+    等比例縮放並補邊成固定尺寸，與 YOLOv5 訓練時的前處理一致
+
+    參數:
+        image (np.ndarray): H×W×3 的 RGB 圖片
+        new_shape (int): 輸出的邊長
+        color (int): 補邊的灰階值
+
+    回傳:
+        tuple: (補邊後的圖片, 縮放比例, (左側補邊, 上方補邊))
+    """
+    height, width = image.shape[:2]
+    ratio = min(new_shape / height, new_shape / width)
+    resized_w, resized_h = round(width * ratio), round(height * ratio)
+    if (resized_w, resized_h) != (width, height):
+        image = np.asarray(Image.fromarray(image).resize((resized_w, resized_h), Image.BILINEAR))
+
+    pad_w, pad_h = (new_shape - resized_w) / 2, (new_shape - resized_h) / 2
+    left, top = round(pad_w - 0.1), round(pad_h - 0.1)
+    canvas = np.full((new_shape, new_shape, 3), color, dtype=np.uint8)
+    canvas[top:top + resized_h, left:left + resized_w] = image
+    return canvas, ratio, (left, top)
+
+
+def box_iou(box, boxes):
+    """計算一個框與多個框的 IoU"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / (area + areas - inter + 1e-9)
+
+
+def non_max_suppression(prediction, conf_thres=0.25, iou_thres=0.45, max_det=1000, max_wh=7680):
+    """
+    以 NumPy 實作的 YOLOv5 非極大值抑制（每個候選框只取最高分的類別）
+
+    參數:
+        prediction (np.ndarray): 單張圖片的 N×(5+類別數) 原始輸出 (cx, cy, w, h, obj, cls...)
+        conf_thres (float): 置信度門檻
+        iou_thres (float): IoU 門檻
+        max_det (int): 每張圖片最多保留的檢測數
+        max_wh (int): 依類別位移框座標的距離，讓不同類別的框互不抑制
+
+    回傳:
+        np.ndarray: M×6 的 (xmin, ymin, xmax, ymax, confidence, class)
+    """
+    prediction = prediction[prediction[:, 4] > conf_thres]
+    if not len(prediction):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    scores = prediction[:, 5:] * prediction[:, 4:5]
+    class_ids = scores.argmax(1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    keep = confidences > conf_thres
+    prediction, class_ids, confidences = prediction[keep], class_ids[keep], confidences[keep]
+    if not len(prediction):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    boxes = np.empty((len(prediction), 4), dtype=np.float32)
+    boxes[:, 0] = prediction[:, 0] - prediction[:, 2] / 2
+    boxes[:, 1] = prediction[:, 1] - prediction[:, 3] / 2
+    boxes[:, 2] = prediction[:, 0] + prediction[:, 2] / 2
+    boxes[:, 3] = prediction[:, 1] + prediction[:, 3] / 2
+
+    offset_boxes = boxes + (class_ids[:, None] * max_wh)
+    order = confidences.argsort()[::-1]
+    selected = []
+    while len(order) and len(selected) < max_det:
+        best = order[0]
+        selected.append(best)
+        if len(order) == 1:
+            break
+        ious = box_iou(offset_boxes[best], offset_boxes[order[1:]])
+        order = order[1:][ious <= iou_thres]
+
+    selected = np.array(selected, dtype=np.int64)
+    return np.concatenate([
+        boxes[selected],
+        confidences[selected, None],
+        class_ids[selected, None].astype(np.float32)
+    ], axis=1).astype(np.float32)
+
+
+def scale_boxes(boxes, ratio, pad, original_shape):
+    """將 letterbox 座標還原為原圖座標"""
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes[:, :4] /= ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, original_shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, original_shape[0])
+    return boxes
+
+
+class TorchHubBackend:
+    name = 'torch-hub'
+
+    def __init__(self, model_path, registry=None):
+        """
+        以 torch.hub 載入的 YOLOv5 模型進行推論（原本的做法）
+
+        參數:
+            model_path (str): .pt 權重路徑
+            registry (ModelRegistry, optional): 模型登記表，預設使用行程內共用的登記表
+        """
+        self.model_path = model_path
+        self.registry = registry or get_shared_registry()
+        self.registry.get(model_path)
+
+    @property
+    def weights_hash(self):
+        return self.registry.get(self.model_path).weights_hash
+
+    def reload_if_changed(self):
+        return self.registry.reload_if_changed(self.model_path)
+
+    def warm_up(self):
+        self.registry.warm_up(self.registry.get(self.model_path))
+
+    def infer(self, images):
+        entry = self.registry.get(self.model_path)
+        with entry.lock:
+            results = entry.model(list(images))
+        return [DetectionRecord.from_array(pred, results.names) for pred in results.pred]
+
+
+class ExportedModel:
+    """匯出模型與其設定（輸入尺寸、類別名稱）"""
+
+    def __init__(self, run, image_size, names):
+        self.run = run
+        self.image_size = image_size
+        self.names = DetectionRecord.normalize_names(names)
+
+
+def _load_torchscript(path):
+    import torch
+
+    extra_files = {'config.txt': ''}
+    model = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+    model.eval()
+    config = json.loads(extra_files['config.txt'] or '{}')
+    names = {int(k): v for k, v in config.get('names', {}).items()}
+
+    def run(batch):
+        with torch.no_grad():
+            output = model(torch.from_numpy(batch))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.numpy()
+
+    return ExportedModel(run, int(config.get('shape', [1, 3, 640, 640])[-1]), names)
+
+
+def _load_local(path):
+    from offline_loader import load_local_model
+
+    return load_local_model(path)
+
+
+def _load_onnx(path):
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+    metadata = session.get_modelmeta().custom_metadata_map
+    names = {int(k): v for k, v in json.loads(metadata.get('names', '{}')).items()}
+    input_name = session.get_inputs()[0].name
+    image_size = session.get_inputs()[0].shape[-1]
+
+    def run(batch):
+        return session.run(None, {input_name: batch})[0]
+
+    return ExportedModel(run, image_size if isinstance(image_size, int) else 640, names)
+
+
+class ExportedBackend:
+    def __init__(self, name, model_path, registry, conf_thres=0.25, iou_thres=0.45):
+        """
+        以匯出模型（TorchScript、ONNX 或離線載入的 PyTorch 模型）推論，前處理與 NMS 由本模組實作，
+        輸出與 torch-hub 後端相同格式的 DetectionRecord
+
+        參數:
+            name (str): 後端名稱，'torch-local'、'torchscript' 或 'onnxruntime'
+            model_path (str): 匯出模型路徑
+            registry (ModelRegistry): 此類匯出模型使用的登記表
+            conf_thres (float): 置信度門檻
+            iou_thres (float): NMS 的 IoU 門檻
+        """
+        self.name = name
+        self.model_path = model_path
+        self.registry = registry
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.registry.get(model_path)
+
+    @property
+    def weights_hash(self):
+        return self.registry.get(self.model_path).weights_hash
+
+    def reload_if_changed(self):
+        return self.registry.reload_if_changed(self.model_path)
+
+    def warm_up(self):
+        entry = self.registry.get(self.model_path)
+        if not entry.warmed_up:
+            self.infer([np.zeros((64, 64, 3), dtype=np.uint8)])
+            entry.warmed_up = True
+
+    def infer(self, images):
+        entry = self.registry.get(self.model_path)
+        exported = entry.model
+
+        arrays = [to_rgb_array(image) for image in images]
+        letterboxed = [letterbox(array, exported.image_size) for array in arrays]
+        batch = np.stack([canvas for canvas, _, _ in letterboxed]).transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+        with entry.lock:
+            outputs = exported.run(batch)
+
+        records = []
+        for output, array, (_, ratio, pad) in zip(outputs, arrays, letterboxed):
+            detections = non_max_suppression(output, self.conf_thres, self.iou_thres)
+            detections[:, :4] = scale_boxes(detections[:, :4], ratio, pad, array.shape)
+            records.append(DetectionRecord.from_array(detections, exported.names))
+        return records
+
+
+# 匯出模型各自的行程內共用登記表
+_torchscript_registry = ModelRegistry(loader=_load_torchscript)
+_onnx_registry = ModelRegistry(loader=_load_onnx)
+_local_registry = ModelRegistry(loader=_load_local)
+
+
+def create_backend(backend, model_path, export_path=None, registry=None):
+    """
+    建立推論後端
+
+    參數:
+        backend (str): 'torch-hub'、'torch-local'、'torchscript' 或 'onnxruntime'
+        model_path (str): .pt 權重路徑
+        export_path (str, optional): 匯出模型路徑，預設由 model_path 推得
+        registry (ModelRegistry, optional): torch-hub 後端使用的模型登記表
+    """
+    if backend == 'torch-hub':
+        return TorchHubBackend(model_path, registry)
+    if backend not in BACKENDS:
+        raise ValueError(f"不支援的推論後端: {backend}，可用後端: {', '.join(BACKENDS)}")
+    if backend == 'torch-local':
+        # 不經過 torch.hub，從本機的 YOLOv5 模型定義離線載入 .pt 權重
+        return ExportedBackend(backend, model_path, _local_registry)
+
+    export_path = backend_weights_path(backend, model_path, export_path)
+    if not os.path.exists(export_path):
+        raise FileNotFoundError(f"找不到匯出模型 '{export_path}'，請先執行 export_model.py")
+    if backend == 'torchscript':
+        return ExportedBackend(backend, export_path, _torchscript_registry)
+    return ExportedBackend(backend, export_path, _onnx_registry)
@@ -1,17 +1,238 @@
+import argparse
+import atexit
 import os
 from safety_detector import SafetyDetector
 from safety_image_manager import SafetyImageManager
+from pipeline import DetectionPipeline, report_result
+from parallel_detection import ShardedDetector, auto_tune
+from model_registry import file_sha256
+from inference_backends import BACKENDS, backend_model_version, backend_weights_path
+from processing_manifest import ProcessingManifest
+from folder_watcher import FolderWatcher
+from annotation_writer import ANNOTATION_MODES
+from record_archive import RecordArchive
+from record_aggregates import RecordAggregates
+from record_store import DURABILITY_POLICIES, RECORD_STORES, BufferedRecordStore, create_record_store
+
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="工地安全帽檢測與記錄系統")
+    parser.add_argument('--model', default='./model/best.pt', help="YOLO模型路徑")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch-hub', help="推論後端")
+    parser.add_argument('--export-path', default=None, help="TorchScript / ONNX 匯出模型路徑，預設由 --model 推得")
+    parser.add_argument('--image-dir', default='./images', help="需要處理的圖片目錄")
+    parser.add_argument('--results-dir', default='./detection_results', help="檢測結果目錄")
+    parser.add_argument('--batch-size', type=int, default=8, help="每次送入模型的圖片數量")
+    parser.add_argument('--workers', default='1',
+                        help="多行程檢測的工作行程數量，'auto' 依 CPU 核心數自動調整，1 表示單一行程管線")
+    parser.add_argument('--threads-per-worker', type=int, default=0,
+                        help="多行程模式下每個行程的 PyTorch 執行緒數，0 表示自動調整")
+    parser.add_argument('--decode-workers', type=int, default=4, help="解碼執行緒數量")
+    parser.add_argument('--writer-workers', type=int, default=2, help="標註圖片寫入執行緒數量")
+    parser.add_argument('--queue-size', type=int, default=32, help="管線各階段之間佇列的容量")
+    parser.add_argument('--annotate', choices=ANNOTATION_MODES, default='full',
+                        help="標註圖片輸出模式: off 不輸出、dangerous 只輸出危險事件、thumbnail 全部輸出縮圖、full 全部輸出原尺寸")
+    parser.add_argument('--jpeg-quality', type=int, default=85, help="標註圖片的 JPEG 壓縮品質")
+    parser.add_argument('--max-annotation-size', type=int, default=0, help="標註圖片最長邊的上限，0 表示不限制")
+    parser.add_argument('--thumbnail-size', type=int, default=320, help="縮圖模式下標註圖片最長邊的長度")
+    parser.add_argument('--retention-max-mb', type=float, default=0, help="標註圖片目錄的總大小上限（MB），0 表示不限制")
+    parser.add_argument('--retention-days', type=float, default=0, help="一般標註圖片的保存天數，0 表示不限制")
+    parser.add_argument('--retention-dangerous-days', type=float, default=None,
+                        help="危險事件標註圖片的保存天數，預設與一般圖片相同")
+    parser.add_argument('--dedup-distance', type=int, default=-1,
+                        help="近似畫面過濾的漢明距離門檻，與同一來源最近畫面的距離不超過此值時沿用先前結果，-1 表示停用")
+    parser.add_argument('--dedup-capacity', type=int, default=64, help="每個攝影機或資料夾保留的最近畫面雜湊數量")
+    parser.add_argument('--cache', default=None,
+                        help="檢測結果快取的 SQLite 路徑，相同內容的圖片在模型與參數不變時直接沿用結果，未指定時停用")
+    parser.add_argument('--cache-max-mb', type=float, default=512, help="檢測結果快取的大小上限（MB）")
+    parser.add_argument('--record-store', choices=RECORD_STORES, default='csv',
+                        help="安全記錄儲存後端: csv 單一 CSV 檔案、sqlite 具索引的內嵌資料庫")
+    parser.add_argument('--record-path', default=None,
+                        help="安全記錄檔案路徑，預設為 safety_records.csv 或 safety_records.sqlite3")
+    parser.add_argument('--record-buffer', type=int, default=0,
+                        help="安全記錄群組提交：累積幾筆後一次寫出，0 表示每筆立即寫入")
+    parser.add_argument('--record-flush-ms', type=float, default=500, help="群組提交時記錄最多在記憶體中停留的毫秒數")
+    parser.add_argument('--record-durability', choices=DURABILITY_POLICIES, default='flush',
+                        help="群組提交寫出時的耐久性: none 不主動寫出緩衝區、flush 寫入作業系統、fsync 寫入磁碟")
+    parser.add_argument('--archive-dir', default=None,
+                        help="安全記錄的 Parquet 歸檔目錄，設定後查詢同時涵蓋熱記錄與歸檔（以 record_archive.py roll 移入）")
+    parser.add_argument('--aggregates', default=None,
+                        help="危險事件統計檔案路徑（每小時、每日、滑動視窗，依事件原因與攝影機分開計數），未指定時停用")
+    parser.add_argument('--manifest', default='processing_manifest.json', help="處理清單檔案路徑")
+    parser.add_argument('--force', action='store_true', help="忽略處理清單，重新分析所有圖片")
+    parser.add_argument('--video', default=None, help="改為處理影片檔或串流網址（例如 rtsp://...）")
+    parser.add_argument('--sample-fps', type=float, default=1.0, help="影片模式下每秒取樣幾個畫面")
+    parser.add_argument('--motion-threshold', type=float, default=0.0,
+                        help="影片模式下與上一個推論畫面的平均像素差（0-255）低於此值時略過，0 表示不過濾")
+    parser.add_argument('--watch', action='store_true', help="持續監看圖片目錄，處理新放入的圖片")
+    parser.add_argument('--settle-seconds', type=float, default=1.0, help="監看模式下檔案需維持不變多久才視為寫入完成")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="監看模式下輪詢資料夾的間隔秒數")
+    parser.add_argument('--no-inotify', action='store_true', help="監看模式下不使用 inotify，改為輪詢")
+    parser.add_argument('--reload-interval', type=float, default=30,
+                        help="監看模式下每隔幾秒檢查模型權重檔是否更新，更新時重新載入，0 表示不檢查")
+    args = parser.parse_args()
+    
+    # 解析工作行程數量
+    if args.workers == 'auto':
+        args.workers, tuned_threads = auto_tune()
+        args.threads_per_worker = args.threads_per_worker or tuned_threads
+    else:
+        args.workers = max(1, int(args.workers))
+    return args
+
+def detector_options(args):
+    """依命令列參數建立 SafetyDetector 的推論後端與標註輸出設定"""
+    return {
+        'backend': args.backend,
+        'export_path': args.export_path,
+        'annotation_mode': args.annotate,
+        'jpeg_quality': args.jpeg_quality,
+        'max_annotation_size': args.max_annotation_size,
+        'thumbnail_size': args.thumbnail_size,
+        'dedup_distance': args.dedup_distance,
+        'dedup_capacity': args.dedup_capacity,
+        'cache_path': args.cache,
+        'cache_max_mb': args.cache_max_mb,
+        'retention_max_mb': args.retention_max_mb,
+        'retention_days': args.retention_days,
+        'retention_dangerous_days': args.retention_dangerous_days
+    }
+
+def create_image_manager(args):
+    """依命令列參數建立安全記錄的儲存後端與圖像管理器"""
+    store = create_record_store(args.record_store, args.record_path)
+    if args.record_buffer > 0:
+        # 直譯器結束時會自動寫出緩衝區中剩餘的記錄
+        store = BufferedRecordStore(store, max_records=args.record_buffer,
+                                    max_delay_ms=args.record_flush_ms, durability=args.record_durability)
+    archive = RecordArchive(args.archive_dir) if args.archive_dir else None
+    aggregates = None
+    if args.aggregates:
+        aggregates = RecordAggregates(args.aggregates)
+        atexit.register(aggregates.save)
+    return SafetyImageManager(store=store, archive=archive, aggregates=aggregates)
+
+def run_sharded(args, image_manager, manifest, image_paths):
+    """多行程模式：將圖片分片給多個各自持有模型的工作行程，結果依輸入順序寫入同一個圖像管理器"""
+    sharded = ShardedDetector(
+        model_path=args.model,
+        save_dir=args.results_dir,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker or None,
+        batch_size=args.batch_size,
+        **detector_options(args)
+    )
+    completed = False
+    try:
+        for image_path, detections, safety_status in sharded.run(image_paths):
+            if report_result(image_manager, detections, safety_status,
+                             source=os.path.dirname(os.path.abspath(image_path))):
+                manifest.mark_processed(image_path, safety_status)
+        completed = True
+    except KeyboardInterrupt:
+        print("\n收到中斷訊號，正在停止工作行程...")
+    finally:
+        manifest.save()
+    sharded.print_stats()
+    return completed
+
+def create_pipeline(args, detector, image_manager, manifest, reload_interval=0):
+    """依命令列參數建立檢測管線；reload_interval 大於 0 時定期檢查權重檔並同步更新處理清單的模型版本"""
+    def on_model_reloaded(model_version):
+        # 之後完成的圖片以新模型版本記錄，舊版本的紀錄視為失效
+        manifest.model_version = model_version
+    
+    return DetectionPipeline(
+        detector,
+        image_manager,
+        decode_workers=args.decode_workers,
+        writer_workers=args.writer_workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        on_processed=manifest.mark_processed,
+        reload_interval=reload_interval,
+        on_model_reloaded=on_model_reloaded
+    )
+
+def run_watch_mode(args, detector, image_manager, manifest):
+    """監看模式：模型常駐，持續處理資料夾中新放入且已寫入完成的圖片"""
+    watcher = FolderWatcher(
+        args.image_dir,
+        settle_seconds=args.settle_seconds,
+        poll_interval=args.poll_interval,
+        use_inotify=not args.no_inotify
+    )
+    pipeline = create_pipeline(args, detector, image_manager, manifest, reload_interval=args.reload_interval)
+    print(f"開始監看 '{args.image_dir}'（{watcher.mode}），按 Ctrl-C 結束...")
+    
+    # 只將新增或已變更的圖片送入管線；推論階段只等待已就緒的圖片，不會為了湊滿批次而延遲
+    arrivals = (
+        image_path for image_path in watcher.watch(pipeline.stop_event)
+        if args.force or manifest.needs_processing(image_path)
+    )
+    try:
+        pipeline.run(arrivals)
+    finally:
+        manifest.save()
+        # 等待背景輸出的標註圖片寫完並關閉檢測結果快取
+        detector.close()
+    pipeline.print_stats()
+    print(f"  {detector.annotation_writer.summary()}")
+    if detector.annotation_writer.retention is not None:
+        print(f"  {detector.annotation_writer.retention.summary()}")
+    if detector.deduplicator is not None:
+        print(f"  {detector.deduplicator.summary()}")
+    if detector.cache is not None:
+        print(f"  {detector.cache.summary()}")
+    print("\n===== 監看模式已結束 =====")
+
+def run_video_mode(args, detector, image_manager):
+    """影片模式：取樣影片或串流畫面，略過沒有變動的畫面，結果以畫面時間寫入圖像管理器"""
+    # 影片模式才需要 OpenCV，圖片與監看模式不必安裝
+    from video_source import VideoFrameSource
+
+    source = VideoFrameSource(args.video, sample_fps=args.sample_fps, motion_threshold=args.motion_threshold)
+    # 影片檔可湊滿批次提高吞吐量；串流則逐張推論以降低延遲
+    batch_size = args.batch_size if source.is_file else 1
+    print(f"開始處理影片來源 '{args.video}'（每秒取樣 {args.sample_fps} 個畫面），按 Ctrl-C 結束...")
+    
+    def flush(frames):
+        detections_list = detector.infer_images([frame.image for frame in frames], groups=[source.name] * len(frames))
+        for frame, detections in zip(frames, detections_list):
+            safety_status = detector.analyze_safety(frame.file_name, detections)
+            # 串流畫面持續產生，標註圖片寫出跟不上時略過，不拖慢推論；影片檔則等待寫出
+            detector.submit_annotated(frame.image, detections, safety_status, block=source.is_file)
+            report_result(image_manager, detections, safety_status, timestamp=frame.timestamp, source=source.name)
+    
+    pending = []
+    try:
+        for frame in source.frames():
+            pending.append(frame)
+            if len(pending) >= batch_size:
+                flush(pending)
+                pending = []
+        if pending:
+            flush(pending)
+    except KeyboardInterrupt:
+        print("\n收到中斷訊號，停止讀取影片")
+    finally:
+        detector.close()
+    print(f"\n{source.summary()}")
+    print(f"{detector.annotation_writer.summary()}")
+    if detector.deduplicator is not None:
+        print(detector.deduplicator.summary())
 
 def main():
     """主程式：結合安全帽檢測和圖像管理功能"""
+    args = parse_args()
     print("===== 工地安全帽檢測與記錄系統 =====")
     
     # 設定需要處理的圖片目錄和檢測結果目錄
-    image_dir = './images'
-    detection_results_dir = './detection_results'
+    image_dir = args.image_dir
+    detection_results_dir = args.results_dir
     
-    # 檢查圖片目錄是否存在
-    if not os.path.exists(image_dir):
+    # 檢查圖片目錄是否存在（影片模式不需要圖片目錄）
+    if not args.video and not os.path.exists(image_dir):
         print(f"圖片目錄 '{image_dir}' 不存在，正在創建...")
         os.makedirs(image_dir)
         print(f"請將要分析的圖片放入 '{image_dir}' 目錄中，然後重新執行程式")
@@ -24,9 +245,27 @@ def main():
     else:
         print(f"使用已存在的檢測結果目錄: '{detection_results_dir}'")
     
-    # 初始化檢測器和圖像管理器
-    detector = SafetyDetector(save_dir=detection_results_dir)
-    image_manager = SafetyImageManager()
+    # 初始化檢測器和圖像管理器（模型由行程內共用的登記表載入一次並暖機）
+    # 多行程模式下模型只在工作行程中載入
+    sharded = args.workers > 1 and not args.watch and not args.video
+    if sharded:
+        detector = None
+        weights_path = backend_weights_path(args.backend, args.model, args.export_path)
+        model_version = backend_model_version(args.backend, file_sha256(weights_path))
+    else:
+        detector = SafetyDetector(model_path=args.model, save_dir=detection_results_dir, **detector_options(args))
+        model_version = detector.model_version
+    image_manager = create_image_manager(args)
+    print(f"使用模型版本: {model_version[:12]}")
+    manifest = ProcessingManifest(args.manifest, model_version=model_version)
+    
+    if args.video:
+        run_video_mode(args, detector, image_manager)
+        return
+    
+    if args.watch:
+        run_watch_mode(args, detector, image_manager, manifest)
+        return
     
     # 獲取目錄中的所有圖片
     image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
@@ -35,33 +274,46 @@ def main():
         print(f"'{image_dir}' 目錄中沒有找到圖片")
         return
     
-    print(f"找到 {len(image_files)} 張圖片，開始處理...")
+    # 依處理清單只分析新增或已變更的圖片，模型權重變更時舊紀錄會失效
+    image_paths = [os.path.join(image_dir, file_name) for file_name in image_files]
+    if not args.force:
+        image_paths = manifest.filter_pending(image_paths)
     
-    # 處理每一張圖片
-    for file_name in image_files:
-        image_path = os.path.join(image_dir, file_name)
-        print(f"\n處理圖片: {file_name}")
-        
+    print(f"找到 {len(image_files)} 張圖片，其中 {len(image_paths)} 張需要分析（批次大小: {args.batch_size}）...")
+    
+    if not image_paths:
+        manifest.save()
+        print("\n===== 沒有新的圖片需要處理 =====")
+        return
+    
+    if sharded:
+        completed = run_sharded(args, image_manager, manifest, image_paths)
+    else:
+        # 以分階段管線處理所有圖片：解碼、推論、標註圖片寫入與記錄寫入同時進行
+        pipeline = create_pipeline(args, detector, image_manager, manifest)
         try:
-            # 使用YOLO模型檢測物件
-            detections, safety_status = detector.detect_objects(image_path)
-            
-            # 印出檢測結果
-            detector.print_detection_results(detections)
-            
-            # 將安全記錄添加到圖像管理器
-            image_manager.add_safety_record(file_name, safety_status)
-            
-            # 打印安全狀態
-            if safety_status['event_type'] == '危險':
-                print(f"⚠️ 警告: 圖片 {file_name} 中檢測到安全問題 - {safety_status['event_reason']}")
-            else:
-                print(f"✓ 圖片 {file_name} 安全檢查通過")
-                
-        except Exception as e:
-            print(f"處理圖片 {file_name} 時出錯: {str(e)}")
+            completed = pipeline.run(image_paths)
+        finally:
+            # 即使中途停止，已完成的圖片也會保留在清單中
+            manifest.save()
+            detector.close()
+        pipeline.print_stats()
+        print(f"  {detector.annotation_writer.summary()}")
+        if detector.annotation_writer.retention is not None:
+            print(f"  {detector.annotation_writer.retention.summary()}")
+        if detector.deduplicator is not None:
+            print(f"  {detector.deduplicator.summary()}")
+        if detector.cache is not None:
+            print(f"  {detector.cache.summary()}")
+    
+    if not completed:
+        print("\n===== 處理未完成，已提前停止 =====")
+        return
     
     print("\n===== 所有圖片處理完成 =====")
+    if isinstance(image_manager.store, BufferedRecordStore):
+        image_manager.store.flush()
+        print(image_manager.store.summary())
     
     # 顯示所有記錄
     print("\n安全檢測記錄摘要:")
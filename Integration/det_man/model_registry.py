@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    計算檔案內容的 SHA-256 雜湊值
+
+    參數:
+        path (str): 檔案路徑
+        chunk_size (int): 每次讀取的位元組數
+
+    回傳:
+        str: 十六進位雜湊字串
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelEntry:
+    """已載入模型的登記資訊"""
+
+    def __init__(self, model_path, weights_hash, stat, model):
+        self.model_path = model_path
+        self.weights_hash = weights_hash
+        self.stat = stat
+        self.model = model
+        self.warmed_up = False
+        # 同一個模型不可被多個執行緒同時推論
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self, loader=None):
+        """
+        初始化行程層級的模型登記表，同一個權重檔只載入一次
+
+        參數:
+            loader (callable, optional): 載入模型的函式，接收權重路徑並回傳模型，
+                預設使用 torch.hub 載入 YOLOv5 自訓練模型
+        """
+        self._loader = loader or self._load_from_hub
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_from_hub(model_path):
+        """使用 torch.hub 載入 YOLOv5 自訓練模型"""
+        # 延後匯入 torch，使用 ONNX Runtime 等後端時不需負擔 torch 的匯入時間
+        import torch
+
+        return torch.hub.load('ultralytics/yolov5', 'custom', path=model_path)
+
+    @staticmethod
+    def _stat_signature(model_path):
+        """取得權重檔的大小與修改時間，用來快速判斷檔案是否變更"""
+        stat = os.stat(model_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load_entry(self, model_path):
+        stat = self._stat_signature(model_path)
+        weights_hash = file_sha256(model_path)
+        print(f"載入模型: {model_path} (sha256: {weights_hash[:12]})")
+        model = self._loader(model_path)
+        return ModelEntry(model_path, weights_hash, stat, model)
+
+    def get(self, model_path):
+        """
+        取得模型，第一次呼叫時才載入（lazy），之後都回傳同一個實例
+
+        參數:
+            model_path (str): YOLO模型路徑
+
+        回傳:
+            ModelEntry: 模型登記資訊
+        """
+        key = os.path.abspath(model_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load_entry(key)
+                self._entries[key] = entry
+            return entry
+
+    def reload_if_changed(self, model_path):
+        """
+        檢查權重檔是否在磁碟上被更新，若內容雜湊改變則重新載入
+
+        參數:
+            model_path (str): YOLO模型路徑
+
+        回傳:
+            bool: 是否重新載入了模型
+        """
+        key = os.path.abspath(model_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = self._load_entry(key)
+                return True
+
+            stat = self._stat_signature(key)
+            if stat == entry.stat:
+                return False
+
+            # 大小或修改時間改變時才重新計算雜湊
+            weights_hash = file_sha256(key)
+            if weights_hash == entry.weights_hash:
+                entry.stat = stat
+                return False
+
+            print(f"偵測到權重檔變更，重新載入模型: {key}")
+            self._entries[key] = self._load_entry(key)
+            return True
+
+    def reload(self, model_path):
+        """強制重新載入模型"""
+        key = os.path.abspath(model_path)
+        with self._lock:
+            self._entries[key] = self._load_entry(key)
+            return self._entries[key]
+
+    def warm_up(self, entry, size=64):
+        """
+        以一張空白圖片進行一次推論，讓第一張真正的圖片不用負擔初始化成本
+
+        參數:
+            entry (ModelEntry): 模型登記資訊
+            size (int): 暖機用圖片的邊長
+        """
+        if entry.warmed_up:
+            return
+        with entry.lock:
+            if not entry.warmed_up:
+                entry.model(np.zeros((size, size, 3), dtype=np.uint8))
+                entry.warmed_up = True
+
+
+# 行程內共用的模型登記表
+_shared_registry = ModelRegistry()
+
+
+def get_shared_registry():
+    """取得行程內共用的模型登記表"""
+    return _shared_registry
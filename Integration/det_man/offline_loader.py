@@ -0,0 +1,82 @@
+import os
+import sys
+
+# YOLOv5 原始碼的預設搜尋位置：環境變數、專案內附的 yolov5 目錄、torch.hub 快取
+YOLOV5_DIR_ENV = 'YOLOV5_DIR'
+
+
+def _hub_cache_dir():
+    torch_home = os.getenv('TORCH_HOME') or os.path.join(
+        os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'torch')
+    return os.path.join(torch_home, 'hub', 'ultralytics_yolov5_master')
+
+
+def find_yolov5_source(source_dir=None):
+    """
+    尋找本機的 YOLOv5 模型定義原始碼，不會連線下載
+
+    參數:
+        source_dir (str, optional): 指定的 YOLOv5 原始碼目錄
+
+    回傳:
+        str: 含有 models/yolo.py 的目錄
+    """
+    candidates = [
+        source_dir,
+        os.getenv(YOLOV5_DIR_ENV),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yolov5'),
+        _hub_cache_dir(),
+    ]
+    for candidate in candidates:
+        if candidate and os.path.isfile(os.path.join(candidate, 'models', 'yolo.py')):
+            return candidate
+    raise FileNotFoundError(
+        "找不到本機的 YOLOv5 原始碼，請設定環境變數 "
+        f"{YOLOV5_DIR_ENV}，或將 yolov5 放在 det_man/yolov5，"
+        "或在有網路的環境先執行一次 torch.hub.load 建立快取"
+    )
+
+
+def load_local_model(model_path, source_dir=None, image_size=640):
+    """
+    不經過 torch.hub，直接從本機的 YOLOv5 模型定義載入 best.pt
+
+    只匯入反序列化權重所需的 models 套件，不執行 hubconf 的套件檢查與版本更新，
+    也不會嘗試連線
+
+    參數:
+        model_path (str): .pt 權重路徑
+        source_dir (str, optional): YOLOv5 原始碼目錄
+        image_size (int): 推論時的輸入邊長
+
+    回傳:
+        ExportedModel: 可供 ExportedBackend 使用的模型
+    """
+    import torch
+    from inference_backends import ExportedModel
+
+    source = find_yolov5_source(source_dir)
+    if source not in sys.path:
+        # 權重檔以 pickle 儲存，類別路徑為 models.yolo.DetectionModel 等，需能從 sys.path 匯入
+        sys.path.insert(0, source)
+
+    checkpoint = torch.load(model_path, map_location='cpu', weights_only=False)
+    model = (checkpoint.get('ema') or checkpoint['model']).float()
+    if hasattr(model, 'fuse'):
+        model = model.fuse()
+    model.eval()
+
+    for module in model.modules():
+        # Detect 層在匯出模式下只輸出合併後的預測張量
+        if type(module).__name__ == 'Detect':
+            module.inplace = False
+            module.export = True
+
+    def run(batch):
+        with torch.no_grad():
+            output = model(torch.from_numpy(batch))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.numpy()
+
+    return ExportedModel(run, image_size, model.names)
@@ -0,0 +1,174 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util as multiprocessing_util
+
+# 每個工作行程各自持有的檢測器
+_worker_detector = None
+_worker_batch_size = 8
+
+
+def auto_tune(cpu_count=None):
+    """
+    依 CPU 核心數挑選工作行程數 × 每個行程的執行緒數
+
+    PyTorch 的 intra-op 執行緒在單一行程內超過數個之後效益遞減，
+    因此核心越多時，優先增加行程數而非每個行程的執行緒數
+
+    參數:
+        cpu_count (int, optional): CPU 核心數，預設使用 os.cpu_count()
+
+    回傳:
+        tuple: (workers, threads_per_worker)
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if cpu_count < 4:
+        threads = 1
+    elif cpu_count < 16:
+        threads = 2
+    else:
+        threads = 4
+    return max(1, cpu_count // threads), threads
+
+
+def _init_worker(model_path, save_dir, num_threads, batch_size, detector_kwargs):
+    """工作行程初始化：設定 PyTorch 執行緒數並載入自己的模型"""
+    import torch
+    from safety_detector import SafetyDetector
+
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 已經執行過平行運算時無法再設定，沿用預設值
+        pass
+
+    global _worker_detector, _worker_batch_size
+    _worker_batch_size = batch_size
+    _worker_detector = SafetyDetector(model_path=model_path, save_dir=save_dir, **detector_kwargs)
+    # 工作行程正常結束時關閉檢測器，寫回檢測結果快取中累積的存取時間
+    multiprocessing_util.Finalize(_worker_detector, _worker_detector.close, exitpriority=10)
+
+
+def _detect_shard(shard):
+    """在工作行程中檢測一個分片，回傳 (index, image_path, detections, safety_status) 列表"""
+    started = time.perf_counter()
+    image_paths = [image_path for _, image_path in shard]
+    outputs = _worker_detector.detect_batch(image_paths, batch_size=_worker_batch_size)
+    # 工作行程被中斷時不一定會執行結束處理，因此每個分片都等標註圖片寫完再回傳；
+    # 檢測結果快取的連線保持開啟供下一個分片使用，行程結束時才關閉
+    _worker_detector.annotation_writer.close()
+    results = [
+        (index, image_path, detections, safety_status)
+        for (index, image_path), (detections, safety_status) in zip(shard, outputs)
+    ]
+    return os.getpid(), time.perf_counter() - started, results
+
+
+class ShardedDetector:
+    def __init__(self, model_path='./model/best.pt', save_dir='./detection_results', workers=None,
+                 threads_per_worker=None, batch_size=8, shard_size=None, **detector_kwargs):
+        """
+        初始化多行程分片檢測器，每個工作行程各自載入模型，將圖片列表分片後平行檢測
+
+        每個工作行程各自持有 SafetyDetector：檢測結果快取的總大小記錄在共用的資料庫中，上限由所有行程共同遵守；
+        標註圖片的保留管理則是各行程各自計算，只在啟動與每次重新掃描目錄時看到其他行程寫入的圖片，
+        因此目錄大小在兩次掃描之間最多可能超出其他行程新寫入的部分
+
+        參數:
+            model_path (str): YOLO模型路徑
+            save_dir (str): 檢測結果保存目錄
+            workers (int, optional): 工作行程數量，未指定時自動調整
+            threads_per_worker (int, optional): 每個行程的 PyTorch 執行緒數，未指定時自動調整
+            batch_size (int): 每次送入模型的圖片數量
+            shard_size (int, optional): 每個分片的圖片數量，預設為 batch_size 的 4 倍
+            detector_kwargs: 傳給每個工作行程中 SafetyDetector 的其他參數
+        """
+        tuned_workers, tuned_threads = auto_tune()
+        self.model_path = model_path
+        self.save_dir = save_dir
+        self.workers = workers or tuned_workers
+        self.threads_per_worker = threads_per_worker or tuned_threads
+        self.batch_size = max(1, batch_size)
+        self.shard_size = shard_size or self.batch_size * 4
+        self.detector_kwargs = detector_kwargs
+        self.worker_stats = {}
+
+    def _shards(self, image_paths):
+        indexed = list(enumerate(image_paths))
+        return [indexed[i:i + self.shard_size] for i in range(0, len(indexed), self.shard_size)]
+
+    @staticmethod
+    def _error_results(shard, message):
+        """將整個分片轉為處理失敗的結果"""
+        from safety_detector import SafetyDetector
+
+        return [
+            (index, image_path, None, SafetyDetector.error_status(os.path.basename(image_path), message))
+            for index, image_path in shard
+        ]
+
+    def run(self, image_paths):
+        """
+        平行檢測所有圖片，依輸入順序逐一產生結果
+
+        參數:
+            image_paths (list): 要檢測的圖片路徑列表
+
+        回傳:
+            generator: 依輸入順序的 (image_path, detections, safety_status)
+        """
+        print(f"啟動 {self.workers} 個工作行程，每個行程 {self.threads_per_worker} 個執行緒...")
+        # 使用 spawn 避免在已初始化 PyTorch 執行緒的行程中 fork
+        context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.model_path, self.save_dir, self.threads_per_worker, self.batch_size, self.detector_kwargs)
+        )
+        # 同時只提交有限數量的分片，中斷時尚未開始的分片不必等待
+        window = self.workers * 2
+        shards = iter(self._shards(image_paths))
+        # (分片, future) 佇列
+        pending = deque()
+        completed = False
+        try:
+            for shard in shards:
+                pending.append((shard, executor.submit(_detect_shard, shard)))
+                if len(pending) >= window:
+                    break
+            # 依提交順序取回結果，合併順序與輸入順序一致
+            while pending:
+                shard, future = pending.popleft()
+                try:
+                    pid, elapsed, results = future.result()
+                except BrokenProcessPool:
+                    # 工作行程異常結束，無法繼續使用
+                    raise
+                except Exception as e:
+                    # 與單一行程管線相同，推論失敗只影響此分片的圖片
+                    pid, elapsed, results = None, 0.0, self._error_results(shard, f"推論失敗: {e}")
+                next_shard = next(shards, None)
+                if next_shard is not None:
+                    pending.append((next_shard, executor.submit(_detect_shard, next_shard)))
+                if pid is not None:
+                    stats = self.worker_stats.setdefault(pid, {'images': 0, 'seconds': 0.0})
+                    stats['images'] += len(results)
+                    stats['seconds'] += elapsed
+                for _, image_path, detections, safety_status in results:
+                    yield image_path, detections, safety_status
+            completed = True
+        finally:
+            # 正常結束時等待工作行程退出；中斷或呼叫端停止時取消尚未開始的分片，不等待
+            executor.shutdown(wait=completed, cancel_futures=not completed)
+
+    def print_stats(self):
+        """列印各工作行程的統計資訊"""
+        print("\n工作行程統計:")
+        for pid, stats in sorted(self.worker_stats.items()):
+            rate = stats['images'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+            print(f"  行程 {pid}: 檢測 {stats['images']} 張, 耗時 {stats['seconds']:.2f} 秒, {rate:.1f} 張/秒")
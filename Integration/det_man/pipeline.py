@@ -0,0 +1,366 @@
+import os
+import queue
+import threading
+import time
+
+from safety_detector import SafetyDetector
+
+# 佇列中代表「上游已結束」的標記
+_END = object()
+
+
+def report_result(image_manager, detections, safety_status, timestamp=None, source=None):
+    """
+    列印單張圖片的檢測結果並寫入安全記錄
+
+    參數:
+        image_manager (SafetyImageManager): 安全圖像管理器
+        detections (DetectionRecord): 檢測結果，處理失敗時為 None
+        safety_status (dict): 安全狀態
+        timestamp (str, optional): 記錄的時間戳記，未提供時使用當前時間
+        source (str, optional): 圖片所在資料夾或影片來源名稱，用於依攝影機統計
+
+    回傳:
+        bool: 是否成功記錄（處理失敗的圖片回傳 False）
+    """
+    file_name = safety_status['file_name']
+    print(f"\n處理圖片: {file_name}")
+
+    if 'error' in safety_status:
+        print(f"處理圖片 {file_name} 時出錯: {safety_status['error']}")
+        return False
+
+    # 印出檢測結果
+    SafetyDetector.print_detection_results(detections)
+
+    # 將安全記錄添加到圖像管理器
+    image_manager.add_safety_record(file_name, safety_status, timestamp=timestamp, source=source)
+
+    # 打印安全狀態
+    if safety_status['event_type'] == '危險':
+        print(f"⚠️ 警告: 圖片 {file_name} 中檢測到安全問題 - {safety_status['event_reason']}")
+    else:
+        print(f"✓ 圖片 {file_name} 安全檢查通過")
+    return True
+
+
+class StageStats:
+    def __init__(self, name):
+        """
+        記錄單一階段的處理統計
+
+        參數:
+            name (str): 階段名稱
+        """
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration, items=1, error=False):
+        """記錄一次處理的耗時與結果"""
+        with self._lock:
+            self.items += items
+            self.busy_seconds += duration
+            if error:
+                self.errors += items
+
+    def summary(self, elapsed):
+        """回傳此階段的統計摘要字串"""
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        return (f"{self.name}: 處理 {self.items} 筆, 錯誤 {self.errors} 筆, "
+                f"工作時間 {self.busy_seconds:.2f} 秒, 吞吐量 {rate:.1f} 筆/秒")
+
+
+class DetectionPipeline:
+    def __init__(self, detector, image_manager, decode_workers=4, writer_workers=2,
+                 batch_size=8, queue_size=32, on_processed=None, reload_interval=0, on_model_reloaded=None):
+        """
+        初始化分階段的檢測管線：解碼 → 推論 → 標註圖片寫入 / 記錄寫入
+
+        各階段以有界佇列串接，下游來不及處理時上游會被阻擋（backpressure）
+
+        參數:
+            detector (SafetyDetector): 安全帽檢測器
+            image_manager (SafetyImageManager): 安全圖像管理器
+            decode_workers (int): 解碼執行緒數量
+            writer_workers (int): 標註圖片寫入執行緒數量
+            batch_size (int): 每次送入模型的圖片數量
+            queue_size (int): 各階段之間佇列的容量
+            on_processed (callable, optional): 每張圖片成功記錄後呼叫，參數為 (image_path, safety_status)
+            reload_interval (float): 每隔幾秒在批次之間檢查權重檔是否更新，0 表示不檢查
+            on_model_reloaded (callable, optional): 模型重新載入後呼叫，參數為新的模型版本
+        """
+        self.detector = detector
+        self.image_manager = image_manager
+        self.decode_workers = max(1, decode_workers)
+        self.writer_workers = max(1, writer_workers)
+        self.batch_size = max(1, batch_size)
+        self.queue_size = max(1, queue_size)
+        self.on_processed = on_processed
+        self.reload_interval = reload_interval
+        self.on_model_reloaded = on_model_reloaded
+        self._last_reload_check = time.monotonic()
+
+        self.stats = {
+            'decode': StageStats('解碼'),
+            'inference': StageStats('推論'),
+            'annotate': StageStats('標註圖片寫入'),
+            'record': StageStats('記錄寫入'),
+        }
+        self.stop_event = threading.Event()
+        self._failure = None
+        self._elapsed = 0.0
+
+    def _put(self, target_queue, item):
+        """放入佇列；佇列已滿時等待，管線停止時放棄"""
+        while not self.stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source_queue):
+        """從佇列取出項目；管線停止時回傳結束標記"""
+        while not self.stop_event.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, stage, error):
+        """階段發生非預期錯誤時停止整條管線"""
+        if self._failure is None:
+            self._failure = f"{stage} 階段發生錯誤: {error}"
+        self.stop_event.set()
+
+    def _feed(self, image_paths, path_queue):
+        try:
+            for index, image_path in enumerate(image_paths):
+                if not self._put(path_queue, (index, image_path)):
+                    return
+        except Exception as e:
+            # 產生路徑時出錯（例如監看中的檔案被刪除）也要停止管線，不能讓 run() 永遠等待
+            self._fail('讀取圖片清單', e)
+        finally:
+            for _ in range(self.decode_workers):
+                self._put(path_queue, _END)
+
+    def _decode(self, path_queue, decoded_queue, remaining):
+        stats = self.stats['decode']
+        try:
+            while True:
+                item = self._get(path_queue)
+                if item is _END:
+                    break
+                index, image_path = item
+                started = time.perf_counter()
+                try:
+                    # 快取命中時帶著檢測結果往下游，推論階段直接略過
+                    image, content_hash, detections = self.detector.prepare_image(image_path)
+                    error = None
+                except Exception as e:
+                    image, content_hash, detections = None, None, None
+                    error = f"圖片解碼失敗: {e}"
+                stats.record(time.perf_counter() - started, error=error is not None)
+                if not self._put(decoded_queue, (index, image_path, image, error, content_hash, detections)):
+                    return
+        except Exception as e:
+            self._fail('解碼', e)
+        finally:
+            # 最後一個結束的解碼執行緒通知下游
+            with remaining['lock']:
+                remaining['count'] -= 1
+                last = remaining['count'] == 0
+            if last:
+                self._put(decoded_queue, _END)
+
+    def _next_batch(self, decoded_queue):
+        """取出一個批次：阻擋等待第一筆，其餘只取佇列中已就緒的項目"""
+        first = self._get(decoded_queue)
+        if first is _END:
+            return [], True
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = decoded_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _reload_if_due(self):
+        """在推論執行緒的批次之間檢查權重檔，更新時重新載入，之後的批次使用新模型"""
+        if not self.reload_interval or time.monotonic() - self._last_reload_check < self.reload_interval:
+            return
+        self._last_reload_check = time.monotonic()
+        try:
+            reloaded = self.detector.reload_model_if_changed()
+        except Exception as e:
+            print(f"重新載入模型失敗，沿用目前的模型: {e}")
+            return
+        if reloaded:
+            print(f"已重新載入模型，模型版本: {self.detector.model_version[:12]}")
+            if self.on_model_reloaded is not None:
+                self.on_model_reloaded(self.detector.model_version)
+
+    def _infer(self, decoded_queue, annotate_queue, record_queue):
+        stats = self.stats['inference']
+        try:
+            finished = False
+            while not finished:
+                batch, finished = self._next_batch(decoded_queue)
+                self._reload_if_due()
+                ready = []
+                outputs = []
+                for index, image_path, image, error, content_hash, detections in batch:
+                    file_name = os.path.basename(image_path)
+                    if error is not None:
+                        self._put(record_queue, (index, image_path, None, self.detector.error_status(file_name, error)))
+                    elif detections is not None:
+                        outputs.append((index, image_path, image, detections, self.detector.analyze_safety(file_name, detections)))
+                    else:
+                        ready.append((index, image_path, image, content_hash))
+
+                if ready:
+                    started = time.perf_counter()
+                    try:
+                        results, reused = self.detector.infer_images(
+                            [image for _, _, image, _ in ready],
+                            groups=[os.path.dirname(image_path) for _, image_path, _, _ in ready],
+                            report_reused=True
+                        )
+                    except Exception as e:
+                        stats.record(time.perf_counter() - started, items=len(ready), error=True)
+                        for index, image_path, _, _ in ready:
+                            file_name = os.path.basename(image_path)
+                            self._put(record_queue, (index, image_path, None, self.detector.error_status(file_name, f"推論失敗: {e}")))
+                        ready = []
+                    else:
+                        for (index, image_path, image, content_hash), detections, was_reused in zip(ready, results, reused):
+                            # 沿用近似畫面的結果不寫入快取，快取只保存實際推論的結果
+                            if not was_reused:
+                                self.detector.remember_detections(content_hash, detections)
+                            safety_status = self.detector.analyze_safety(os.path.basename(image_path), detections)
+                            outputs.append((index, image_path, image, detections, safety_status))
+                        stats.record(time.perf_counter() - started, items=len(ready))
+
+                for index, image_path, image, detections, safety_status in outputs:
+                    # 不需要標註圖片的畫面不進入寫入階段，完全不會被繪製
+                    if self.detector.should_annotate(safety_status):
+                        if not self._put(annotate_queue, (image, detections, safety_status)):
+                            return
+                    else:
+                        self.detector.annotation_writer.count_skipped()
+                    if not self._put(record_queue, (index, image_path, detections, safety_status)):
+                        return
+        except Exception as e:
+            self._fail('推論', e)
+        finally:
+            for _ in range(self.writer_workers):
+                self._put(annotate_queue, _END)
+            self._put(record_queue, _END)
+
+    def _annotate(self, annotate_queue):
+        stats = self.stats['annotate']
+        while True:
+            item = self._get(annotate_queue)
+            if item is _END:
+                return
+            started = time.perf_counter()
+            try:
+                self.detector.save_annotated(*item)
+                stats.record(time.perf_counter() - started)
+            except Exception as e:
+                stats.record(time.perf_counter() - started, error=True)
+                print(f"保存標註圖片時出錯: {e}")
+
+    def _record(self, record_queue):
+        stats = self.stats['record']
+        # 依輸入順序輸出記錄，先到的結果暫存直到輪到它
+        pending = {}
+        next_index = 0
+        try:
+            while True:
+                item = self._get(record_queue)
+                if item is _END:
+                    break
+                index, image_path, detections, safety_status = item
+                pending[index] = (image_path, detections, safety_status)
+                while next_index in pending:
+                    image_path, detections, safety_status = pending.pop(next_index)
+                    next_index += 1
+                    started = time.perf_counter()
+                    ok = report_result(self.image_manager, detections, safety_status,
+                                       source=os.path.dirname(os.path.abspath(image_path)))
+                    if ok and self.on_processed is not None:
+                        self.on_processed(image_path, safety_status)
+                    stats.record(time.perf_counter() - started, error=not ok)
+        except Exception as e:
+            self._fail('記錄寫入', e)
+
+    def stop(self):
+        """要求管線停止，各階段會在目前項目處理完後結束"""
+        self.stop_event.set()
+
+    def run(self, image_paths):
+        """
+        執行管線處理所有圖片
+
+        參數:
+            image_paths (iterable): 要處理的圖片路徑，可為列表或持續產生路徑的產生器
+
+        回傳:
+            bool: 是否完整處理完畢（未因錯誤或中斷而提前停止）
+        """
+        path_queue = queue.Queue(maxsize=self.queue_size)
+        decoded_queue = queue.Queue(maxsize=self.queue_size)
+        annotate_queue = queue.Queue(maxsize=self.queue_size)
+        record_queue = queue.Queue(maxsize=self.queue_size)
+        remaining = {'count': self.decode_workers, 'lock': threading.Lock()}
+
+        threads = [threading.Thread(target=self._feed, args=(image_paths, path_queue), name='feeder')]
+        threads += [
+            threading.Thread(target=self._decode, args=(path_queue, decoded_queue, remaining), name=f'decoder-{i}')
+            for i in range(self.decode_workers)
+        ]
+        threads.append(threading.Thread(target=self._infer, args=(decoded_queue, annotate_queue, record_queue), name='inference'))
+        threads += [
+            threading.Thread(target=self._annotate, args=(annotate_queue,), name=f'annotator-{i}')
+            for i in range(self.writer_workers)
+        ]
+        threads.append(threading.Thread(target=self._record, args=(record_queue,), name='recorder'))
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            # 以逾時方式等待，讓主執行緒能收到 Ctrl-C
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.2)
+        except KeyboardInterrupt:
+            print("\n收到中斷訊號，正在停止管線...")
+            self.stop()
+            for thread in threads:
+                thread.join()
+        finally:
+            self._elapsed = time.perf_counter() - started
+
+        if self._failure:
+            print(f"管線提前停止: {self._failure}")
+        return not self.stop_event.is_set()
+
+    def print_stats(self):
+        """列印各階段的統計資訊"""
+        print(f"\n管線統計（總耗時 {self._elapsed:.2f} 秒）:")
+        for stage in self.stats.values():
+            print(f"  {stage.summary(self._elapsed)}")
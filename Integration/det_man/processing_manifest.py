@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+
+from model_registry import file_sha256
+
+
+class ProcessingManifest:
+    def __init__(self, manifest_path='processing_manifest.json', model_version='', save_every=50):
+        """
+        初始化處理清單，記錄每張已分析圖片的路徑、大小、修改時間、內容雜湊與模型版本
+
+        參數:
+            manifest_path (str): 清單檔案路徑（JSON）
+            model_version (str): 目前模型版本（權重檔雜湊值），版本不同的紀錄視為失效
+            save_every (int): 每標記幾張圖片就寫回一次磁碟
+        """
+        self.manifest_path = manifest_path
+        self.model_version = model_version
+        self.save_every = max(1, save_every)
+        self.entries = {}
+        # needs_processing() 已計算過雜湊的圖片: key -> (size, mtime_ns, content_hash)
+        self._observed = {}
+        self._dirty = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as file:
+                    self.entries = json.load(file).get('entries', {})
+            except (OSError, ValueError) as e:
+                print(f"處理清單 '{manifest_path}' 無法讀取，將重新建立: {e}")
+                self.entries = {}
+
+    @staticmethod
+    def _key(image_path):
+        return os.path.abspath(image_path)
+
+    def _observe(self, image_path):
+        """讀取圖片的大小與修改時間；圖片已被刪除或改名時回傳 None"""
+        try:
+            return os.stat(image_path)
+        except OSError as e:
+            print(f"圖片 '{image_path}' 已不存在，略過: {e}")
+            return None
+
+    def _hash(self, image_path):
+        try:
+            return file_sha256(image_path)
+        except OSError as e:
+            print(f"圖片 '{image_path}' 無法讀取，略過: {e}")
+            return None
+
+    def needs_processing(self, image_path):
+        """
+        判斷圖片是否需要重新分析
+
+        大小與修改時間都相同時直接略過；若有變動則比對內容雜湊，
+        內容未變（例如只被 touch）時只更新清單而不重新分析。
+        已計算的雜湊會保留給 mark_processed() 使用，不會重複計算；圖片已不存在時略過
+
+        參數:
+            image_path (str): 圖片路徑
+
+        回傳:
+            bool: 是否需要分析
+        """
+        key = self._key(image_path)
+        stat = self._observe(image_path)
+        if stat is None:
+            return False
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None or entry.get('model_version') != self.model_version:
+            return True
+
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return False
+
+        content_hash = self._hash(image_path)
+        if content_hash is None:
+            return False
+        if content_hash != entry['content_hash']:
+            with self._lock:
+                self._observed[key] = (stat.st_size, stat.st_mtime_ns, content_hash)
+            return True
+
+        with self._lock:
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._dirty += 1
+        return False
+
+    def mark_processed(self, image_path, safety_status=None):
+        """
+        標記圖片已以目前模型分析完成；圖片在分析後被刪除或改名時只略過，不會中斷處理
+
+        參數:
+            image_path (str): 圖片路徑
+            safety_status (dict, optional): 分析得到的安全狀態，會一併記錄事件類型
+        """
+        key = self._key(image_path)
+        with self._lock:
+            observed = self._observed.pop(key, None)
+        stat = self._observe(image_path)
+        if stat is None:
+            return
+        # needs_processing() 之後檔案未變動時沿用當時計算的雜湊
+        if observed is not None and observed[:2] == (stat.st_size, stat.st_mtime_ns):
+            content_hash = observed[2]
+        else:
+            content_hash = self._hash(image_path)
+            if content_hash is None:
+                return
+        entry = {
+            'path': image_path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'content_hash': content_hash,
+            'model_version': self.model_version,
+            'event_type': safety_status.get('event_type') if safety_status else None
+        }
+        with self._lock:
+            self.entries[key] = entry
+            self._dirty += 1
+            should_save = self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    def filter_pending(self, image_paths):
+        """
+        從圖片列表中篩選出需要分析的圖片
+
+        參數:
+            image_paths (list): 圖片路徑列表
+
+        回傳:
+            list: 新增或已變更（含模型版本變更）的圖片路徑，順序與輸入相同
+        """
+        return [image_path for image_path in image_paths if self.needs_processing(image_path)]
+
+    def save(self):
+        """將清單寫回磁碟，先寫入暫存檔再取代，避免中斷時留下損毀的檔案"""
+        with self._lock:
+            if self._dirty == 0 and os.path.exists(self.manifest_path):
+                return
+            data = json.dumps({'entries': self.entries}, ensure_ascii=False, indent=1)
+            self._dirty = 0
+
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,289 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from file_lock import FileLock
+
+# 影片模式的畫面檔名為 <攝影機>_f<畫面編號>.jpg
+_FRAME_NAME = re.compile(r'^(?P<camera>.+)_f\d+\.\w+$')
+# 不知道來源時共用的攝影機名稱，統計的鍵數量不會隨記錄數增加
+DEFAULT_CAMERA = 'default'
+
+
+def camera_of(file_name, source=None):
+    """
+    推得記錄所屬的攝影機：優先使用呼叫端提供的來源（圖片所在資料夾或影片來源名稱），
+    其次為影片畫面檔名 <攝影機>_f<畫面編號> 中的攝影機，都沒有時為 DEFAULT_CAMERA
+
+    參數:
+        file_name (str): 圖片檔案名稱
+        source (str, optional): 圖片所在資料夾路徑或影片來源名稱
+    """
+    if source:
+        return os.path.basename(os.path.normpath(source)) or DEFAULT_CAMERA
+    match = _FRAME_NAME.match(os.path.basename(file_name))
+    return match.group('camera') if match else DEFAULT_CAMERA
+
+
+def _add(buckets, bucket, reason, camera, count=1):
+    """buckets[時間桶][事件原因][攝影機] += count"""
+    cameras = buckets.setdefault(bucket, {}).setdefault(reason, {})
+    cameras[camera] = cameras.get(camera, 0) + count
+
+
+def _merge(target, source):
+    for bucket, reasons in source.items():
+        for reason, cameras in reasons.items():
+            for camera, count in cameras.items():
+                _add(target, bucket, reason, camera, count)
+
+
+def _total(reasons, reason=None, camera=None):
+    """加總一個時間桶中符合條件的數量"""
+    total = 0
+    for bucket_reason, cameras in reasons.items():
+        if reason is not None and bucket_reason != reason:
+            continue
+        if camera is None:
+            total += sum(cameras.values())
+        else:
+            total += cameras.get(camera, 0)
+    return total
+
+
+class RecordAggregates:
+    def __init__(self, path='safety_aggregates.json', save_every=50, hourly_retention_days=90,
+                 sliding_minutes=24 * 60):
+        """
+        在寫入時維護的危險事件統計：每小時與每日的固定時間桶（依事件原因與攝影機分開計數），
+        以及以分鐘為單位、可查詢任意長度滑動視窗的計數
+
+        查詢成本與時間桶數量成正比，不需要重新讀取記錄；多個行程寫入同一個檔案時，
+        每次寫回都在檔案鎖內合併各自新增的計數。只讀取統計的行程（例如儀表板）以 refresh()
+        在檔案變更時重新載入
+
+        參數:
+            path (str): 統計檔案路徑（JSON）
+            save_every (int): 每新增幾筆就寫回一次磁碟
+            hourly_retention_days (int): 每小時時間桶保留的天數，每日時間桶不會刪除
+            sliding_minutes (int): 滑動視窗最長可查詢的分鐘數，更早的分鐘時間桶會被刪除
+        """
+        self.path = path
+        self.save_every = max(1, save_every)
+        self.hourly_retention = timedelta(days=hourly_retention_days)
+        self.sliding_minutes = sliding_minutes
+        self.hourly = {}
+        self.daily = {}
+        self._minutes = {}
+        self._latest_minute = None
+        self._pending_hourly = {}
+        self._pending_daily = {}
+        self._pending_minutes = {}
+        self._dirty = 0
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _file_lock(self):
+        # 每次使用新的鎖物件，多個執行緒同時寫回或重新載入時各自持有自己的檔案描述元
+        return FileLock(self.path + '.lock')
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}, {}, {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            # JSON 的鍵一律是字串，分鐘時間桶轉回整數
+            minutes = {int(minute): reasons for minute, reasons in data.get('minutes', {}).items()}
+            return data.get('hourly', {}), data.get('daily', {}), minutes
+        except (OSError, ValueError) as e:
+            print(f"統計檔案 '{self.path}' 無法讀取，將重新建立: {e}")
+            return {}, {}, {}
+
+    def _prune_minutes(self, minutes):
+        """只保留最長滑動視窗內的分鐘時間桶"""
+        if not minutes:
+            return minutes
+        oldest = max(minutes) - self.sliding_minutes
+        return {minute: reasons for minute, reasons in minutes.items() if minute > oldest}
+
+    def _apply(self, hourly, daily, minutes, mtime):
+        """以磁碟上的統計為準，再加回本行程尚未寫回的計數（呼叫端需持有 self._lock）"""
+        _merge(hourly, self._pending_hourly)
+        _merge(daily, self._pending_daily)
+        _merge(minutes, self._pending_minutes)
+        self.hourly, self.daily = hourly, daily
+        self._minutes = self._prune_minutes(minutes)
+        self._latest_minute = max(self._minutes) if self._minutes else None
+        self._loaded_mtime = mtime
+
+    def refresh(self):
+        """
+        統計檔案在上次載入或寫回後被其他行程更新時重新載入
+
+        回傳:
+            bool: 是否重新載入
+        """
+        if self._mtime() == self._loaded_mtime:
+            return False
+        with self._file_lock().shared():
+            mtime = self._mtime()
+            hourly, daily, minutes = self._load()
+        with self._lock:
+            self._apply(hourly, daily, minutes, mtime)
+        return True
+
+    def add(self, timestamp, reason, camera=DEFAULT_CAMERA):
+        """
+        新增一筆危險事件
+
+        參數:
+            timestamp (str 或 datetime): 事件時間
+            reason (str): 事件原因
+            camera (str): 攝影機名稱
+        """
+        moment = timestamp if isinstance(timestamp, datetime) else datetime.fromisoformat(str(timestamp))
+        hour = moment.strftime('%Y-%m-%dT%H')
+        day = moment.strftime('%Y-%m-%d')
+        minute = int(moment.timestamp() // 60)
+
+        with self._lock:
+            for buckets in (self.hourly, self._pending_hourly):
+                _add(buckets, hour, reason, camera)
+            for buckets in (self.daily, self._pending_daily):
+                _add(buckets, day, reason, camera)
+
+            _add(self._minutes, minute, reason, camera)
+            _add(self._pending_minutes, minute, reason, camera)
+            if self._latest_minute is None or minute > self._latest_minute:
+                self._latest_minute = minute
+                # 只保留最長滑動視窗內的分鐘時間桶
+                oldest = minute - self.sliding_minutes
+                for expired in [key for key in self._minutes if key <= oldest]:
+                    del self._minutes[expired]
+
+            self._dirty += 1
+            should_save = self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    def hourly_counts(self, start=None, end=None, reason=None, camera=None):
+        """
+        每小時的危險事件數
+
+        參數:
+            start (datetime, optional): 起始時間（含）
+            end (datetime, optional): 結束時間（不含）
+            reason (str, optional): 只計算此事件原因
+            camera (str, optional): 只計算此攝影機
+
+        回傳:
+            list: (YYYY-MM-DDTHH, 數量) 列表，依時間排序
+        """
+        first = start.strftime('%Y-%m-%dT%H') if start is not None else None
+        last = end.strftime('%Y-%m-%dT%H') if end is not None else None
+        with self._lock:
+            return self._counts(self.hourly, first, last, reason, camera, end_inclusive=end is not None and (
+                end.minute or end.second or end.microsecond))
+
+    def daily_counts(self, start=None, end=None, reason=None, camera=None):
+        """
+        每日的危險事件數，參數與 hourly_counts 相同（以日期比較）
+
+        回傳:
+            list: (YYYY-MM-DD, 數量) 列表，依日期排序
+        """
+        first = start.strftime('%Y-%m-%d') if start is not None else None
+        last = end.strftime('%Y-%m-%d') if end is not None else None
+        with self._lock:
+            return self._counts(self.daily, first, last, reason, camera, end_inclusive=end is not None and (
+                end.hour or end.minute or end.second or end.microsecond))
+
+    @staticmethod
+    def _counts(buckets, first, last, reason, camera, end_inclusive):
+        results = []
+        for bucket in sorted(buckets):
+            if first is not None and bucket < first:
+                continue
+            if last is not None and (bucket > last or (bucket == last and not end_inclusive)):
+                continue
+            count = _total(buckets[bucket], reason, camera)
+            if count:
+                results.append((bucket, count))
+        return results
+
+    def sliding_count(self, minutes=60, now=None, reason=None, camera=None):
+        """
+        最近 minutes 分鐘內的危險事件數
+
+        參數:
+            minutes (int): 視窗長度（不超過 sliding_minutes）
+            now (datetime, optional): 視窗結束時間，預設為目前時間
+            reason (str, optional): 只計算此事件原因
+            camera (str, optional): 只計算此攝影機
+        """
+        if minutes > self.sliding_minutes:
+            raise ValueError(f"滑動視窗最長為 {self.sliding_minutes} 分鐘")
+        end_minute = int((now.timestamp() if now is not None else time.time()) // 60)
+        with self._lock:
+            return sum(
+                _total(self._minutes[minute], reason, camera)
+                for minute in range(end_minute - minutes + 1, end_minute + 1)
+                if minute in self._minutes
+            )
+
+    def sliding_by_reason(self, minutes=60, now=None):
+        """
+        最近 minutes 分鐘內各事件原因的危險事件數
+
+        回傳:
+            dict: 事件原因 -> 數量
+        """
+        end_minute = int((now.timestamp() if now is not None else time.time()) // 60)
+        counts = {}
+        with self._lock:
+            for minute in range(end_minute - minutes + 1, end_minute + 1):
+                for reason, cameras in self._minutes.get(minute, {}).items():
+                    counts[reason] = counts.get(reason, 0) + sum(cameras.values())
+        return counts
+
+    def save(self):
+        """在檔案鎖內讀入磁碟上的統計、加上本行程新增的計數後寫回，先寫入暫存檔再取代"""
+        with self._lock:
+            if self._dirty == 0 and os.path.exists(self.path):
+                return
+            pending_hourly, self._pending_hourly = self._pending_hourly, {}
+            pending_daily, self._pending_daily = self._pending_daily, {}
+            pending_minutes, self._pending_minutes = self._pending_minutes, {}
+            self._dirty = 0
+
+        with self._file_lock():
+            hourly, daily, minutes = self._load()
+            _merge(hourly, pending_hourly)
+            _merge(daily, pending_daily)
+            _merge(minutes, pending_minutes)
+            if hourly:
+                cutoff = (datetime.strptime(max(hourly), '%Y-%m-%dT%H') - self.hourly_retention).strftime('%Y-%m-%dT%H')
+                hourly = {bucket: reasons for bucket, reasons in hourly.items() if bucket >= cutoff}
+            minutes = self._prune_minutes(minutes)
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'hourly': hourly, 'daily': daily, 'minutes': minutes}, file,
+                          ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            mtime = self._mtime()
+
+        with self._lock:
+            # 以合併後的結果為準（包含其他行程的計數），再加回寫回期間新增的計數
+            self._apply(hourly, daily, minutes, mtime)
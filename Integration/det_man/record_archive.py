@@ -0,0 +1,221 @@
+import argparse
+import os
+import uuid
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from record_store import RECORD_COLUMNS, create_record_store, to_iso
+
+# Parquet 內使用英文欄位名稱，讀出時再轉回與 CSV 相同的欄位
+ARCHIVE_COLUMNS = ['file_name', 'timestamp', 'event_type', 'event_reason']
+COLUMN_NAMES = dict(zip(ARCHIVE_COLUMNS, RECORD_COLUMNS))
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+class RecordArchive:
+    def __init__(self, archive_dir='safety_archive', row_group_size=65536):
+        """
+        安全記錄的 Parquet 歸檔層，依日期分割為 archive_dir/date=YYYY-MM-DD/*.parquet
+
+        查詢時先依日期挑選分割目錄，再將時間、事件類型與事件原因條件下推給 Parquet，
+        只讀取需要的分割、資料列群組與欄位（需要 pyarrow）
+
+        參數:
+            archive_dir (str): 歸檔目錄
+            row_group_size (int): 每個資料列群組的筆數，越小越能依統計資訊略過資料
+        """
+        self.archive_dir = archive_dir
+        self.row_group_size = row_group_size
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def partition_dir(self, day):
+        return os.path.join(self.archive_dir, f"date={day.isoformat()}")
+
+    def partitions(self, start=None, end=None):
+        """
+        回傳與 [start, end) 時間區間重疊的分割，依日期排序
+
+        回傳:
+            list: (日期, 分割目錄) 列表
+        """
+        first = _to_date(start) if start is not None else None
+        last = _to_date(end) if end is not None else None
+        selected = []
+        for name in os.listdir(self.archive_dir):
+            if not name.startswith('date='):
+                continue
+            try:
+                day = date.fromisoformat(name[5:])
+            except ValueError:
+                continue
+            if first is not None and day < first:
+                continue
+            if last is not None and day > last:
+                continue
+            selected.append((day, os.path.join(self.archive_dir, name)))
+        return sorted(selected)
+
+    @staticmethod
+    def _files(directory):
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.endswith('.parquet')
+        )
+
+    def _write(self, directory, rows):
+        """將記錄依時間排序後寫入分割中的新檔案，先寫入暫存檔再改名，讀取端不會看到寫到一半的檔案"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = sorted(rows, key=lambda row: row[1])
+        table = pa.table({column: [row[i] for row in rows] for i, column in enumerate(ARCHIVE_COLUMNS)})
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+        temp_path = path + '.tmp'
+        pq.write_table(table, temp_path, row_group_size=self.row_group_size, compression='zstd')
+        os.replace(temp_path, path)
+        return path
+
+    def append(self, rows):
+        """
+        將記錄依日期寫入對應的分割
+
+        參數:
+            rows (list): (檔案名稱, 時間戳記, 事件類型, 事件原因) 列表
+
+        回傳:
+            int: 寫入的記錄數
+        """
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(_to_date(row[1]), []).append(tuple(row))
+        for day, day_rows in by_day.items():
+            self._write(self.partition_dir(day), day_rows)
+        return sum(len(day_rows) for day_rows in by_day.values())
+
+    def compact(self, min_files=2):
+        """
+        將檔案數達到 min_files 的分割合併為單一檔案
+
+        回傳:
+            int: 合併的分割數
+        """
+        import pyarrow.parquet as pq
+
+        compacted = 0
+        for _, directory in self.partitions():
+            files = self._files(directory)
+            if len(files) < max(2, min_files):
+                continue
+            table = pq.read_table(files, columns=ARCHIVE_COLUMNS)
+            rows = list(zip(*(table.column(column).to_pylist() for column in ARCHIVE_COLUMNS)))
+            # 新檔案寫入完成後才刪除舊檔案；中途失敗時最多出現重複，不會遺失記錄
+            self._write(directory, rows)
+            for path in files:
+                os.remove(path)
+            compacted += 1
+        return compacted
+
+    def query(self, start=None, end=None, event_type=None, reason=None, file_name=None, columns=None,
+              limit=None, offset=0):
+        """
+        查詢歸檔記錄，參數與 CsvRecordStore.query 相同
+
+        參數:
+            columns (list, optional): 只讀取這些欄位（CSV 欄位名稱），未指定時讀取全部
+
+        回傳:
+            pandas.DataFrame: 欄位與 CSV 相同，依時間排序
+        """
+        files = [path for _, directory in self.partitions(start, end) for path in self._files(directory)]
+        selected = [name for name in ARCHIVE_COLUMNS if columns is None or COLUMN_NAMES[name] in columns]
+        if not files:
+            return pd.DataFrame(columns=[COLUMN_NAMES[name] for name in selected])
+
+        import pyarrow.parquet as pq
+
+        filters = []
+        for column, op, value in (
+            ('timestamp', '>=', to_iso(start)),
+            ('timestamp', '<', to_iso(end)),
+            ('event_type', '==', event_type),
+            ('event_reason', '==', reason),
+            ('file_name', '==', file_name),
+        ):
+            if value is not None:
+                filters.append((column, op, value))
+
+        # 排序需要時間欄位，讀取後再依需要移除
+        read_columns = selected if 'timestamp' in selected else selected + ['timestamp']
+        table = pq.read_table(files, columns=read_columns, filters=filters or None)
+        df = table.to_pandas().sort_values('timestamp', kind='stable')
+        stop = offset + limit if limit is not None else None
+        df = df.iloc[offset:stop].reset_index(drop=True)
+        return df[selected].rename(columns=COLUMN_NAMES)
+
+    def count(self, start=None, end=None):
+        """記錄數，只讀取 Parquet 的中繼資料"""
+        import pyarrow.parquet as pq
+
+        if start is None and end is None:
+            return sum(
+                pq.ParquetFile(path).metadata.num_rows
+                for _, directory in self.partitions() for path in self._files(directory)
+            )
+        return len(self.query(start=start, end=end, columns=['時間戳記']))
+
+
+def roll_hot_log(store, archive, before=None):
+    """
+    將熱記錄中早於 before 的記錄移入歸檔層
+
+    參數:
+        store: 記錄儲存後端（CsvRecordStore、SqliteRecordStore 或 BufferedRecordStore）
+        archive (RecordArchive): 歸檔層
+        before (str 或 date, optional): 移入歸檔的時間界線，預設為今天零時
+
+    回傳:
+        int: 移入歸檔的記錄數
+    """
+    if before is None:
+        before = date.today()
+    # 歸檔在儲存後端的鎖內完成，寫入歸檔成功後才從熱記錄刪除
+    return store.roll(to_iso(before), archive.append)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="安全記錄歸檔工具：將熱記錄依日期移入 Parquet 並合併小檔案")
+    parser.add_argument('--archive-dir', default='safety_archive', help="歸檔目錄")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    roll_parser = subparsers.add_parser('roll', help="將早於指定日期的熱記錄移入歸檔")
+    roll_parser.add_argument('--record-store', choices=['csv', 'sqlite'], default='csv', help="熱記錄儲存後端")
+    roll_parser.add_argument('--record-path', default=None, help="熱記錄檔案路徑")
+    roll_parser.add_argument('--keep-days', type=int, default=1, help="熱記錄保留最近幾天（含今天）")
+    compact_parser = subparsers.add_parser('compact', help="合併歸檔分割中的小檔案")
+    compact_parser.add_argument('--min-files', type=int, default=2, help="分割中的檔案數達到此值時合併")
+    args = parser.parse_args()
+
+    archive = RecordArchive(args.archive_dir)
+    if args.command == 'roll':
+        store = create_record_store(args.record_store, args.record_path)
+        try:
+            before = date.today() - timedelta(days=max(1, args.keep_days) - 1)
+            rolled = roll_hot_log(store, archive, before)
+        finally:
+            store.close()
+        print(f"已將 {rolled} 筆 {before.isoformat()} 之前的記錄移入 '{args.archive_dir}'")
+    else:
+        compacted = archive.compact(args.min_files)
+        print(f"已合併 {compacted} 個分割")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import csv
+import io
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+
+def to_epoch(value):
+    """將 date、datetime 或 ISO 字串轉為秒數，作為索引的排序鍵"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).timestamp()
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+# 用於偵測檔案被改寫的開頭位元組數
+_HEAD_SIZE = 4096
+# 用於偵測檔案被改寫的已讀取部分結尾位元組數
+_TAIL_SIZE = 256
+
+
+def generation_path(csv_path):
+    """記錄檔被原地改寫的世代標記檔路徑"""
+    return csv_path + '.generation'
+
+
+def read_generation(csv_path):
+    """讀取世代標記，沒有標記檔時為 0"""
+    try:
+        with open(generation_path(csv_path), 'r', encoding='utf-8') as file:
+            return int(file.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_generation(csv_path):
+    """
+    遞增世代標記，在原地改寫記錄檔（例如移入歸檔）時呼叫，
+    所有行程的 RecordIndex 下次 refresh() 時都會重新建立
+
+    回傳:
+        int: 新的世代
+    """
+    generation = read_generation(csv_path) + 1
+    temp_path = generation_path(csv_path) + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(str(generation))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, generation_path(csv_path))
+    return generation
+
+
+class _TimeIndex:
+    """依時間排序的 (時間, 列號) 陣列，以 bisect 查詢區間"""
+
+    __slots__ = ('keys', 'rows')
+
+    def __init__(self):
+        self.keys = []
+        self.rows = []
+
+    def add(self, key, row):
+        # 記錄幾乎都依時間附加，只有時間倒退時才需要插入
+        if not self.keys or key >= self.keys[-1]:
+            self.keys.append(key)
+            self.rows.append(row)
+        else:
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.rows.insert(position, row)
+
+    def range(self, start=None, end=None):
+        """回傳時間落在 [start, end) 的列號，依時間排序"""
+        lo = 0 if start is None else bisect_left(self.keys, start)
+        hi = len(self.keys) if end is None else bisect_left(self.keys, end)
+        return self.rows[lo:hi]
+
+
+class RecordIndex:
+    def __init__(self, csv_path):
+        """
+        安全記錄 CSV 的記憶體索引：依時間排序的陣列與 事件原因/事件類型/檔案名稱 -> 列號 的反向索引
+
+        第一次查詢時讀入整個檔案，之後每次 refresh() 只讀取檔案新附加的位元組；
+        世代標記改變（CsvRecordStore.roll() 原地改寫）、或已讀取部分的開頭或結尾內容改變時重新建立
+
+        參數:
+            csv_path (str): CSV記錄檔案的路徑
+        """
+        self.csv_path = csv_path
+        self.rows = []
+        self.skipped = 0
+        self._offset = 0
+        self._head = b''
+        self._tail = b''
+        self._generation = 0
+        self._header_seen = False
+        self._by_time = _TimeIndex()
+        self._by_reason = {}
+        self._by_type = {}
+        self._by_file = {}
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self.rows = []
+        self.skipped = 0
+        self._offset = 0
+        self._head = b''
+        self._tail = b''
+        self._header_seen = False
+        self._by_time = _TimeIndex()
+        self._by_reason = {}
+        self._by_type = {}
+        self._by_file = {}
+
+    def refresh(self):
+        """
+        讀取上次之後新附加的記錄並更新索引；檔案被截短、取代或原地改寫時重新建立
+
+        回傳:
+            int: 新加入索引的記錄數
+        """
+        with self._lock:
+            if not os.path.exists(self.csv_path):
+                self._reset()
+                return 0
+            # 改寫後再附加的檔案可能比上次讀取的位置更長，只比對大小無法發現
+            generation = read_generation(self.csv_path)
+            if generation != self._generation:
+                self._reset()
+                self._generation = generation
+            if os.path.getsize(self.csv_path) < self._offset:
+                self._reset()
+
+            with open(self.csv_path, 'rb') as file:
+                # 比對已讀取部分的開頭與結尾，檔案被改寫時重新讀取整個檔案
+                if self._head and file.read(len(self._head)) != self._head:
+                    self._reset()
+                elif self._tail:
+                    file.seek(self._offset - len(self._tail))
+                    if file.read(len(self._tail)) != self._tail:
+                        self._reset()
+                file.seek(self._offset)
+                data = file.read()
+
+            # 只處理完整的行，寫到一半的最後一行留到下次
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                return 0
+            self._offset += end
+            if len(self._head) < _HEAD_SIZE:
+                self._head += data[:min(end, _HEAD_SIZE - len(self._head))]
+            self._tail = (self._tail + data[:end])[-_TAIL_SIZE:]
+
+            added = 0
+            for row in csv.reader(io.StringIO(data[:end].decode('utf-8'), newline='')):
+                if not self._header_seen:
+                    self._header_seen = True
+                    continue
+                if len(row) != 4:
+                    self.skipped += 1
+                    continue
+                try:
+                    key = to_epoch(row[1])
+                except ValueError:
+                    self.skipped += 1
+                    continue
+                row_number = len(self.rows)
+                self.rows.append(tuple(row))
+                self._by_time.add(key, row_number)
+                self._by_type.setdefault(row[2], _TimeIndex()).add(key, row_number)
+                self._by_reason.setdefault(row[3], _TimeIndex()).add(key, row_number)
+                self._by_file.setdefault(row[0], []).append(row_number)
+                added += 1
+            return added
+
+    def __len__(self):
+        return len(self.rows)
+
+    def query_rows(self, start=None, end=None, event_type=None, reason=None, file_name=None, limit=None, offset=0):
+        """
+        查詢符合條件的記錄，不重新讀取檔案（需先呼叫 refresh()）
+
+        參數:
+            start (str、date 或 datetime, optional): 起始時間（含）
+            end (str、date 或 datetime, optional): 結束時間（不含）
+            event_type (str, optional): 事件類型
+            reason (str, optional): 事件原因
+            file_name (str, optional): 檔案名稱
+            limit (int, optional): 最多回傳幾筆
+            offset (int): 略過前幾筆
+
+        回傳:
+            list: (檔案名稱, 時間戳記, 事件類型, 事件原因) 列表，依時間排序
+        """
+        with self._lock:
+            row_numbers = self._select(start, end, event_type, reason, file_name)
+            stop = offset + limit if limit is not None else None
+            return [self.rows[row] for row in row_numbers[offset:stop]]
+
+    def count(self, start=None, end=None, event_type=None, reason=None, file_name=None):
+        """符合條件的記錄數"""
+        with self._lock:
+            return len(self._select(start, end, event_type, reason, file_name))
+
+    def _select(self, start, end, event_type, reason, file_name):
+        """回傳符合條件的列號，依時間排序"""
+        start_key = None if start is None else to_epoch(start)
+        end_key = None if end is None else to_epoch(end)
+
+        # 從最小的候選集合開始：事件原因 > 事件類型 > 全部記錄，都已依時間排序
+        if reason is not None:
+            index = self._by_reason.get(reason)
+        elif event_type is not None:
+            index = self._by_type.get(event_type)
+        else:
+            index = self._by_time
+        if index is None:
+            return []
+        row_numbers = index.range(start_key, end_key)
+
+        if file_name is not None:
+            allowed = set(self._by_file.get(file_name, ()))
+            row_numbers = [row for row in row_numbers if row in allowed]
+        if event_type is not None and reason is not None:
+            row_numbers = [row for row in row_numbers if self.rows[row][2] == event_type]
+        return row_numbers
@@ -0,0 +1,516 @@
+import argparse
+import atexit
+import csv
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+from file_lock import FileLock
+from record_index import RecordIndex, bump_generation, to_epoch
+
+# 與原本 CSV 檔案相同的欄位，LLM 端沿用此格式讀取
+RECORD_COLUMNS = ['檔案名稱', '時間戳記', '事件類型', '事件原因']
+RECORD_STORES = ('csv', 'sqlite')
+# none: 只交給檔案緩衝區；flush: 寫入作業系統，行程當機不會遺失；fsync: 寫入磁碟，斷電也不會遺失
+DURABILITY_POLICIES = ('none', 'flush', 'fsync')
+
+
+def to_iso(value):
+    """將 date、datetime 或 ISO 字串轉為可依字典順序比較的 ISO 字串"""
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+class CsvRecordStore:
+    def __init__(self, csv_path='safety_records.csv'):
+        """
+        以單一 CSV 檔案保存安全記錄（原本的格式），查詢使用記憶體中的 RecordIndex，
+        每次查詢只讀取上次之後新附加的記錄
+
+        多個行程（例如每組攝影機一個 main.py）可同時寫入同一個檔案：寫入與建立標題行都在
+        csv_path + '.lock' 的檔案鎖內進行，每批記錄完整寫出後才釋放鎖，不會交錯或截斷
+
+        參數:
+            csv_path (str): CSV記錄檔案的路徑
+        """
+        self.csv_path = csv_path
+        self._file = None
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(csv_path + '.lock')
+        self.index = RecordIndex(csv_path)
+
+        if os.path.exists(csv_path + '.rolling'):
+            print(f"警告: 發現 '{csv_path}.rolling'，上次移入歸檔時可能中斷，請確認記錄是否完整")
+
+        # 創建CSV並添加標題行；檢查與寫入在同一個鎖內，避免多個行程同時寫入標題行
+        with self._lock, self._file_lock:
+            if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+                with open(csv_path, 'a', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    writer.writerow(RECORD_COLUMNS)
+
+    def append(self, file_name, timestamp, event_type, event_reason):
+        """新增一筆安全記錄"""
+        self.append_many([(file_name, timestamp, event_type, event_reason)])
+
+    def append_many(self, rows, durability='flush'):
+        """
+        以一次寫入新增多筆安全記錄
+
+        參數:
+            rows (list): (檔案名稱, 時間戳記, 事件類型, 事件原因) 列表
+            durability (str): 'none'、'flush' 或 'fsync'；釋放檔案鎖前一定會寫出緩衝區，
+                因此 'none' 與 'flush' 相同
+        """
+        with self._lock, self._file_lock:
+            if self._file is None:
+                # 附加模式（O_APPEND）下每次寫入都接在其他行程寫入的內容之後
+                self._file = open(self.csv_path, 'a', newline='', encoding='utf-8')
+            csv.writer(self._file).writerows(rows)
+            self._file.flush()
+            if durability == 'fsync':
+                os.fsync(self._file.fileno())
+
+    def refresh_index(self):
+        """在共享鎖內將新附加的記錄加入索引，不會讀到其他行程寫到一半的記錄"""
+        with self._lock, self._file_lock.shared():
+            self.index.refresh()
+        return self.index
+
+    def query(self, start=None, end=None, event_type=None, reason=None, file_name=None, limit=None, offset=0):
+        """
+        查詢安全記錄
+
+        參數:
+            start (str 或 date, optional): 起始時間（含）
+            end (str 或 date, optional): 結束時間（不含）
+            event_type (str, optional): 事件類型
+            reason (str, optional): 事件原因
+            file_name (str, optional): 檔案名稱
+            limit (int, optional): 最多回傳幾筆
+            offset (int): 略過前幾筆，用於分頁
+
+        回傳:
+            pandas.DataFrame: 欄位與 CSV 相同，依時間排序
+        """
+        rows = self.refresh_index().query_rows(start=start, end=end, event_type=event_type, reason=reason,
+                                               file_name=file_name, limit=limit, offset=offset)
+        return pd.DataFrame(rows, columns=RECORD_COLUMNS)
+
+    def count(self):
+        """記錄總數"""
+        return len(self.refresh_index())
+
+    def export_csv(self, csv_path):
+        """匯出為 CSV 檔案"""
+        self.query().to_csv(csv_path, index=False, encoding='utf-8')
+
+    def roll(self, before, sink):
+        """
+        將早於 before 的記錄交給 sink 後從檔案移除，其餘記錄原地改寫，
+        其他行程以附加模式開啟的檔案仍然有效
+
+        參數:
+            before (str): 時間界線（ISO 格式）
+            sink (callable): 接收被移除記錄列表的函式，例如 RecordArchive.append
+
+        回傳:
+            int: 移除的記錄數
+        """
+        boundary = to_epoch(before)
+        with self._lock, self._file_lock:
+            if self._file is not None:
+                self._file.flush()
+            with open(self.csv_path, 'r', newline='', encoding='utf-8') as file:
+                rows = list(csv.reader(file))[1:]
+
+            old, keep = [], []
+            for row in rows:
+                try:
+                    expired = len(row) == len(RECORD_COLUMNS) and to_epoch(row[1]) < boundary
+                except ValueError:
+                    expired = False
+                (old if expired else keep).append(row)
+            if not old:
+                return 0
+
+            sink(old)
+
+            # 原地改寫後再附加的檔案可能比各行程索引已讀取的位置更長，
+            # 先遞增世代標記，所有索引下次更新時重新建立（改寫途中當機也一樣）
+            bump_generation(self.csv_path)
+
+            # 先保留一份剩餘記錄的備份，改寫途中當機時可由備份還原
+            backup_path = self.csv_path + '.rolling'
+            for path, mode in ((backup_path, 'w'), (self.csv_path, 'r+')):
+                with open(path, mode, newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    writer.writerow(RECORD_COLUMNS)
+                    writer.writerows(keep)
+                    file.truncate()
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.remove(backup_path)
+        return len(old)
+
+    def close(self):
+        """關閉檔案"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SqliteRecordStore:
+    def __init__(self, db_path='safety_records.sqlite3'):
+        """
+        以內嵌 SQLite 保存安全記錄，時間、事件類型、事件原因與檔案名稱都建立索引，
+        日期區間查詢與分頁不需要讀入整個記錄
+
+        參數:
+            db_path (str): SQLite 資料庫路徑
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        # 多個行程同時開啟新的資料庫時，切換 WAL 不經過 busy handler 會直接回報 database is locked，
+        # 因此建立資料表與切換日誌模式都在 db_path + '.lock' 的檔案鎖內進行
+        with FileLock(db_path + '.lock'):
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS safety_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_name TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    event_type TEXT NOT NULL,
+                    event_reason TEXT NOT NULL
+                )
+            """)
+            # 時間戳記為 ISO 字串，字典順序即時間順序，區間查詢可直接使用索引
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_timestamp ON safety_records(timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_type_time ON safety_records(event_type, timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_reason_time ON safety_records(event_reason, timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_file_name ON safety_records(file_name)")
+            self._conn.commit()
+
+    def append(self, file_name, timestamp, event_type, event_reason):
+        """新增一筆安全記錄"""
+        self.append_many([(file_name, timestamp, event_type, event_reason)])
+
+    def append_many(self, rows, durability='flush'):
+        """
+        在同一個交易中新增多筆安全記錄
+
+        參數:
+            rows (list): (檔案名稱, 時間戳記, 事件類型, 事件原因) 列表
+            durability (str): 'none'、'flush' 或 'fsync'，對應 SQLite 的 synchronous 設定
+        """
+        synchronous = {'none': 'OFF', 'flush': 'NORMAL', 'fsync': 'FULL'}[durability]
+        with self._lock:
+            self._conn.execute(f"PRAGMA synchronous={synchronous}")
+            self._conn.executemany(
+                "INSERT INTO safety_records (file_name, timestamp, event_type, event_reason) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def query(self, start=None, end=None, event_type=None, reason=None, file_name=None, limit=None, offset=0):
+        """
+        查詢安全記錄，參數與 CsvRecordStore.query 相同
+
+        回傳:
+            pandas.DataFrame: 欄位與 CSV 相同，依時間排序
+        """
+        conditions = []
+        params = []
+        for clause, value in (
+            ("timestamp >= ?", to_iso(start)),
+            ("timestamp < ?", to_iso(end)),
+            ("event_type = ?", event_type),
+            ("event_reason = ?", reason),
+            ("file_name = ?", file_name),
+        ):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+
+        sql = "SELECT file_name, timestamp, event_type, event_reason FROM safety_records"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp, id"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset]
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=RECORD_COLUMNS)
+
+    def count(self):
+        """記錄總數"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM safety_records").fetchone()[0]
+
+    def roll(self, before, sink):
+        """
+        將早於 before 的記錄交給 sink 後刪除，參數與 CsvRecordStore.roll 相同
+
+        回傳:
+            int: 刪除的記錄數
+        """
+        with self._lock:
+            # IMMEDIATE 交易在讀取前就取得寫入鎖，其他行程無法在歸檔期間插入早於界線的記錄
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT file_name, timestamp, event_type, event_reason FROM safety_records "
+                    "WHERE timestamp < ? ORDER BY timestamp, id", (before,)
+                ).fetchall()
+                if rows:
+                    sink(rows)
+                    self._conn.execute("DELETE FROM safety_records WHERE timestamp < ?", (before,))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return len(rows)
+
+    def export_csv(self, csv_path, chunk_size=10000):
+        """分批匯出為與原本相同格式的 CSV 檔案，供 LLM 端讀取"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT file_name, timestamp, event_type, event_reason FROM safety_records ORDER BY timestamp, id"
+            )
+            with open(csv_path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(RECORD_COLUMNS)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+
+    def close(self):
+        """關閉資料庫連線"""
+        with self._lock:
+            self._conn.close()
+
+
+class BufferedRecordStore:
+    def __init__(self, store, max_records=100, max_delay_ms=500, durability='flush'):
+        """
+        以群組提交包裝記錄儲存後端：記錄先放入記憶體，累積 max_records 筆或最早一筆等待超過
+        max_delay_ms 毫秒時一次寫出；直譯器結束時自動寫出剩餘記錄
+
+        參數:
+            store: CsvRecordStore 或 SqliteRecordStore
+            max_records (int): 累積幾筆記錄後寫出
+            max_delay_ms (float): 記錄在記憶體中最多停留的毫秒數
+            durability (str): 寫出時的耐久性: 'none'、'flush' 或 'fsync'
+        """
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"不支援的耐久性設定: {durability}，可用設定: {', '.join(DURABILITY_POLICIES)}")
+        self.store = store
+        self.max_records = max(1, max_records)
+        self.max_delay = max_delay_ms / 1000
+        self.durability = durability
+
+        # 統計：進入緩衝區、已寫出、寫出失敗而遺失的記錄數，以及寫出次數
+        self.buffered = 0
+        self.flushed = 0
+        self.lost = 0
+        self.flushes = 0
+
+        self._pending = []
+        self._oldest = None
+        self._closed = False
+        self._condition = threading.Condition()
+        # 寫出鎖確保同一時間只有一個執行緒寫入儲存後端，記錄順序不變
+        self._flush_lock = threading.Lock()
+        self._timer = threading.Thread(target=self._run_timer, name='record-flush', daemon=True)
+        self._timer.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self):
+        """尚未寫出的記錄數，行程當機時會遺失"""
+        with self._condition:
+            return len(self._pending)
+
+    def append(self, file_name, timestamp, event_type, event_reason):
+        """新增一筆安全記錄到緩衝區，達到筆數上限時立即寫出"""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("記錄緩衝區已關閉")
+            if not self._pending:
+                self._oldest = time.monotonic()
+                self._condition.notify()
+            self._pending.append((file_name, timestamp, event_type, event_reason))
+            self.buffered += 1
+            full = len(self._pending) >= self.max_records
+        if full:
+            self.flush()
+
+    def flush(self):
+        """立即寫出緩衝區中的所有記錄；寫出失敗的記錄留在緩衝區等待下次重試"""
+        with self._flush_lock:
+            with self._condition:
+                rows, self._pending, self._oldest = self._pending, [], None
+            if not rows:
+                return
+            try:
+                self.store.append_many(rows, durability=self.durability)
+            except Exception:
+                with self._condition:
+                    self._pending[:0] = rows
+                    self._oldest = time.monotonic()
+                raise
+            self.flushed += len(rows)
+            self.flushes += 1
+
+    def _run_timer(self):
+        """背景執行緒：最早一筆記錄等待超過期限時寫出"""
+        while True:
+            with self._condition:
+                while not self._closed and (not self._pending or time.monotonic() - self._oldest < self.max_delay):
+                    timeout = None if not self._pending else self.max_delay - (time.monotonic() - self._oldest)
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"寫出安全記錄失敗，稍後重試: {e}")
+                time.sleep(self.max_delay)
+
+    def query(self, *args, **kwargs):
+        """先寫出緩衝區再查詢，確保查得到剛新增的記錄"""
+        self.flush()
+        return self.store.query(*args, **kwargs)
+
+    def count(self):
+        self.flush()
+        return self.store.count()
+
+    def export_csv(self, csv_path):
+        self.flush()
+        self.store.export_csv(csv_path)
+
+    def roll(self, before, sink):
+        self.flush()
+        return self.store.roll(before, sink)
+
+    def close(self):
+        """寫出剩餘記錄並關閉儲存後端，可重複呼叫"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._timer.join()
+        try:
+            self.flush()
+        except Exception as e:
+            with self._condition:
+                self.lost += len(self._pending)
+                self._pending = []
+            print(f"關閉時寫出安全記錄失敗，遺失 {self.lost} 筆: {e}")
+        self.store.close()
+        atexit.unregister(self.close)
+
+    def summary(self):
+        """回傳群組提交統計摘要字串"""
+        average = self.flushed / self.flushes if self.flushes else 0.0
+        return (f"安全記錄群組提交（{self.durability}）: 緩衝 {self.buffered} 筆, 寫出 {self.flushed} 筆"
+                f"（{self.flushes} 次, 平均每次 {average:.1f} 筆）, 未寫出 {self.pending} 筆, 遺失 {self.lost} 筆")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def create_record_store(store='csv', path=None):
+    """
+    依名稱建立記錄儲存後端
+
+    參數:
+        store (str): 'csv' 或 'sqlite'
+        path (str, optional): 檔案路徑，未指定時使用各後端的預設路徑
+    """
+    if store == 'csv':
+        return CsvRecordStore(path or 'safety_records.csv')
+    if store == 'sqlite':
+        return SqliteRecordStore(path or 'safety_records.sqlite3')
+    raise ValueError(f"不支援的記錄儲存後端: {store}，可用後端: {', '.join(RECORD_STORES)}")
+
+
+def migrate_csv(csv_path, store, chunk_size=10000):
+    """
+    將既有的 CSV 記錄一次匯入 SQLite 儲存後端
+
+    參數:
+        csv_path (str): 既有的 CSV 記錄檔案
+        store (SqliteRecordStore): 匯入目標
+        chunk_size (int): 每個交易寫入的筆數
+
+    回傳:
+        int: 匯入的筆數
+    """
+    migrated = 0
+    with open(csv_path, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header != RECORD_COLUMNS:
+            raise ValueError(f"CSV 標題行不符: {header}")
+        chunk = []
+        for row in reader:
+            if len(row) != len(RECORD_COLUMNS):
+                print(f"略過格式錯誤的記錄: {row}")
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                store.append_many(chunk)
+                migrated += len(chunk)
+                chunk = []
+        if chunk:
+            store.append_many(chunk)
+            migrated += len(chunk)
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="安全記錄儲存工具：CSV 匯入 SQLite，或由 SQLite 匯出 CSV")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help="將既有的 CSV 記錄匯入 SQLite")
+    migrate_parser.add_argument('--csv', default='safety_records.csv', help="既有的 CSV 記錄檔案")
+    migrate_parser.add_argument('--db', default='safety_records.sqlite3', help="SQLite 資料庫路徑")
+    export_parser = subparsers.add_parser('export', help="由 SQLite 匯出 CSV 記錄")
+    export_parser.add_argument('--db', default='safety_records.sqlite3', help="SQLite 資料庫路徑")
+    export_parser.add_argument('--csv', default='safety_records.csv', help="匯出的 CSV 檔案")
+    args = parser.parse_args()
+
+    store = SqliteRecordStore(args.db)
+    try:
+        if args.command == 'migrate':
+            if store.count():
+                parser.error(f"'{args.db}' 已有記錄，為避免重複匯入請使用新的資料庫")
+            migrated = migrate_csv(args.csv, store)
+            print(f"已將 {migrated} 筆記錄由 '{args.csv}' 匯入 '{args.db}'")
+        else:
+            store.export_csv(args.csv)
+            print(f"已將 {store.count()} 筆記錄匯出至 '{args.csv}'")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
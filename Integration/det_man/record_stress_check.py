@@ -0,0 +1,122 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from record_store import RECORD_COLUMNS, BufferedRecordStore, create_record_store
+
+
+def _write_records(store_name, path, writer_id, count, buffer_records):
+    """工作行程：以自己的儲存後端寫入 count 筆記錄，檔案名稱帶有寫入者編號與序號"""
+    store = create_record_store(store_name, path)
+    if buffer_records > 0:
+        store = BufferedRecordStore(store, max_records=buffer_records, max_delay_ms=50)
+    for seq in range(count):
+        # 事件原因故意包含逗號與引號，確認 CSV 引號處理在並行寫入下仍然正確
+        store.append(f"w{writer_id:03d}_{seq:06d}.jpg", f"2025-01-01T00:00:00.{seq:06d}", '危險', '未戴安全帽, "測試"')
+    store.close()
+
+
+def read_rows(store_name, path):
+    """讀出所有記錄的 (檔案名稱, 時間戳記, 事件類型, 事件原因)；CSV 另外檢查標題行與欄位數"""
+    if store_name == 'sqlite':
+        import sqlite3
+        with sqlite3.connect(path) as conn:
+            return [tuple(row) for row in conn.execute(
+                "SELECT file_name, timestamp, event_type, event_reason FROM safety_records ORDER BY id"
+            )], []
+
+    problems = []
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        rows = list(csv.reader(file))
+    if not rows or rows[0] != RECORD_COLUMNS:
+        problems.append(f"第一行不是標題行: {rows[0] if rows else None}")
+    records = []
+    for line_number, row in enumerate(rows[1:], start=2):
+        if row == RECORD_COLUMNS:
+            problems.append(f"第 {line_number} 行出現重複的標題行")
+        elif len(row) != len(RECORD_COLUMNS):
+            problems.append(f"第 {line_number} 行欄位數錯誤（可能被截斷或交錯）: {row}")
+        else:
+            records.append(tuple(row))
+    return records, problems
+
+
+def check_integrity(records, writers, count):
+    """確認每個寫入者的每一筆記錄都恰好出現一次，且同一寫入者的記錄依序出現"""
+    problems = []
+    seen = {}
+    last_seq = {}
+    for file_name, timestamp, event_type, event_reason in records:
+        try:
+            writer_id, seq = int(file_name[1:4]), int(file_name[5:11])
+        except ValueError:
+            problems.append(f"無法解析的記錄: {file_name}")
+            continue
+        if event_type != '危險' or event_reason != '未戴安全帽, "測試"' or not timestamp.endswith(f"{seq:06d}"):
+            problems.append(f"內容損毀的記錄: {file_name}")
+        seen[(writer_id, seq)] = seen.get((writer_id, seq), 0) + 1
+        if seq <= last_seq.get(writer_id, -1):
+            problems.append(f"寫入者 {writer_id} 的記錄順序錯亂: {seq}")
+        last_seq[writer_id] = seq
+
+    missing = writers * count - sum(1 for key in seen if key[0] < writers and key[1] < count)
+    duplicated = sum(1 for times in seen.values() if times > 1)
+    if missing:
+        problems.append(f"遺失 {missing} 筆記錄")
+    if duplicated:
+        problems.append(f"{duplicated} 筆記錄重複出現")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多行程同時寫入安全記錄的壓力測試，結束後檢查記錄完整性")
+    parser.add_argument('--store', choices=['csv', 'sqlite'], default='csv', help="記錄儲存後端")
+    parser.add_argument('--writers', type=int, default=8, help="同時寫入的行程數")
+    parser.add_argument('--records', type=int, default=2000, help="每個行程寫入的記錄數")
+    parser.add_argument('--buffer', type=int, default=0, help="群組提交的筆數，0 表示每筆立即寫入")
+    parser.add_argument('--path', default=None, help="記錄檔案路徑，預設為暫存目錄中的新檔案")
+    args = parser.parse_args()
+
+    workdir = None
+    path = args.path
+    if path is None:
+        workdir = tempfile.mkdtemp(prefix='record_stress_')
+        path = os.path.join(workdir, 'safety_records.csv' if args.store == 'csv' else 'safety_records.sqlite3')
+    elif os.path.exists(path):
+        parser.error(f"'{path}' 已存在，請指定新的檔案")
+
+    # 所有工作行程同時建立儲存後端，也一併驗證標題行的建立不會競爭
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=_write_records, args=(args.store, path, writer_id, args.records, args.buffer))
+        for writer_id in range(args.writers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    problems = [f"工作行程 {process.pid} 異常結束 (exit code {process.exitcode})"
+                for process in processes if process.exitcode != 0]
+    records, format_problems = read_rows(args.store, path)
+    problems += format_problems + check_integrity(records, args.writers, args.records)
+
+    total = args.writers * args.records
+    print(f"{args.writers} 個行程共寫入 {total} 筆記錄，耗時 {elapsed:.2f} 秒（{total / elapsed:.0f} 筆/秒）")
+    print(f"記錄檔案: {path}，讀回 {len(records)} 筆")
+    if problems:
+        print(f"完整性檢查失敗，共 {len(problems)} 個問題:")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("完整性檢查通過：沒有遺失、重複、交錯或截斷的記錄")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import deque
+
+# 危險事件的標註圖片名稱記錄在此檔案（每行一個），重新啟動後仍可區分
+_DANGEROUS_LOG = '.dangerous_images'
+
+
+class RetentionManager:
+    def __init__(self, directory, max_mb=0, max_age_days=0, dangerous_max_age_days=None,
+                 rescan_interval=3600, extensions=('.jpg', '.jpeg', '.png')):
+        """
+        初始化標註圖片目錄的保留管理，超過總大小或保存天數時由最舊的圖片開始刪除
+
+        啟動時掃描目錄一次，之後由 track() 得知新寫入的圖片，不會在每次寫入時重新掃描；
+        每隔 rescan_interval 秒重新掃描一次，以反映其他行程或手動的變更
+
+        參數:
+            directory (str): 標註圖片目錄
+            max_mb (float): 目錄總大小上限（MB），0 表示不限制；超過時先刪除一般圖片，仍超過才刪除危險事件圖片
+            max_age_days (float): 一般圖片保存天數，0 表示不限制
+            dangerous_max_age_days (float, optional): 危險事件圖片保存天數，預設與一般圖片相同，0 表示不限制
+            rescan_interval (float): 重新掃描目錄的間隔秒數，0 表示只在啟動時掃描
+            extensions (tuple): 納入管理的副檔名
+        """
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.dangerous_max_age = (dangerous_max_age_days if dangerous_max_age_days is not None else max_age_days) * 86400
+        self.rescan_interval = rescan_interval
+        self.extensions = tuple(extensions)
+
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self._lock = threading.Lock()
+        self._dangerous_log = os.path.join(directory, _DANGEROUS_LOG)
+        self.scan()
+
+    @property
+    def enabled(self):
+        return bool(self.max_bytes or self.max_age or self.dangerous_max_age)
+
+    def scan(self):
+        """掃描目錄，重新建立依修改時間排序的佇列"""
+        dangerous_names = set()
+        if os.path.exists(self._dangerous_log):
+            with open(self._dangerous_log, 'r', encoding='utf-8') as file:
+                dangerous_names = {line.strip() for line in file if line.strip()}
+
+        entries = []
+        if os.path.isdir(self.directory):
+            with os.scandir(self.directory) as iterator:
+                for entry in iterator:
+                    if entry.is_file() and entry.name.lower().endswith(self.extensions):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+
+        with self._lock:
+            # 檔名 -> (修改時間, 大小, 是否危險)；佇列中與此不符的項目為過期項目，取出時略過
+            self._files = {}
+            self._queues = {False: deque(), True: deque()}
+            self._total_bytes = 0
+            for mtime, name, size in entries:
+                self._add(name, mtime, size, name in dangerous_names)
+            self._last_scan = time.monotonic()
+            live_dangerous = [name for name, (_, _, dangerous) in self._files.items() if dangerous]
+
+        # 移除已不存在圖片的危險事件紀錄
+        if len(live_dangerous) < len(dangerous_names):
+            tmp_path = f"{self._dangerous_log}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.writelines(f"{name}\n" for name in live_dangerous)
+            os.replace(tmp_path, self._dangerous_log)
+
+    def _add(self, name, mtime, size, dangerous):
+        previous = self._files.get(name)
+        if previous is not None:
+            self._total_bytes -= previous[1]
+        self._files[name] = (mtime, size, dangerous)
+        self._queues[dangerous].append((mtime, name))
+        self._total_bytes += size
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return self._total_bytes
+
+    def track(self, path, dangerous=False):
+        """
+        記錄一張剛寫入的標註圖片，並在需要時刪除過期或超出大小的圖片
+
+        參數:
+            path (str): 圖片路徑
+            dangerous (bool): 是否為危險事件的圖片
+        """
+        if not self.enabled:
+            return
+        if self.rescan_interval and time.monotonic() - self._last_scan > self.rescan_interval:
+            self.scan()
+
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        if dangerous:
+            with open(self._dangerous_log, 'a', encoding='utf-8') as file:
+                file.write(f"{name}\n")
+        with self._lock:
+            self._add(name, stat.st_mtime, stat.st_size, dangerous)
+        self.enforce()
+
+    def _peek_oldest(self, dangerous):
+        """查看指定類別中最舊且仍有效的項目（不移除），並丟棄前端的過期項目；沒有時回傳 None"""
+        queue = self._queues[dangerous]
+        while queue:
+            mtime, name = queue[0]
+            current = self._files.get(name)
+            if current is not None and current[0] == mtime and current[2] == dangerous:
+                return mtime, name
+            queue.popleft()
+        return None
+
+    def _evict(self, name):
+        mtime, size, dangerous = self._files.pop(name)
+        self._queues[dangerous].popleft()
+        self._total_bytes -= size
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            # 已被其他行程刪除
+            pass
+        self.evicted += 1
+        self.evicted_bytes += size
+
+    def enforce(self, now=None):
+        """
+        依保存天數與總大小刪除圖片，每次只檢查佇列最前端，成本與刪除數量成正比
+
+        回傳:
+            int: 刪除的圖片數
+        """
+        now = time.time() if now is None else now
+        evicted = 0
+        with self._lock:
+            for dangerous, max_age in ((False, self.max_age), (True, self.dangerous_max_age)):
+                while max_age:
+                    oldest = self._peek_oldest(dangerous)
+                    if oldest is None or now - oldest[0] <= max_age:
+                        break
+                    self._evict(oldest[1])
+                    evicted += 1
+
+            # 超過總大小時先刪除一般圖片，仍超過才刪除危險事件圖片
+            for dangerous in (False, True):
+                while self.max_bytes and self._total_bytes > self.max_bytes:
+                    oldest = self._peek_oldest(dangerous)
+                    if oldest is None:
+                        break
+                    self._evict(oldest[1])
+                    evicted += 1
+        return evicted
+
+    def summary(self):
+        """回傳保留管理統計摘要字串"""
+        with self._lock:
+            kept = len(self._files)
+            total = self._total_bytes
+        return (f"標註圖片保留管理: 目前 {kept} 張（{total / 1024 / 1024:.1f} MB）, "
+                f"已刪除 {self.evicted} 張（{self.evicted_bytes / 1024 / 1024:.1f} MB）")
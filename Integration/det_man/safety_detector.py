@@ -1,18 +1,62 @@
-import torch
 from PIL import Image
+import hashlib
+import io
 import os
+from annotation_writer import AnnotationWriter
+from inference_backends import create_backend, backend_model_version
+from frame_dedup import FrameDeduplicator
+from detection_cache import DetectionCache
+from retention_manager import RetentionManager
 
 class SafetyDetector:
-    def __init__(self, model_path='./model/best.pt', save_dir='./detection_results'):
+    def __init__(self, model_path='./model/best.pt', save_dir='./detection_results', registry=None,
+                 annotation_mode='full', jpeg_quality=85, max_annotation_size=0, thumbnail_size=320,
+                 annotation_workers=2, backend='torch-hub', export_path=None, dedup_distance=-1, dedup_capacity=64,
+                 cache_path=None, cache_max_mb=512, retention_max_mb=0, retention_days=0,
+                 retention_dangerous_days=None):
         """
         初始化安全帽檢測器
         
         參數:
             model_path (str): YOLO模型路徑
             save_dir (str): 檢測結果保存目錄
+            registry (ModelRegistry, optional): 模型登記表，預設使用行程內共用的登記表
+            annotation_mode (str): 標註圖片輸出模式 - 'off'、'dangerous'、'thumbnail' 或 'full'
+            jpeg_quality (int): 標註圖片的 JPEG 壓縮品質
+            max_annotation_size (int): 標註圖片最長邊的上限，0 表示不限制
+            thumbnail_size (int): 縮圖模式下標註圖片最長邊的長度
+            annotation_workers (int): 背景輸出標註圖片的執行緒數量
+            backend (str): 推論後端 - 'torch-hub'、'torch-local'（離線載入）、'torchscript' 或 'onnxruntime'
+            export_path (str, optional): TorchScript / ONNX 匯出模型路徑，預設由 model_path 推得
+            dedup_distance (int): 近似畫面過濾的漢明距離門檻，-1 表示停用
+            dedup_capacity (int): 近似畫面過濾在每個來源保留的最近畫面數量
+            cache_path (str, optional): 檢測結果快取的 SQLite 路徑，設定後相同內容的圖片不再重新推論
+            cache_max_mb (float): 檢測結果快取的大小上限（MB）
+            retention_max_mb (float): 標註圖片目錄的總大小上限（MB），0 表示不限制
+            retention_days (float): 一般標註圖片的保存天數，0 表示不限制
+            retention_dangerous_days (float, optional): 危險事件標註圖片的保存天數，預設與一般圖片相同
         """
         self.model_path = model_path
         self.save_dir = save_dir
+        self.backend = create_backend(backend, model_path, export_path=export_path, registry=registry)
+        self.deduplicator = FrameDeduplicator(dedup_distance, dedup_capacity) if dedup_distance >= 0 else None
+        self.cache = DetectionCache(cache_path, cache_max_mb) if cache_path else None
+        retention = None
+        if retention_max_mb or retention_days or retention_dangerous_days:
+            retention = RetentionManager(save_dir, max_mb=retention_max_mb, max_age_days=retention_days,
+                                         dangerous_max_age_days=retention_dangerous_days)
+        self.annotation_writer = AnnotationWriter(
+            save_dir,
+            mode=annotation_mode,
+            jpeg_quality=jpeg_quality,
+            max_size=max_annotation_size,
+            thumbnail_size=thumbnail_size,
+            workers=annotation_workers,
+            retention=retention
+        )
+        
+        # 載入模型（同一個權重檔在行程內只載入一次）並進行暖機推論
+        self.backend.warm_up()
         
         # 檢查並確保保存目錄存在
         if not os.path.exists(save_dir):
@@ -21,69 +65,293 @@ class SafetyDetector:
         else:
             print(f"使用已存在的檢測結果目錄: {save_dir}")
     
-    def detect_objects(self, image_path):
+    @property
+    def model_version(self):
+        """目前使用的權重檔雜湊值（含後端名稱，不同後端的結果視為不同版本）"""
+        return backend_model_version(self.backend.name, self.backend.weights_hash)
+    
+    @property
+    def inference_params(self):
+        """會影響檢測結果的推論參數，作為快取鍵的一部分"""
+        return {
+            'backend': self.backend.name,
+            'conf': getattr(self.backend, 'conf_thres', 0.25),
+            'iou': getattr(self.backend, 'iou_thres', 0.45)
+        }
+    
+    def reload_model_if_changed(self):
         """
-        使用YOLO模型檢測圖片中的物件
+        檢查 best.pt 是否在磁碟上被更新，若有則重新載入並暖機；
+        近似畫面過濾中舊模型的結果一併清除（檢測結果快取的鍵包含模型版本，不需清除）
+        
+        回傳:
+            bool: 是否重新載入了模型
+        """
+        reloaded = self.backend.reload_if_changed()
+        if reloaded:
+            self.backend.warm_up()
+            if self.deduplicator is not None:
+                self.deduplicator.clear()
+        return reloaded
+    
+    def load_image(self, image_path):
+        """
+        載入並解碼圖片，解碼失敗時會拋出例外
         
         參數:
-            image_path (str): 要檢測的圖片路徑
+            image_path (str): 圖片路徑
         
         回傳:
-            detections: 包含檢測詳細資訊的DataFrame
-            safety_status: 字典，包含檢測結果的安全狀態
+            PIL.Image: 已解碼的圖片
         """
-        # 載入模型
-        model = torch.hub.load('ultralytics/yolov5', 'custom', path=self.model_path)
-        
-        # 載入圖片
         image = Image.open(image_path)
+        image.load()
+        return image
+    
+    def prepare_image(self, image_path):
+        """
+        讀取圖片並查詢檢測結果快取；快取命中且不需要輸出標註圖片時不會解碼
         
-        # 進行物件檢測
-        results = model(image)
+        參數:
+            image_path (str): 圖片路徑
         
-        # 保存檢測結果圖片，使用覆蓋模式
-        results.save(save_dir=self.save_dir, exist_ok=True)  # 允許覆蓋已存在的檔案
+        回傳:
+            tuple: (已解碼的圖片或 None, 內容雜湊或 None, 快取的檢測結果或 None)
+        """
+        with open(image_path, 'rb') as file:
+            data = file.read()
+        
+        if self.cache is None:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            return image, None, None
         
-        # 獲取檢測詳細結果
-        detections = results.pandas().xyxy[0]
+        content_hash = hashlib.sha256(data).hexdigest()
+        detections = self.cache.get(DetectionCache.make_key(content_hash, self.model_version, self.inference_params))
+        if detections is not None:
+            # 只從快取的檢測框重新推導安全狀態
+            safety_status = self.analyze_safety(os.path.basename(image_path), detections)
+            if not self.should_annotate(safety_status):
+                return None, content_hash, detections
         
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image, content_hash, detections
+    
+    def remember_detections(self, content_hash, detections):
+        """
+        將新推論的檢測結果寫入快取；只能傳入實際推論的結果，
+        沿用近似畫面的結果不屬於這張圖片的內容，寫入快取會在停用近似畫面過濾後仍被沿用
+        """
+        if self.cache is not None and content_hash is not None:
+            self.cache.put(DetectionCache.make_key(content_hash, self.model_version, self.inference_params), detections)
+    
+    def infer_images(self, images, groups=None, report_reused=False):
+        """
+        對已解碼的圖片進行一次前向運算；啟用近似畫面過濾時，
+        與同一來源最近畫面幾乎相同的圖片直接沿用先前結果，同一批次中彼此近似的圖片只推論一張代表
+        
+        參數:
+            images (list): 已解碼的圖片列表
+            groups (list, optional): 每張圖片所屬的攝影機或資料夾，用於近似畫面過濾
+            report_reused (bool): 是否一併回傳哪些結果是沿用近似畫面而非實際推論
+        
+        回傳:
+            list: 每張圖片的 DetectionRecord，順序與輸入相同；
+                report_reused 為 True 時回傳 (結果列表, 是否沿用列表)
+        """
+        if self.deduplicator is None:
+            outputs = self.backend.infer(images)
+            return (outputs, [False] * len(outputs)) if report_reused else outputs
+        
+        groups = groups or [''] * len(images)
+        hashes = [self.deduplicator.hash(image) for image in images]
+        outputs, owners = self.deduplicator.lookup_batch(groups, hashes)
+        
+        representatives = [index for index, owner in enumerate(owners) if owner == index]
+        if representatives:
+            for index, detections in zip(representatives, self.backend.infer([images[i] for i in representatives])):
+                outputs[index] = detections
+                self.deduplicator.remember(groups[index], hashes[index], detections)
+        # 同一批次的近似畫面沿用代表畫面的結果
+        for index, owner in enumerate(owners):
+            if owner is not None and owner != index:
+                outputs[index] = outputs[owner]
+        if report_reused:
+            return outputs, [owner != index for index, owner in enumerate(owners)]
+        return outputs
+    
+    def should_annotate(self, safety_status):
+        """依標註輸出模式判斷此圖片是否需要輸出標註圖片"""
+        return self.annotation_writer.should_write(safety_status)
+    
+    def save_annotated(self, image, detections, safety_status):
+        """
+        在目前的執行緒繪製並保存單張圖片的標註檢測結果，使用覆蓋模式
+        
+        參數:
+            image: 原始圖片
+            detections (DetectionRecord): 檢測結果
+            safety_status (dict): 安全狀態
+        """
+        return self.annotation_writer.write(image, detections, safety_status)
+    
+    def submit_annotated(self, image, detections, safety_status, block=True):
+        """
+        交給背景執行緒繪製並保存標註圖片；尚未寫出的圖片達到上限時，block 為 True 則等待，否則略過此圖片
+        """
+        return self.annotation_writer.submit(image, detections, safety_status, block=block)
+    
+    def close(self):
+        """等待背景輸出的標註圖片全部寫入完成，並關閉檢測結果快取"""
+        self.annotation_writer.close()
+        if self.cache is not None:
+            self.cache.close()
+    
+    def analyze_safety(self, file_name, detections):
+        """
+        根據檢測結果分析安全狀態
+        
+        參數:
+            file_name (str): 圖片檔案名稱
+            detections (DetectionRecord): 檢測結果
+        
+        回傳:
+            safety_status: 字典，包含檢測結果的安全狀態
+        """
         # 分析安全狀態 - 新增事件原因欄位
         safety_status = {
-            'file_name': os.path.basename(image_path),
+            'file_name': file_name,
             'has_person': False,
             'event_type': '一般',
             'event_reason': ''
         }
         
-        # 檢查是否有人員
-        for _, detection in detections.iterrows():
-            if detection['name'] == 'person':
-                safety_status['has_person'] = True
-                break
+        # 檢查是否有人員（以類別遮罩向量化判斷）
+        safety_status['has_person'] = detections.has_class('person')
         
         # 修改後的判斷邏輯：只要有人就標記為危險事件，並加入事件原因
         if safety_status['has_person']:
             safety_status['event_type'] = '危險'
             safety_status['event_reason'] = '未戴安全帽'
         
+        return safety_status
+    
+    @staticmethod
+    def error_status(file_name, message):
+        """
+        建立處理失敗圖片的安全狀態
+        
+        參數:
+            file_name (str): 圖片檔案名稱
+            message (str): 錯誤訊息
+        
+        回傳:
+            safety_status: 字典，event_type 為 None 並含有 'error' 欄位
+        """
+        return {
+            'file_name': file_name,
+            'has_person': False,
+            'event_type': None,
+            'event_reason': '',
+            'error': message
+        }
+    
+    def detect_objects(self, image_path):
+        """
+        使用YOLO模型檢測圖片中的物件
+        
+        參數:
+            image_path (str): 要檢測的圖片路徑
+        
+        回傳:
+            detections (DetectionRecord): 檢測結果，需要 DataFrame 時可呼叫 to_dataframe()
+            safety_status: 字典，包含檢測結果的安全狀態
+        """
+        # 載入圖片；快取命中時直接使用快取的檢測框
+        image, content_hash, detections = self.prepare_image(image_path)
+        
+        # 進行物件檢測，獲取檢測詳細結果
+        if detections is None:
+            results, reused = self.infer_images([image], groups=[os.path.dirname(image_path)], report_reused=True)
+            detections = results[0]
+            if not reused[0]:
+                self.remember_detections(content_hash, detections)
+        safety_status = self.analyze_safety(os.path.basename(image_path), detections)
+        
+        # 標註圖片在背景執行緒輸出，依模式略過不需要的圖片
+        self.submit_annotated(image, detections, safety_status)
+        
         return detections, safety_status
     
-    def print_detection_results(self, detections):
+    def detect_batch(self, image_paths, batch_size=8):
+        """
+        批次檢測多張圖片，每個批次以一次前向運算完成
+        
+        參數:
+            image_paths (list): 要檢測的圖片路徑列表
+            batch_size (int): 每次送入模型的圖片數量
+        
+        回傳:
+            list: 與輸入順序相同的 (detections, safety_status) 列表；
+                解碼失敗的圖片 detections 為 None，safety_status 含有 'error' 欄位
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size 必須大於 0")
+        
+        outputs = [None] * len(image_paths)
+        
+        for start in range(0, len(image_paths), batch_size):
+            prepared = []
+            
+            # 解碼失敗的圖片不影響同批次的其他圖片
+            for index in range(start, min(start + batch_size, len(image_paths))):
+                image_path = image_paths[index]
+                try:
+                    prepared.append((index, *self.prepare_image(image_path)))
+                except Exception as e:
+                    outputs[index] = (None, self.error_status(os.path.basename(image_path), f"圖片解碼失敗: {e}"))
+            
+            # 快取未命中的圖片整批一次進行物件檢測
+            misses = [item for item in prepared if item[3] is None]
+            if misses:
+                results, reused = self.infer_images(
+                    [image for _, image, _, _ in misses],
+                    groups=[os.path.dirname(image_paths[index]) for index, _, _, _ in misses],
+                    report_reused=True
+                )
+                detections_by_index = {}
+                for (index, _, content_hash, _), detections, was_reused in zip(misses, results, reused):
+                    if not was_reused:
+                        self.remember_detections(content_hash, detections)
+                    detections_by_index[index] = detections
+                prepared = [
+                    (index, image, content_hash, detections if detections is not None else detections_by_index[index])
+                    for index, image, content_hash, detections in prepared
+                ]
+            
+            for index, image, _, detections in prepared:
+                file_name = os.path.basename(image_paths[index])
+                safety_status = self.analyze_safety(file_name, detections)
+                
+                # 標註圖片在背景執行緒輸出，依模式略過不需要的圖片
+                self.submit_annotated(image, detections, safety_status)
+                outputs[index] = (detections, safety_status)
+        
+        return outputs
+    
+    @staticmethod
+    def print_detection_results(detections):
         """
         列印檢測結果的統計資訊
         
         參數:
-            detections: 檢測結果DataFrame
+            detections (DetectionRecord): 檢測結果
         """
         print(f"總共檢測到 {len(detections)} 個物件")
         
         # 顯示每個檢測物件的類別
-        class_counts = {}
-        for _, detection in detections.iterrows():
-            class_name = detection['name']
-            class_counts[class_name] = class_counts.get(class_name, 0) + 1
-        
-        for class_name, count in class_counts.items():
+        for class_name, count in detections.class_counts().items():
             print(f"檢測到 {count} 個 {class_name}")
 
 
@@ -106,4 +374,7 @@ if __name__ == "__main__":
     print(f"檢測到人員: {'是' if safety_status['has_person'] else '否'}")
     print(f"事件類型: {safety_status['event_type']}")
     if safety_status['event_type'] == '危險':
-        print(f"事件原因: {safety_status['event_reason']}")
\ No newline at end of file
+        print(f"事件原因: {safety_status['event_reason']}")
+    
+    # 等待標註圖片寫入完成
+    detector.close()
\ No newline at end of file
@@ -1,26 +1,29 @@
-from datetime import datetime
-import os
-import csv
+from datetime import datetime, timedelta
+
 import pandas as pd
 
+from record_store import CsvRecordStore
+from record_archive import roll_hot_log
+from record_aggregates import camera_of
+
 class SafetyImageManager:
-    def __init__(self, csv_path='safety_records.csv'):
+    def __init__(self, csv_path='safety_records.csv', store=None, archive=None, aggregates=None):
         """
         初始化安全圖像管理器
         
         參數:
-            csv_path (str): CSV記錄檔案的路徑
+            csv_path (str): CSV記錄檔案的路徑（未指定 store 時使用）
+            store (optional): 記錄儲存後端，例如 record_store.SqliteRecordStore，預設為 CSV
+            archive (record_archive.RecordArchive, optional): Parquet 歸檔層，設定後查詢同時涵蓋熱記錄與歸檔
+            aggregates (record_aggregates.RecordAggregates, optional): 寫入時同步更新的危險事件統計
         """
         self.images = {}
         self.csv_path = csv_path
-        
-        # 創建CSV並添加標題行
-        if not os.path.exists(csv_path):
-            with open(csv_path, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['檔案名稱', '時間戳記', '事件類型', '事件原因'])
+        self.store = store if store is not None else CsvRecordStore(csv_path)
+        self.archive = archive
+        self.aggregates = aggregates
     
-    def add_safety_record(self, file_name, safety_status, timestamp=None):
+    def add_safety_record(self, file_name, safety_status, timestamp=None, source=None):
         """
         新增安全記錄，只儲存危險事件
         
@@ -28,6 +31,7 @@ class SafetyImageManager:
             file_name (str): 圖片檔案名稱
             safety_status (dict): 安全狀態資訊，包含 event_type 和 event_reason
             timestamp (str, optional): 時間戳記，如果未提供，則使用當前時間
+            source (str, optional): 圖片所在資料夾或影片來源名稱，危險事件統計依此區分攝影機
         """
         if timestamp is None:
             timestamp = datetime.now().isoformat()
@@ -40,15 +44,10 @@ class SafetyImageManager:
                 'event_reason': safety_status['event_reason']
             }
             
-            # 危險事件寫入CSV
-            with open(self.csv_path, 'a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    file_name,
-                    timestamp,
-                    safety_status['event_type'],
-                    safety_status['event_reason']
-                ])
+            # 危險事件寫入儲存後端
+            self.store.append(file_name, timestamp, safety_status['event_type'], safety_status['event_reason'])
+            if self.aggregates is not None:
+                self.aggregates.add(timestamp, safety_status['event_reason'], camera_of(file_name, source))
             
             print(f"危險影像 '{file_name}' 已記錄, 儲存時間：{timestamp}, 事件原因：{safety_status['event_reason']}。")
         else:
@@ -60,51 +59,109 @@ class SafetyImageManager:
         for file_name, details in self.images.items():
             print(f"影像名稱：{file_name}, 儲存時間：{details['timestamp']}, 事件原因：{details['event_reason']}")
 
-    def display_all_records(self):
-        """顯示所有安全記錄"""
-        if os.path.exists(self.csv_path):
-            df = pd.read_csv(self.csv_path)
-            print(f"共有 {len(df)} 筆危險事件記錄")
-            print(df)
+    def query_records(self, start=None, end=None, event_type=None, reason=None, file_name=None, limit=None, offset=0):
+        """
+        查詢安全記錄，條件交由儲存後端處理（SQLite 後端使用索引）
+        
+        參數:
+            start (str 或 date, optional): 起始時間（含）
+            end (str 或 date, optional): 結束時間（不含）
+            event_type (str, optional): 事件類型
+            reason (str, optional): 事件原因
+            file_name (str, optional): 檔案名稱
+            limit (int, optional): 每頁筆數
+            offset (int): 略過前幾筆
+        
+        回傳:
+            pandas.DataFrame: 欄位為 檔案名稱、時間戳記、事件類型、事件原因
+        """
+        if self.archive is None:
+            return self.store.query(start=start, end=end, event_type=event_type, reason=reason,
+                                    file_name=file_name, limit=limit, offset=offset)
+        
+        # 兩層各取前 offset+limit 筆，合併依時間排序後再分頁
+        window = offset + limit if limit is not None else None
+        conditions = {'start': start, 'end': end, 'event_type': event_type, 'reason': reason, 'file_name': file_name}
+        archived = self.archive.query(limit=window, **conditions)
+        hot = self.store.query(limit=window, **conditions)
+        df = pd.concat([archived, hot], ignore_index=True) if len(archived) else hot
+        df = df.sort_values('時間戳記', kind='stable')
+        stop = offset + limit if limit is not None else None
+        return df.iloc[offset:stop].reset_index(drop=True)
+    
+    def count_records(self):
+        """熱記錄與歸檔的記錄總數"""
+        return self.store.count() + (self.archive.count() if self.archive is not None else 0)
+    
+    def roll_to_archive(self, before=None):
+        """
+        將早於 before 的熱記錄移入歸檔層
+        
+        參數:
+            before (str 或 date, optional): 時間界線，預設為今天零時
+        
+        回傳:
+            int: 移入歸檔的記錄數
+        """
+        if self.archive is None:
+            raise ValueError("尚未設定歸檔層")
+        return roll_hot_log(self.store, self.archive, before)
+    
+    def export_csv(self, csv_path):
+        """將所有安全記錄（含歸檔）匯出為 CSV 檔案，供 LLM 端讀取"""
+        if self.archive is None:
+            self.store.export_csv(csv_path)
+        else:
+            self.query_records().to_csv(csv_path, index=False, encoding='utf-8')
+    
+    def display_all_records(self, limit=None, offset=0):
+        """
+        顯示所有安全記錄
+        
+        參數:
+            limit (int, optional): 每頁筆數，未指定時顯示全部
+            offset (int): 略過前幾筆
+        """
+        total = self.count_records()
+        if total:
+            print(f"共有 {total} 筆危險事件記錄")
+            print(self.query_records(limit=limit, offset=offset))
         else:
             print("尚無安全記錄")
     
-    def filter_by_date(self, date_str):
+    def filter_by_date(self, date_str, end_date_str=None, limit=None, offset=0):
         """
         根據日期過濾安全記錄
         
         參數:
             date_str (str): 日期字串，格式為 YYYY-MM-DD
+            end_date_str (str, optional): 結束日期（含當天），未指定時回傳起始日期之後的所有記錄
+            limit (int, optional): 每頁筆數
+            offset (int): 略過前幾筆
         """
-        if os.path.exists(self.csv_path):
-            df = pd.read_csv(self.csv_path)
-            # 將時間戳記轉換為日期時間格式
-            df['日期'] = pd.to_datetime(df['時間戳記']).dt.date
-            filter_date = datetime.fromisoformat(date_str).date()
-            
-            # 過濾出指定日期之後的記錄
-            filtered_df = df[df['日期'] >= filter_date]
-            
-            print(f"在 {date_str} 之後的危險事件記錄:")
-            print(filtered_df)
+        start = datetime.fromisoformat(date_str).date()
+        end = datetime.fromisoformat(end_date_str).date() + timedelta(days=1) if end_date_str else None
+        filtered_df = self.query_records(start=start, end=end, limit=limit, offset=offset)
+        
+        if end_date_str:
+            print(f"在 {date_str} 到 {end_date_str} 之間的危險事件記錄:")
         else:
-            print("尚無安全記錄")
+            print(f"在 {date_str} 之後的危險事件記錄:")
+        print(filtered_df)
     
-    def filter_by_reason(self, reason):
+    def filter_by_reason(self, reason, limit=None, offset=0):
         """
         根據事件原因過濾安全記錄
         
         參數:
             reason (str): 事件原因
+            limit (int, optional): 每頁筆數
+            offset (int): 略過前幾筆
         """
-        if os.path.exists(self.csv_path):
-            df = pd.read_csv(self.csv_path)
-            filtered_df = df[df['事件原因'] == reason]
-            
-            print(f"事件原因為 '{reason}' 的記錄:")
-            print(filtered_df)
-        else:
-            print("尚無安全記錄")
+        filtered_df = self.query_records(reason=reason, limit=limit, offset=offset)
+        
+        print(f"事件原因為 '{reason}' 的記錄:")
+        print(filtered_df)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# 此處只匯入標準函式庫，子行程的匯入時間才能完整反映各後端的成本
+
+
+def measure_startup(backend, model_path, image_path=None):
+    """
+    在目前的行程中量測啟動時間：匯入、載入模型（含暖機）、第一張圖片的推論
+
+    參數:
+        backend (str): 推論後端
+        model_path (str): YOLO模型路徑
+        image_path (str, optional): 第一張推論的圖片，未指定時使用空白圖片
+
+    回傳:
+        dict: 各階段耗時（秒）
+    """
+    started = time.perf_counter()
+    import numpy as np
+    from PIL import Image
+    from inference_backends import create_backend
+    imported = time.perf_counter()
+
+    detector_backend = create_backend(backend, model_path)
+    detector_backend.warm_up()
+    loaded = time.perf_counter()
+
+    image = Image.open(image_path) if image_path else np.zeros((640, 640, 3), dtype=np.uint8)
+    detector_backend.infer([image])
+    first_frame = time.perf_counter()
+
+    return {
+        'import': imported - started,
+        'load': loaded - imported,
+        'first_inference': first_frame - loaded,
+        'total': first_frame - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較各推論後端從啟動到第一張圖片完成推論的時間")
+    parser.add_argument('--model', default='./model/best.pt', help="YOLO模型路徑")
+    parser.add_argument('--image', default=None, help="第一張推論的圖片")
+    parser.add_argument('--backends', nargs='+', default=['torch-hub', 'torch-local'],
+                        help="要比較的後端")
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # 子行程：量測後以 JSON 回報
+        print(json.dumps(measure_startup(args.child, args.model, args.image)))
+        return
+
+    from inference_backends import BACKENDS
+    unknown = [backend for backend in args.backends if backend not in BACKENDS]
+    if unknown:
+        parser.error(f"不支援的推論後端: {', '.join(unknown)}，可用後端: {', '.join(BACKENDS)}")
+
+    print("每個後端在獨立的新行程中量測，避免模組快取影響結果")
+    print(f"{'後端':<14}{'匯入':>10}{'載入模型':>10}{'首張推論':>10}{'總計':>10}")
+    for backend in args.backends:
+        command = [sys.executable, __file__, '--child', backend, '--model', args.model]
+        if args.image:
+            command += ['--image', args.image]
+        wall_started = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True)
+        wall = time.perf_counter() - wall_started
+        if completed.returncode != 0:
+            print(f"{backend:<14}執行失敗: {completed.stderr.strip().splitlines()[-1] if completed.stderr else ''}")
+            continue
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{backend:<14}{timings['import']:>10.2f}{timings['load']:>10.2f}"
+              f"{timings['first_inference']:>10.2f}{timings['total']:>10.2f}  (行程總耗時 {wall:.2f} 秒)")
+
+
+if __name__ == "__main__":
+    main()
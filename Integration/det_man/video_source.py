@@ -0,0 +1,144 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+
+class VideoFrame:
+    """從影片取樣的一個畫面"""
+
+    __slots__ = ('image', 'file_name', 'frame_index', 'timestamp')
+
+    def __init__(self, image, file_name, frame_index, timestamp):
+        """
+        參數:
+            image (np.ndarray): H×W×3 的 RGB 畫面
+            file_name (str): 記錄與標註圖片使用的名稱，例如 cam1_f000120.jpg
+            frame_index (int): 畫面在影片中的編號
+            timestamp (str): 畫面時間的 ISO 格式字串
+        """
+        self.image = image
+        self.file_name = file_name
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+
+
+class VideoFrameSource:
+    def __init__(self, source, sample_fps=1.0, motion_threshold=0.0, motion_size=64, start_time=None):
+        """
+        初始化影片來源，讀取本機影片檔或 RTSP 等串流，依取樣頻率與畫面變動量挑選要推論的畫面
+
+        參數:
+            source (str): 影片檔路徑或串流網址（例如 rtsp://...）
+            sample_fps (float): 每秒取樣幾個畫面
+            motion_threshold (float): 與上一個推論畫面的平均像素差（0-255）低於此值時略過，0 表示不過濾
+            motion_size (int): 計算畫面差異前將畫面縮小到的寬度
+            start_time (datetime, optional): 影片第一個畫面的時間；影片檔預設為檔案修改時間減去影片長度，
+                串流則使用讀取當下的時間
+        """
+        self.source = source
+        self.sample_fps = sample_fps
+        self.motion_threshold = motion_threshold
+        self.motion_size = motion_size
+        self.is_file = os.path.exists(source)
+        self.start_time = start_time
+        self.name = os.path.splitext(os.path.basename(source.rstrip('/')))[0] or 'stream'
+
+        self.sampled = 0
+        self.gated = 0
+        self.yielded = 0
+        self._reference = None
+
+    def _motion_signature(self, frame):
+        """縮小並轉為灰階，用於快速比較畫面差異"""
+        height, width = frame.shape[:2]
+        size = (self.motion_size, max(1, round(height * self.motion_size / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+    def _has_motion(self, frame):
+        """與上一個推論畫面比較，變動量足夠時更新參考畫面並回傳 True"""
+        if self.motion_threshold <= 0:
+            return True
+        signature = self._motion_signature(frame)
+        if self._reference is not None and np.abs(signature - self._reference).mean() < self.motion_threshold:
+            return False
+        self._reference = signature
+        return True
+
+    def _file_start_time(self, capture):
+        if self.start_time is not None:
+            return self.start_time
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0
+        frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        duration = frame_count / fps if fps > 0 else 0
+        return datetime.fromtimestamp(os.path.getmtime(self.source)) - timedelta(seconds=duration)
+
+    def frames(self, stop_event=None):
+        """
+        逐一產生通過取樣與變動過濾的畫面
+
+        參數:
+            stop_event (threading.Event, optional): 停止訊號
+
+        回傳:
+            generator: VideoFrame
+        """
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            raise IOError(f"無法開啟影片來源: {self.source}")
+
+        try:
+            fps = capture.get(cv2.CAP_PROP_FPS) or 0
+            start_time = self._file_start_time(capture) if self.is_file else None
+            # 影片檔依畫面編號取樣；串流的 FPS 常不可靠，改依實際時間取樣
+            step = max(1, round(fps / self.sample_fps)) if self.is_file and fps > 0 and self.sample_fps > 0 else None
+            interval = 1.0 / self.sample_fps if self.sample_fps > 0 else 0.0
+            last_sample = None
+            frame_index = -1
+
+            while stop_event is None or not stop_event.is_set():
+                # 先 grab 不解碼，只有取樣到的畫面才 retrieve 解碼
+                if not capture.grab():
+                    break
+                frame_index += 1
+
+                if step is not None:
+                    if frame_index % step:
+                        continue
+                else:
+                    now = time.monotonic()
+                    if last_sample is not None and now - last_sample < interval:
+                        continue
+                    last_sample = now
+
+                ok, frame = capture.retrieve()
+                if not ok:
+                    continue
+                self.sampled += 1
+
+                if not self._has_motion(frame):
+                    self.gated += 1
+                    continue
+
+                if start_time is not None:
+                    timestamp = start_time + timedelta(milliseconds=capture.get(cv2.CAP_PROP_POS_MSEC))
+                else:
+                    timestamp = datetime.now()
+
+                self.yielded += 1
+                yield VideoFrame(
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB),
+                    f"{self.name}_f{frame_index:06d}.jpg",
+                    frame_index,
+                    timestamp.isoformat()
+                )
+        finally:
+            capture.release()
+
+    def summary(self):
+        """回傳取樣統計摘要字串"""
+        return (f"影片 '{self.source}': 取樣 {self.sampled} 個畫面, 因畫面無變動略過 {self.gated} 個, "
+                f"送入推論 {self.yielded} 個")
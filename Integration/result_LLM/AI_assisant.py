@@ -1,11 +1,17 @@
 import json
 import os
+import threading
+import httpx
 import openai
 from dotenv import load_dotenv
+from sqlalchemy import create_engine
 from langchain_community.utilities import SQLDatabase
 from langchain_openai import ChatOpenAI
 from langchain.chains import LLMChain
 from langchain.prompts import ChatPromptTemplate
+from law_retriever import format_articles
+from laws_repository import LawsRepository
+from answer_cache import AnswerCache
 
 # 載入環境變數
 load_dotenv()
@@ -16,43 +22,129 @@ db_password = os.getenv("DB_PASSWORD")
 db_host = os.getenv("DB_HOST")
 db_name = os.getenv("DB_NAME")
 api_key = os.getenv("AKASH_API_KEY")
+base_url = "https://chatapi.akash.network/api/v1"
 
-# 初始化資料庫、LLM
-def init_db_and_llm():
-    # 檢查環境變數是否設置
-    if not all([db_user, db_password, db_host, db_name, api_key]):
-        print("錯誤：未設置完整的環境變數，請檢查.env檔案")
-        return None, None
+# 連線池大小，可由環境變數調整
+db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+http_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+
+# 法規檢索：每次提示詞只附上最相關的條文，並限制法規文字的字數
+law_top_k = int(os.getenv("LAW_TOP_K", "5"))
+law_prompt_budget = int(os.getenv("LAW_PROMPT_BUDGET", "3000"))
+law_index_path = os.getenv("LAW_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "laws_index.json"))
+# 法規只在 scraper.py 執行後才會變更，每隔這麼多秒才查詢一次版本
+laws_probe_interval = float(os.getenv("LAWS_PROBE_INTERVAL", "60"))
+
+# 回答快取：相同問題（正規化後）在法規與提示詞模板都未變更時直接回覆，不再呼叫 LLM
+answer_cache_size = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+answer_cache_ttl = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# 未設定時只保存在記憶體，重新啟動後清空
+answer_cache_path = os.getenv("ANSWER_CACHE_PATH") or None
+answer_cache = AnswerCache(max_entries=answer_cache_size, ttl_seconds=answer_cache_ttl, path=answer_cache_path)
+
+# 法規分析的提示詞；修改 SYSTEM_MESSAGE 或 PROMPT_TEMPLATE 時需遞增版本，使舊的快取回答失效
+PROMPT_TEMPLATE_VERSION = "1"
+
+SYSTEM_MESSAGE = """你是一個專業的工地安全法規顧問，能夠根據提供的法規資料回答問題。
+    請提供以下分析：
+    1. 違規事實：詳細說明違規情況
+    2. 違反法規：列出所有被違反的具體法規條文
+    3. 建議處理：根據法規提供改善建議
+    4. 可能影響：分析此違規對工地安全的潛在影響
+    """
+
+PROMPT_TEMPLATE = """
+    {system_message}
     
-    # 設置資料庫連接字串
-    database_url = f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}/{db_name}"
+    法規資料:
+    {laws_text}
     
-    # 初始化資料庫
-    try:
-        db = SQLDatabase.from_uri(database_url)
-    except Exception as e:
-        print(f"資料庫連接錯誤: {e}")
-        return None, None
+    使用者提問或描述的違規情況:
+    {user_text}
     
-    # 初始化 LLM
-    llm = ChatOpenAI(
-        temperature=0.7,
-        model="DeepSeek-R1",
-        openai_api_key=api_key,
-        base_url="https://chatapi.akash.network/api/v1"
-    )
+    請根據法規資料分析此情況是否違反相關法規，並提供詳細說明。如果使用者只是打招呼或提出與工地安全無關的問題，請回覆「您好，我是工地安全法規顧問，可以幫您分析工地安全相關法規問題。」
+    """
+
+# 行程內共用的資料庫引擎與 LLM 客戶端，只建立一次
+_db = None
+_llm = None
+_laws = None
+_init_lock = threading.Lock()
+
+# 共用的 HTTP 客戶端，保持連線（keep-alive）供所有 LLM 請求重複使用；httpx.Client 可跨執行緒使用
+http_client = httpx.Client(
+    limits=httpx.Limits(max_connections=http_max_connections, max_keepalive_connections=http_max_connections),
+    timeout=httpx.Timeout(120.0, connect=10.0)
+)
+
+# 初始化資料庫、LLM（只在第一次呼叫時建立，之後直接回傳共用的物件；失敗時下次呼叫會重試）
+def init_db_and_llm():
+    global _db, _llm, _laws
+    if _db is not None and _llm is not None:
+        return _db, _llm
     
-    return db, llm
+    with _init_lock:
+        if _db is not None and _llm is not None:
+            return _db, _llm
+        
+        # 檢查環境變數是否設置
+        if not all([db_user, db_password, db_host, db_name, api_key]):
+            print("錯誤：未設置完整的環境變數，請檢查.env檔案")
+            return None, None
+        
+        # 設置資料庫連接字串
+        database_url = f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}/{db_name}"
+        
+        # 初始化資料庫：固定大小的連線池，取用前先 ping，避免使用已被 MySQL 關閉的閒置連線
+        try:
+            engine = create_engine(
+                database_url,
+                pool_size=db_pool_size,
+                max_overflow=db_max_overflow,
+                pool_pre_ping=True,
+                pool_recycle=3600
+            )
+            # 只反射 laws 資料表，且不抽樣資料列
+            db = SQLDatabase(engine, include_tables=["laws"], sample_rows_in_table_info=0)
+        except Exception as e:
+            print(f"資料庫連接錯誤: {e}")
+            return None, None
+        
+        # 初始化 LLM，使用共用的 HTTP 客戶端
+        llm = ChatOpenAI(
+            temperature=0.7,
+            model="DeepSeek-R1",
+            openai_api_key=api_key,
+            base_url=base_url,
+            http_client=http_client
+        )
+        
+        # 法規存取層：條文與檢索索引常駐記憶體，只在法規版本變更時重新載入
+        _laws = LawsRepository(engine, index_path=law_index_path, probe_interval=laws_probe_interval)
+        _db, _llm = db, llm
+        return _db, _llm
+
+# 取得目前的法規快照
+def get_laws_snapshot():
+    if _laws is None:
+        raise RuntimeError("資料庫尚未初始化")
+    return _laws.snapshot()
 
 # 原有的 OpenAI 聊天函數
+_openai_client = None
+
 def general_chat(text):
-    akash.api_key = os.getenv("AKASH_API_KEY")
-    
-    # 初始化 OpenAI 客戶端，但指定 Akash 的基礎 URL
-    client = openai.OpenAI(
-        api_key=akash_api_key,
-        base_url="https://chatapi.akash.network/api/v1"
-    )
+    global _openai_client
+    
+    # 初始化 OpenAI 客戶端，但指定 Akash 的基礎 URL（共用 HTTP 客戶端，只建立一次）
+    if _openai_client is None:
+        _openai_client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=http_client
+        )
+    client = _openai_client
     
     # 建立聊天請求
     try:
@@ -70,57 +162,49 @@ def general_chat(text):
         return f"系統錯誤: {e}"
 
 # 工地安全法規分析函數
-def safety_analysis(text):
+def safety_analysis(text, event_reason=None):
     db, llm = init_db_and_llm()
     if not db or not llm:
         return "系統錯誤：無法連接資料庫或初始化AI模型。請確認環境設定正確。"
     
-    # 提取法規
+    # 提取法規：只取與問題（或 CSV 記錄的事件原因）最相關的條文，不再附上整部法規
     try:
-        laws_text = db.run("SELECT * FROM laws;")
+        query = f"{text} {event_reason}" if event_reason else text
+        snapshot = get_laws_snapshot()
     except Exception as e:
         print(f"資料庫查詢錯誤: {e}")
         return f"資料庫查詢錯誤: {e}"
     
-    # 分析使用者訊息，嘗試提取事件類型
-    system_message = """你是一個專業的工地安全法規顧問，能夠根據提供的法規資料回答問題。
-    請提供以下分析：
-    1. 違規事實：詳細說明違規情況
-    2. 違反法規：列出所有被違反的具體法規條文
-    3. 建議處理：根據法規提供改善建議
-    4. 可能影響：分析此違規對工地安全的潛在影響
-    """
-    
-    # 建立提示模板
-    template = """
-    {system_message}
-    
-    法規資料:
-    {laws_text}
-    
-    使用者提問或描述的違規情況:
-    {user_text}
+    # 相同問題在同一版法規與提示詞下直接回覆快取的回答
+    cache_key = AnswerCache.make_key(query, snapshot.version, PROMPT_TEMPLATE_VERSION)
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    請根據法規資料分析此情況是否違反相關法規，並提供詳細說明。如果使用者只是打招呼或提出與工地安全無關的問題，請回覆「您好，我是工地安全法規顧問，可以幫您分析工地安全相關法規問題。」
-    """
+    articles = snapshot.retriever.retrieve(query, top_k=law_top_k, max_chars=law_prompt_budget)
+    laws_text = format_articles(articles)
     
-    prompt = ChatPromptTemplate.from_template(template)
+    # 建立提示模板
+    prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
     chain = LLMChain(llm=llm, prompt=prompt)
     
-    # 獲取回應
+    # 獲取回應，只快取成功的回答
     try:
         response = chain.run(
-            system_message=system_message,
+            system_message=SYSTEM_MESSAGE,
             laws_text=laws_text,
             user_text=text
         )
-        return response
     except Exception as e:
         print(f"AI分析錯誤: {e}")
         return f"AI分析發生錯誤: {e}"
+    if response:
+        answer_cache.put(cache_key, response)
+    return response
 
 # 主要的聊天函數，只回覆工地安全法規相關問題
-def chat(text):
+# event_reason: 分析 CSV 危險事件記錄時傳入事件原因（例如「未戴安全帽」），一併用於檢索法規
+def chat(text, event_reason=None):
     # 判斷是否為工地安全相關問題
     safety_keywords = ["工地", "安全帽", "安全帶", "危險", "違規", "法規", "勞工", "高空作業", "意外", "事故", "職災", "營造", "工安"]
     
@@ -129,11 +213,18 @@ def chat(text):
     
     if is_safety_related:
         # 使用法規分析功能
-        return safety_analysis(text)
+        return safety_analysis(text, event_reason=event_reason)
     else:
         # 不回覆非工地安全相關問題
         return "您好，我是工地安全法規顧問，僅能回答工地安全與相關法規問題。請提出與工地安全、職業安全衛生法規相關的問題，我將為您提供專業分析。"
 
+# 行程啟動時即建立資料庫連線池與 LLM 客戶端，第一則訊息不需要等待初始化
+if init_db_and_llm()[0] is not None:
+    try:
+        get_laws_snapshot()
+    except Exception as e:
+        print(f"法規載入錯誤: {e}")
+
 # 測試用
 if __name__ == "__main__":
     test_text = "工地上有人未戴安全帽，這違反了哪些法規？"
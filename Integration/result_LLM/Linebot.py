@@ -1,9 +1,11 @@
-from flask import Flask, request
-from linebot import LineBotApi, WebhookHandler
-from linebot.models import TextSendMessage   # 載入 TextSendMessage 模組
-import json
-from AI_assisant import chat
+from flask import Flask, request, abort, jsonify
+from linebot import LineBotApi, WebhookParser
+from linebot.exceptions import InvalidSignatureError
+from linebot.models import MessageEvent, TextMessage, TextSendMessage   # 載入 TextSendMessage 模組
+from AI_assisant import chat, answer_cache
+from reply_worker import ReplyWorkerPool
 from dotenv import load_dotenv
+import hmac
 import os
 
 # 載入環境變數
@@ -15,24 +17,51 @@ app = Flask(__name__)
 CHANNEL_SECRET = os.getenv("CHANNEL_SECRET")
 CHANNEL_ACCESS_TOKEN = os.getenv("CHANNEL_ACCESS_TOKEN")
 
+# 背景產生回答的執行緒數與佇列上限；回覆權杖約一分鐘內有效，超過 REPLY_MAX_AGE 秒改用推播
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", "4"))
+REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", "100"))
+REPLY_MAX_AGE = float(os.getenv("REPLY_MAX_AGE", "50"))
+# /metrics 需要以 Authorization: Bearer <METRICS_TOKEN> 存取；未設定時不提供統計
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# LINE 客戶端與簽章驗證只建立一次
+line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
+parser = WebhookParser(CHANNEL_SECRET)
+
+workers = ReplyWorkerPool(
+    answer=chat,
+    reply=lambda token, text: line_bot_api.reply_message(token, TextSendMessage(text=text)),
+    push=lambda user_id, text: line_bot_api.push_message(user_id, TextSendMessage(text=text)),
+    workers=REPLY_WORKERS,
+    queue_size=REPLY_QUEUE_SIZE,
+    reply_max_age=REPLY_MAX_AGE
+)
+
 @app.route("/", methods=['POST'])
 def linebot():
     body = request.get_data(as_text=True)
-    json_data = json.loads(body)
-    print(json_data)
+    signature = request.headers.get('X-Line-Signature', '')
     try:
-        line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
-        handler = WebhookHandler(CHANNEL_SECRET)
-        signature = request.headers['X-Line-Signature']
-        handler.handle(body, signature)
-        tk = json_data['events'][0]['replyToken']         # 取得 reply token
-        msg = json_data['events'][0]['message']['text']   # 取得使用者發送的訊息
-        text_message = TextSendMessage(text = chat(msg))  # 設定回傳同樣的訊息
-        # text_message = TextSendMessage(text=msg)          # 設定回傳同樣的訊息
-
-        line_bot_api.reply_message(tk,text_message)       # 回傳訊息
-    except Exception as e:
-        print('error: ' + str(e))
+        events = parser.parse(body, signature)   # 驗證簽章並解析事件
+    except InvalidSignatureError:
+        print('error: 簽章驗證失敗')
+        abort(400)
+
+    # 只將文字訊息放入佇列，回答由背景執行緒產生並傳送，webhook 立即回應
+    for event in events:
+        if not isinstance(event, MessageEvent) or not isinstance(event.message, TextMessage):
+            continue
+        user_id = getattr(event.source, 'user_id', None)
+        workers.submit(event.reply_token, user_id, event.message.text, event_time=event.timestamp / 1000)
     return 'OK'
 
-app.run(port="5000")
+# 佇列深度、延遲與回答快取的統計，與 webhook 在同一個對外的服務上，因此需要權杖
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    if not METRICS_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        abort(401)
+    return jsonify(workers=workers.metrics(), answer_cache=answer_cache.metrics())
+
+app.run(port="5000", threaded=True)
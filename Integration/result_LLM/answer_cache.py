@@ -0,0 +1,172 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 繁簡轉換為選用套件；未安裝時使用下方常見字的對照表
+try:
+    from opencc import OpenCC
+    _to_traditional = OpenCC('s2t').convert
+except ImportError:
+    _to_traditional = None
+
+# 工地安全問題中常見的簡體字與繁體字對照（每兩字一組）
+_FALLBACK_PAIRS = (
+    "违違规規条條没沒带帶险險护護栏欄网網电電线線处處坠墜业業劳勞职職灾災营營设設备備关關"
+    "于於与與应應么麼样樣为為该該吗嗎从從发發现現时時问問题題这這个個们們对對还還罚罰员員则則"
+    "门門层層楼樓脚腳缆纜绳繩挂掛坏壞损損检檢"
+)
+_FALLBACK_TABLE = str.maketrans(_FALLBACK_PAIRS[0::2], _FALLBACK_PAIRS[1::2])
+
+
+def normalize_question(text):
+    """
+    正規化問題文字：全形半形統一（NFKC）、轉小寫、簡體轉繁體，並移除空白與標點符號
+
+    參數:
+        text (str): 使用者問題
+
+    回傳:
+        str: 正規化後的文字
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = _to_traditional(text) if _to_traditional is not None else text.translate(_FALLBACK_TABLE)
+    return ''.join(
+        char for char in text
+        if unicodedata.category(char)[0] not in ('P', 'S', 'Z', 'C')
+    )
+
+
+class AnswerCache:
+    def __init__(self, max_entries=512, ttl_seconds=86400, path=None, save_every=20):
+        """
+        LLM 回答的快取：最久未使用的項目優先淘汰（LRU），每個項目在 ttl_seconds 秒後失效
+
+        參數:
+            max_entries (int): 最多保存的回答數
+            ttl_seconds (float): 回答的有效秒數，0 表示不會過期
+            path (str, optional): 保存快取的 JSON 檔案，重新啟動後沿用；未指定時只保存在記憶體
+            save_every (int): 每新增幾個回答就寫回一次磁碟
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.path = path
+        self.save_every = max(1, save_every)
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._entries = OrderedDict()
+        self._dirty = 0
+        self._lock = threading.Lock()
+
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def make_key(question, laws_version, template_version):
+        """
+        組合快取鍵：正規化後的問題、法規版本與提示詞模板版本
+
+        參數:
+            question (str): 使用者問題（可包含事件原因）
+            laws_version: 法規快照的版本
+            template_version (str): 提示詞模板版本
+        """
+        raw = json.dumps([normalize_question(question), str(laws_version), template_version], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        取得快取的回答
+
+        回傳:
+            str: 回答；不存在或已過期時為 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            answer, expires_at = entry
+            if expires_at and expires_at < time.time():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key, answer):
+        """保存回答，超過容量時淘汰最久未使用的項目"""
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._entries[key] = (answer, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            self._dirty += 1
+            should_save = self.path and self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"回答快取 '{self.path}' 無法讀取，將重新建立: {e}")
+            return
+        now = time.time()
+        # 檔案中依最近使用的順序排列，略過已過期的項目
+        for key, answer, expires_at in entries[-self.max_entries:]:
+            if not expires_at or expires_at >= now:
+                self._entries[key] = (answer, expires_at)
+
+    def save(self):
+        """將快取寫回磁碟，先寫入暫存檔再取代"""
+        if not self.path:
+            return
+        with self._lock:
+            if self._dirty == 0 and os.path.exists(self.path):
+                return
+            entries = [[key, answer, expires_at] for key, (answer, expires_at) in self._entries.items()]
+            self._dirty = 0
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(entries, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def metrics(self):
+        """
+        回傳命中統計
+
+        回傳:
+            dict: hits、misses、hit_rate、expired、evicted、entries
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'entries': len(self._entries),
+            }
+
+    def summary(self):
+        """回傳命中統計摘要字串"""
+        m = self.metrics()
+        return (f"回答快取: 命中 {m['hits']} 次, 未命中 {m['misses']} 次 ({m['hit_rate'] * 100:.1f}% 命中), "
+                f"過期 {m['expired']} 筆, 淘汰 {m['evicted']} 筆, 目前 {m['entries']} 筆")
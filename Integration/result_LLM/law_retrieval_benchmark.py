@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+from law_retriever import LawRetriever, format_articles
+
+# 常見的 LINE 提問與 CSV 事件原因
+DEFAULT_QUESTIONS = [
+    "工地上有人未戴安全帽，這違反了哪些法規？",
+    "沒戴安全帽違反哪條?",
+    "高空作業未繫安全帶要怎麼處理？",
+    "安全帶損毀還能繼續使用嗎？",
+    "施工架的護欄高度有什麼規定？",
+    "開口部分沒有設置護欄或安全網",
+    "營造工地的電線絕緣破損",
+    "吊掛作業時有人站在吊物下方",
+]
+
+
+def count_tokens(text):
+    """計算提示詞的 token 數；沒有安裝 tiktoken 時以字數估計"""
+    try:
+        import tiktoken
+    except ImportError:
+        return len(text)
+    return len(tiktoken.get_encoding('cl100k_base').encode(text))
+
+
+def load_articles(laws_json=None):
+    """由 JSON 檔案（條文字典列表）或 .env 設定的資料庫讀取法規"""
+    if laws_json:
+        with open(laws_json, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    from sqlalchemy import create_engine, text
+
+    load_dotenv()
+    database_url = (f"mysql+mysqlconnector://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
+                    f"@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}")
+    with create_engine(database_url).connect() as conn:
+        rows = conn.execute(text(
+            "SELECT id, chapter, article_number, article_link, content FROM laws ORDER BY id"
+        )).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def call_llm(laws_text, question):
+    """以相同模型送出一次請求，回傳耗時（秒）"""
+    import openai
+
+    client = openai.OpenAI(api_key=os.getenv("AKASH_API_KEY"), base_url="https://chatapi.akash.network/api/v1")
+    started = time.perf_counter()
+    client.chat.completions.create(
+        model="DeepSeek-R1",
+        messages=[{"role": "user", "content": f"法規資料:\n{laws_text}\n\n使用者提問:\n{question}"}]
+    )
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較附上整部法規與只附上檢索結果時的提示詞大小與延遲")
+    parser.add_argument('--laws-json', default=None, help="法規條文 JSON 檔案，未指定時由資料庫讀取")
+    parser.add_argument('--questions', default=None, help="問題清單檔案（每行一題），未指定時使用內建問題")
+    parser.add_argument('--top-k', type=int, default=5, help="檢索的條文數")
+    parser.add_argument('--budget', type=int, default=3000, help="法規文字的字數上限")
+    parser.add_argument('--repeat', type=int, default=200, help="每個問題檢索的重複次數")
+    parser.add_argument('--call-llm', action='store_true', help="實際呼叫 LLM 比較回應時間（需要 AKASH_API_KEY）")
+    args = parser.parse_args()
+
+    load_dotenv()
+    articles = load_articles(args.laws_json)
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as file:
+            questions = [line.strip() for line in file if line.strip()]
+
+    started = time.perf_counter()
+    retriever = LawRetriever(articles)
+    build_time = time.perf_counter() - started
+
+    index_path = os.path.join(tempfile.mkdtemp(prefix='laws_index_'), 'laws_index.json')
+    retriever.save(index_path)
+    started = time.perf_counter()
+    LawRetriever.load(index_path)
+    load_time = time.perf_counter() - started
+
+    full_text = format_articles(articles)
+    full_tokens = count_tokens(full_text)
+    print(f"法規條文 {len(articles)} 條，整部法規 {len(full_text)} 字 / {full_tokens} tokens")
+    print(f"建立索引 {build_time * 1000:.1f} ms，讀取已保存索引 {load_time * 1000:.1f} ms "
+          f"（{os.path.getsize(index_path) / 1024:.0f} KB）")
+    print()
+    print(f"{'tokens':>8}{'節省':>8}{'檢索 µs':>10}  問題")
+
+    retrieved_tokens = []
+    for question in questions:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            selected = retriever.retrieve(question, top_k=args.top_k, max_chars=args.budget)
+            timings.append(time.perf_counter() - started)
+        tokens = count_tokens(format_articles(selected))
+        retrieved_tokens.append(tokens)
+        saving = 1 - tokens / full_tokens if full_tokens else 0.0
+        print(f"{tokens:>8}{saving:>8.0%}{statistics.median(timings) * 1e6:>10.0f}  {question}")
+
+    print()
+    print(f"平均每次提示詞的法規 tokens: 整部法規 {full_tokens}，檢索後 {statistics.mean(retrieved_tokens):.0f}")
+
+    if args.call_llm:
+        question = questions[0]
+        full_latency = call_llm(full_text, question)
+        retrieved_latency = call_llm(format_articles(
+            retriever.retrieve(question, top_k=args.top_k, max_chars=args.budget)), question)
+        print(f"LLM 回應時間（{question}）: 整部法規 {full_latency:.1f} 秒，檢索後 {retrieved_latency:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+
+# 中文以相鄰兩字為詞；英數字以連續字串為詞
+_CJK = re.compile(r'[㐀-鿿豈-﫿]+')
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    將文字切成 BM25 的詞：中文字元二元組（單字的片段保留單字），以及英文與數字字串
+
+    參數:
+        text (str): 文字
+
+    回傳:
+        list: 詞列表
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    tokens = []
+    for run in _CJK.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD.findall(text))
+    return tokens
+
+
+def laws_fingerprint(articles):
+    """法規內容的雜湊值，法規變更時索引需要重建"""
+    digest = hashlib.sha256()
+    for article in articles:
+        digest.update(json.dumps(
+            [article.get('id'), article.get('article_number'), article.get('content')], ensure_ascii=False
+        ).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LawRetriever:
+    def __init__(self, articles, k1=1.5, b=0.75):
+        """
+        以 BM25（中文字元二元組）檢索法規條文
+
+        參數:
+            articles (list): 法規條文，每筆為包含 id、chapter、article_number、article_link、content 的字典
+            k1 (float): BM25 詞頻飽和參數
+            b (float): BM25 文件長度正規化參數
+        """
+        self.articles = list(articles)
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = laws_fingerprint(self.articles)
+
+        # 詞 -> [(條文編號, 詞頻), ...]
+        self.postings = {}
+        self.lengths = []
+        for doc_id, article in enumerate(self.articles):
+            counts = Counter(tokenize(f"{article.get('chapter', '')} {article.get('content', '')}"))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+        self._prepare()
+
+    def _prepare(self):
+        count = len(self.articles)
+        self.average_length = sum(self.lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, top_k=5):
+        """
+        依 BM25 分數排序的相關條文
+
+        參數:
+            query (str): 使用者問題或事件原因
+            top_k (int): 回傳的條文數
+
+        回傳:
+            list: (分數, 條文) 列表，分數由高到低
+        """
+        scores = {}
+        average_length = self.average_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(score, self.articles[doc_id]) for doc_id, score in ranked]
+
+    def retrieve(self, query, top_k=5, max_chars=3000):
+        """
+        取得相關條文，總字數不超過提示詞的法規預算
+
+        參數:
+            query (str): 使用者問題或事件原因
+            top_k (int): 最多取幾條
+            max_chars (int): 法規文字的字數上限，0 表示不限制
+
+        回傳:
+            list: 條文字典列表，依相關程度排序
+        """
+        selected = []
+        used = 0
+        for _, article in self.search(query, top_k):
+            size = len(format_article(article))
+            if max_chars and used + size > max_chars:
+                # 第一條就超過預算時截斷內容，至少提供最相關的一條
+                if not selected:
+                    article = dict(article, content=article.get('content', '')[:max(0, max_chars - used - 40)])
+                    selected.append(article)
+                break
+            selected.append(article)
+            used += size
+        return selected
+
+    def save(self, path):
+        """將索引寫入 JSON 檔案，先寫入暫存檔再取代"""
+        data = {
+            'fingerprint': self.fingerprint,
+            'k1': self.k1,
+            'b': self.b,
+            'articles': self.articles,
+            'lengths': self.lengths,
+            'postings': self.postings,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """讀取 save() 寫入的索引，不重新切詞"""
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        retriever = cls.__new__(cls)
+        retriever.articles = data['articles']
+        retriever.k1 = data['k1']
+        retriever.b = data['b']
+        retriever.fingerprint = data['fingerprint']
+        retriever.lengths = data['lengths']
+        retriever.postings = {term: [tuple(entry) for entry in postings] for term, postings in data['postings'].items()}
+        retriever._prepare()
+        return retriever
+
+    @classmethod
+    def load_or_build(cls, articles, path):
+        """
+        讀取已保存的索引；不存在或法規內容已變更時重新建立並保存
+
+        參數:
+            articles (list): 目前的法規條文
+            path (str): 索引檔案路徑
+        """
+        if os.path.exists(path):
+            try:
+                retriever = cls.load(path)
+                if retriever.fingerprint == laws_fingerprint(articles):
+                    return retriever
+            except (OSError, ValueError, KeyError) as e:
+                print(f"法規索引 '{path}' 無法讀取，將重新建立: {e}")
+        retriever = cls(articles)
+        try:
+            retriever.save(path)
+        except OSError as e:
+            print(f"法規索引無法保存: {e}")
+        return retriever
+
+
+def format_article(article):
+    """將一條法規轉為提示詞中的文字"""
+    chapter = article.get('chapter') or ''
+    number = article.get('article_number') or ''
+    return f"【{chapter} {number}】\n{article.get('content', '')}".strip()
+
+
+def format_articles(articles):
+    """將多條法規轉為提示詞中的法規資料"""
+    return "\n\n".join(format_article(article) for article in articles)
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from sqlalchemy import text
+
+from law_retriever import LawRetriever
+
+
+class LawsSnapshot:
+    """某一版法規的唯讀快照：條文與對應的檢索索引，建立完成後不再修改"""
+
+    __slots__ = ('version', 'articles', 'retriever', 'loaded_at')
+
+    def __init__(self, version, articles, retriever):
+        self.version = version
+        self.articles = tuple(articles)
+        self.retriever = retriever
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self.articles)
+
+
+class LawsRepository:
+    def __init__(self, engine, index_path=None, probe_interval=60):
+        """
+        法規資料的存取層：將 laws 資料表一次載入記憶體，之後只以輕量的版本查詢判斷是否需要重新載入
+
+        版本優先讀取 insert_laws() 寫入的 laws_version；沒有版本列時改用條文數量與 CRC32 總和。
+        重新載入時先建立完整的新快照再一次替換參考，讀取端不會看到載入到一半的資料
+
+        參數:
+            engine (sqlalchemy.Engine): 資料庫引擎
+            index_path (str, optional): 檢索索引的保存路徑，未指定時不保存
+            probe_interval (float): 兩次版本查詢之間至少間隔的秒數
+        """
+        self.engine = engine
+        self.index_path = index_path
+        self.probe_interval = probe_interval
+        self.reloads = 0
+        self._snapshot = None
+        self._last_probe = 0.0
+        self._reload_lock = threading.Lock()
+
+    def probe_version(self):
+        """
+        查詢目前的法規版本
+
+        回傳:
+            tuple: 版本識別值，只用於比較是否相同
+        """
+        with self.engine.connect() as conn:
+            try:
+                row = conn.execute(text("SELECT version, updated_at FROM laws_version WHERE id = 1")).first()
+            except Exception:
+                # 尚未建立版本表（舊資料庫），改用數量與 CRC32 總和
+                conn.rollback()
+                row = None
+            if row is not None:
+                return ('version', row[0], str(row[1]))
+            count, checksum = conn.execute(text(
+                "SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT_WS('|', id, chapter, article_number, content))), 0) "
+                "FROM laws"
+            )).one()
+            return ('checksum', int(count), int(checksum))
+
+    def _load(self, version):
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, chapter, article_number, article_link, content FROM laws ORDER BY id"
+            )).mappings().all()
+        articles = [dict(row) for row in rows]
+        if self.index_path:
+            retriever = LawRetriever.load_or_build(articles, self.index_path)
+        else:
+            retriever = LawRetriever(articles)
+        return LawsSnapshot(version, articles, retriever)
+
+    def snapshot(self):
+        """
+        取得目前的法規快照；距離上次版本查詢超過 probe_interval 秒時查詢版本，變更時重新載入
+
+        其他執行緒正在重新載入時不等待，直接使用現有的快照
+
+        回傳:
+            LawsSnapshot: 法規快照
+        """
+        current = self._snapshot
+        if current is not None and time.monotonic() - self._last_probe < self.probe_interval:
+            return current
+
+        # 第一次載入必須等待；之後若已有執行緒在檢查，直接回傳舊快照
+        if not self._reload_lock.acquire(blocking=current is None):
+            return current
+        try:
+            current = self._snapshot
+            if current is not None and time.monotonic() - self._last_probe < self.probe_interval:
+                return current
+            try:
+                version = self.probe_version()
+            except Exception as e:
+                if current is None:
+                    raise
+                print(f"法規版本查詢錯誤，沿用目前的法規: {e}")
+                self._last_probe = time.monotonic()
+                return current
+
+            if current is None or version != current.version:
+                # 建立完整的新快照後才替換參考，讀取端看到的永遠是完整的一版
+                self._snapshot = self._load(version)
+                self.reloads += 1
+                if current is not None:
+                    print(f"法規已更新，重新載入 {len(self._snapshot)} 條條文")
+            self._last_probe = time.monotonic()
+            return self._snapshot
+        finally:
+            self._reload_lock.release()
+
+    def invalidate(self):
+        """下次取得快照時立即查詢版本"""
+        self._last_probe = 0.0
@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+from collections import deque
+
+
+class ReplyWorkerPool:
+    def __init__(self, answer, reply, push, workers=4, queue_size=100, reply_max_age=50,
+                 busy_message="目前提問人數較多，請稍後再試一次。"):
+        """
+        在背景執行緒產生回答並傳送，webhook 只需放入佇列即可立即回應
+
+        回覆權杖（reply token）有時效，事件等待超過 reply_max_age 秒或回覆失敗時改用推播（push）傳送
+
+        參數:
+            answer (callable): answer(text) -> str，產生回答
+            reply (callable): reply(reply_token, text)，以回覆權杖傳送
+            push (callable): push(user_id, text)，以推播傳送
+            workers (int): 工作執行緒數
+            queue_size (int): 佇列上限，已滿時拒絕新的事件
+            reply_max_age (float): 超過此秒數不再嘗試回覆權杖，直接推播
+            busy_message (str): 佇列已滿時以回覆權杖立即回覆的訊息
+        """
+        self.answer = answer
+        self.reply = reply
+        self.push = push
+        self.reply_max_age = reply_max_age
+        self.busy_message = busy_message
+        self.queue_size = max(1, queue_size)
+
+        self.submitted = 0
+        self.rejected = 0
+        self.busy_replied = 0
+        self.replied = 0
+        self.pushed = 0
+        self.failed = 0
+        self.max_depth = 0
+        # 最近的等待時間與總延遲（秒），用於計算百分位數
+        self._wait_times = deque(maxlen=1000)
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self.queue_size)
+
+        self._threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker, name=f"reply-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, reply_token, user_id, text, event_time=None):
+        """
+        放入一則待回答的訊息，不等待回答完成
+
+        參數:
+            reply_token (str): 回覆權杖
+            user_id (str): 使用者 ID，回覆權杖失效時用於推播；沒有時只能使用回覆權杖
+            text (str): 使用者訊息
+            event_time (float, optional): LINE 事件時間（epoch 秒），預設為現在
+
+        回傳:
+            bool: 是否已放入佇列；佇列已滿時為 False，並以回覆權杖告知使用者稍後再試
+        """
+        now = time.time()
+        item = (reply_token, user_id, text, event_time or now, now)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            print(f"回覆佇列已滿（{self.queue_size} 則），略過訊息: {text[:20]}")
+            self._reply_busy(reply_token)
+            return False
+        with self._lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def _reply_busy(self, reply_token):
+        """佇列已滿時立即以仍然有效的回覆權杖回覆忙碌訊息，使用者不會等不到回應"""
+        if not reply_token or not self.busy_message:
+            return
+        try:
+            self.reply(reply_token, self.busy_message)
+        except Exception as e:
+            print(f"忙碌訊息傳送失敗: {e}")
+            return
+        with self._lock:
+            self.busy_replied += 1
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            try:
+                self._process(*item)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, reply_token, user_id, text, event_time, queued_at):
+        started = time.time()
+        try:
+            message = self.answer(text)
+        except Exception as e:
+            print(f"回答產生錯誤: {e}")
+            message = f"系統錯誤: {e}"
+
+        delivered = self._deliver(reply_token, user_id, message, event_time)
+        finished = time.time()
+        with self._lock:
+            if delivered:
+                self._wait_times.append(started - queued_at)
+                self._latencies.append(finished - event_time)
+            else:
+                self.failed += 1
+
+    def _deliver(self, reply_token, user_id, message, event_time):
+        """先使用回覆權杖，過期或失敗時改用推播；回傳是否已傳送"""
+        if reply_token and time.time() - event_time < self.reply_max_age:
+            try:
+                self.reply(reply_token, message)
+                with self._lock:
+                    self.replied += 1
+                return True
+            except Exception as e:
+                print(f"回覆權杖傳送失敗，改用推播: {e}")
+
+        if not user_id:
+            print("回覆權杖已失效且沒有使用者 ID，無法傳送回答")
+            return False
+        try:
+            self.push(user_id, message)
+            with self._lock:
+                self.pushed += 1
+            return True
+        except Exception as e:
+            print(f"推播傳送失敗: {e}")
+            return False
+
+    @staticmethod
+    def _percentile(values, fraction):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def metrics(self):
+        """
+        回傳佇列與延遲統計
+
+        回傳:
+            dict: 佇列深度、各項計數，以及等待時間與總延遲（秒）的中位數與 p95
+        """
+        with self._lock:
+            wait_times = list(self._wait_times)
+            latencies = list(self._latencies)
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_max_depth': self.max_depth,
+                'queue_size': self.queue_size,
+                'workers': len(self._threads),
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'busy_replied': self.busy_replied,
+                'replied': self.replied,
+                'pushed': self.pushed,
+                'failed': self.failed,
+                'wait_p50': self._percentile(wait_times, 0.5),
+                'wait_p95': self._percentile(wait_times, 0.95),
+                'latency_p50': self._percentile(latencies, 0.5),
+                'latency_p95': self._percentile(latencies, 0.95),
+            }
+
+    def summary(self):
+        """回傳統計摘要字串"""
+        m = self.metrics()
+        return (f"回覆工作佇列: 目前 {m['queue_depth']} 則（最多 {m['queue_max_depth']}）, "
+                f"回覆 {m['replied']} 則, 推播 {m['pushed']} 則, 失敗 {m['failed']} 則, "
+                f"拒絕 {m['rejected']} 則（已回覆忙碌訊息 {m['busy_replied']} 則）, "
+                f"延遲中位數 {m['latency_p50']:.1f} 秒（p95 {m['latency_p95']:.1f} 秒）")
+
+    def close(self, timeout=None):
+        """處理完佇列中的訊息後停止工作執行緒"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
@@ -46,6 +46,19 @@ def insert_laws(laws_data):
             law['content']
         ))
 
+    # 遞增法規版本，讓 AI 助理得知法規已變更並重新載入
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS laws_version (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        INSERT INTO laws_version (id, version) VALUES (1, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """)
+
     conn.commit()
     conn.close()
 
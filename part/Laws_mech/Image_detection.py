@@ -1,6 +1,10 @@
-import torch
-from PIL import Image
 import os
+import sys
+from PIL import Image
+
+# 與 Integration/det_man 共用行程內的模型登記表，同一個權重檔只載入一次
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Integration', 'det_man'))
+from model_registry import get_shared_registry
 
 def detect_objects(image_path, model_path='./model/best.pt', save_dir='./ph_result'):
     """
@@ -15,14 +19,15 @@ def detect_objects(image_path, model_path='./model/best.pt', save_dir='./ph_resu
         results: YOLOv5檢測結果物件
         detections: 包含檢測詳細資訊的DataFrame
     """
-    # 加載您自訓練的模型
-    model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path)
+    # 取得您自訓練的模型（第一次呼叫時載入，之後共用同一個實例）
+    entry = get_shared_registry().get(model_path)
     
     # 加載影像檔案
     image = Image.open(image_path)
     
     # 進行推論（物件檢測）
-    results = model(image)
+    with entry.lock:
+        results = entry.model(image)
     
     # 創建保存目錄（如果不存在）
     os.makedirs(save_dir, exist_ok=True)